@@ -0,0 +1,311 @@
+"""
+Banc de performance de bout en bout de l'API des festivals.
+
+Le script génère un jeu de festivals synthétique dans une base SQLite temporaire,
+puis appelle chaque route des routers festivals et authentification en mémoire,
+flux de changements mis à part,
+(sans serveur HTTP) avec un client asynchrone concurrent. Il produit un rapport
+JSON (débit et percentiles de latence par scénario) et peut le comparer à un
+rapport de référence pour détecter une régression en intégration continue.
+
+Utilisation :
+    python -m benchmarks.bench_api --festivals 10000 --sortie bench.json
+    python -m benchmarks.bench_api --reference bench.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+os.environ.setdefault("TESTING", "True")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from festival_api.main import app
+from festival_api.database.db_core import Base, get_db
+from festival_api.database.db_ecriture import activer_ecriture_groupee, desactiver_ecriture_groupee
+from festival_api.database.periodes import jours_periode
+
+REGIONS = ["Bretagne", "Occitanie", "Île-de-France", "Grand Est", "Hauts-de-France", "Normandie"]
+DISCIPLINES = ["Musique", "Spectacle vivant", "Cinéma et audiovisuel", "Livre et littérature", "Arts visuels"]
+PERIODES = [("21 Juin - 5 Septembre", "Saison"), ("1er Janvier - 20 Juin", "Avant-saison"),
+            ("6 Septembre - 31 Décembre", "Après-saison")]
+TAILLE_LOT = 10000
+# Préfixes saisis dans la recherche instantanée, des plus courts (beaucoup de clés) aux plus précis
+PREFIXES = ["f", "fe", "c", "co", "dep", "festival 1", "commune 42", "departement 7"]
+
+
+def festival_synthetique(rng, i):
+    """
+    Construit le contenu JSON d'un festival synthétique.
+    """
+    periode, categorie_periode = rng.choice(PERIODES)
+    return {
+        "nom_festival": f"Festival {i}",
+        "annee_creation": rng.randint(1950, 2023),
+        "site_internet": f"https://festival-{i}.fr",
+        "adresse": {
+            "adresse_postale": f"{i} rue du Festival",
+            "code_insee": f"{rng.randint(1000, 95999):05d}",
+            "region": rng.choice(REGIONS),
+            "departement": f"Département {rng.randint(1, 95)}",
+            "commune": f"Commune {rng.randint(1, 5000)}",
+            "longitude": rng.uniform(-4.5, 8.0),
+            "latitude": rng.uniform(42.5, 51.0),
+        },
+        "categorie": {"discipline_dominante": rng.choice(DISCIPLINES), "sous_categorie": "Inconnu"},
+        "periode": {"periode": periode, "categorie_periode": categorie_periode},
+    }
+
+
+def peupler_base(engine, nb_festivals, graine=0):
+    """
+    Insère nb_festivals festivals synthétiques par lots avec executemany.
+    """
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(graine)
+    conn = engine.raw_connection()
+    cur = conn.cursor()
+    for debut in range(0, nb_festivals, TAILLE_LOT):
+        ids = range(debut + 1, min(debut + TAILLE_LOT, nb_festivals) + 1)
+        festivals = [festival_synthetique(rng, i) for i in ids]
+        cur.executemany(
+            "INSERT INTO adresse (id_adresse, adresse_postale, code_insee, region, departement, commune, longitude, latitude) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(i, *f["adresse"].values()) for i, f in zip(ids, festivals)])
+        cur.executemany(
+            "INSERT INTO categorie (id_categorie, discipline_dominante, sous_categorie) VALUES (?, ?, ?)",
+            [(i, *f["categorie"].values()) for i, f in zip(ids, festivals)])
+        cur.executemany(
+            "INSERT INTO periode (id_periode, periode, categorie_periode, jour_debut, jour_fin) VALUES (?, ?, ?, ?, ?)",
+            [(i, *f["periode"].values(), *jours_periode(f["periode"]["periode"])) for i, f in zip(ids, festivals)])
+        cur.executemany(
+            "INSERT INTO festival (id_festival, nom_festival, annee_creation, site_internet, id_adresse, id_categorie, id_periode) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(i, f["nom_festival"], f["annee_creation"], f["site_internet"], i, i, i) for i, f in zip(ids, festivals)])
+    conn.commit()
+    conn.close()
+
+
+def percentile(valeurs_triees, p):
+    if not valeurs_triees:
+        return None
+    index = min(len(valeurs_triees) - 1, int(round(p / 100 * (len(valeurs_triees) - 1))))
+    return valeurs_triees[index]
+
+
+async def executer_scenario(client, nb_requetes, concurrence, fabrique_requete):
+    """
+    Envoie nb_requetes requêtes avec au plus `concurrence` requêtes simultanées et mesure
+    la latence de chacune.
+
+    Args:
+        fabrique_requete: fonction (index) -> (méthode, url, kwargs httpx, statuts attendus).
+    """
+    semaphore = asyncio.Semaphore(concurrence)
+    latences = []
+    erreurs = 0
+
+    async def une_requete(i):
+        nonlocal erreurs
+        methode, url, kwargs, attendus = fabrique_requete(i)
+        async with semaphore:
+            debut = time.perf_counter()
+            reponse = await client.request(methode, url, **kwargs)
+            latences.append((time.perf_counter() - debut) * 1000)
+        if reponse.status_code not in attendus:
+            erreurs += 1
+
+    debut = time.perf_counter()
+    await asyncio.gather(*(une_requete(i) for i in range(nb_requetes)))
+    duree = time.perf_counter() - debut
+
+    latences.sort()
+    return {
+        "requetes": nb_requetes,
+        "erreurs": erreurs,
+        "duree_s": round(duree, 4),
+        "debit_rps": round(nb_requetes / duree, 1),
+        "latence_ms": {
+            "p50": round(percentile(latences, 50), 3),
+            "p90": round(percentile(latences, 90), 3),
+            "p95": round(percentile(latences, 95), 3),
+            "p99": round(percentile(latences, 99), 3),
+            "max": round(latences[-1], 3),
+        },
+    }
+
+
+def construire_scenarios(nb_festivals, rng, jeton, nb_requetes, nb_requetes_auth):
+    """
+    Décrit un scénario par route : (nom, nombre de requêtes, fabrique de requêtes).
+    Les routes qui hachent un mot de passe avec bcrypt utilisent moins de requêtes.
+    """
+    entetes = {"Authorization": f"Bearer {jeton}"}
+    # Les suppressions portent sur la fin de la plage d'identifiants pour ne pas gêner les lectures
+    a_supprimer = list(range(nb_festivals, max(0, nb_festivals - nb_requetes), -1))
+
+    def festival_id():
+        return rng.randint(1, max(1, nb_festivals - nb_requetes))
+
+    def zone():
+        # Une zone de la carte autour d'un point de France métropolitaine, plus petite quand le zoom augmente
+        zoom = rng.randint(3, 12)
+        demi_largeur = 360 / (1 << zoom)
+        longitude, latitude = rng.uniform(-4.5, 8.0), rng.uniform(42.5, 51.0)
+        return {"bbox": f"{longitude - demi_largeur},{latitude - demi_largeur / 2},"
+                        f"{longitude + demi_largeur},{latitude + demi_largeur / 2}", "zoom": zoom}
+
+    def semaine():
+        debut = date(2024, 1, 1) + timedelta(days=rng.randint(0, 358))
+        return {"from": debut.isoformat(), "to": (debut + timedelta(days=6)).isoformat()}
+
+    return [
+        ("GET /", nb_requetes, lambda i: ("GET", "/", {}, (200,))),
+        ("GET /festivals/{id}", nb_requetes,
+         lambda i: ("GET", f"/festivals/{festival_id()}", {}, (200,))),
+        ("GET /festivals/", nb_requetes, lambda i: ("GET", "/festivals/", {}, (200,))),
+        ("GET /festivals/happening", nb_requetes,
+         lambda i: ("GET", "/festivals/happening", {"params": semaine()}, (200,))),
+        ("GET /festivals/clusters", nb_requetes,
+         lambda i: ("GET", "/festivals/clusters", {"params": zone()}, (200,))),
+        ("GET /festivals/facets", nb_requetes,
+         lambda i: ("GET", "/festivals/facets",
+                    {"params": {"region": rng.choice(REGIONS)} if i % 2 else {}}, (200,))),
+        ("GET /festivals/autocomplete", nb_requetes,
+         lambda i: ("GET", "/festivals/autocomplete", {"params": {"prefix": rng.choice(PREFIXES)}}, (200,))),
+        ("POST /festivals/lookup", nb_requetes,
+         lambda i: ("POST", "/festivals/lookup", {"json": {"ids": [festival_id() for _ in range(50)]}}, (200,))),
+        ("GET /festivals/{id}/similar", nb_requetes,
+         lambda i: ("GET", f"/festivals/{festival_id()}/similar", {}, (200,))),
+        ("POST /festivals/", nb_requetes,
+         lambda i: ("POST", "/festivals/", {"json": festival_synthetique(rng, -i), "headers": entetes}, (200,))),
+        ("PUT /festivals/{id}", nb_requetes,
+         lambda i: ("PUT", f"/festivals/{festival_id()}",
+                    {"json": festival_synthetique(rng, i), "headers": entetes}, (200,))),
+        ("PATCH /festivals/{id}", nb_requetes,
+         lambda i: ("PATCH", f"/festivals/{festival_id()}",
+                    {"json": {"annee_creation": rng.randint(1950, 2023),
+                              "adresse": {"commune": f"Commune {rng.randint(1, 5000)}"}},
+                     "headers": entetes}, (200,))),
+        ("DELETE /festivals/{id}", len(a_supprimer),
+         lambda i: ("DELETE", f"/festivals/{a_supprimer[i]}", {}, (204,))),
+        ("GET /auth/is_authorized", nb_requetes,
+         lambda i: ("GET", "/auth/is_authorized", {"headers": entetes}, (200,))),
+        ("POST /auth/create_user", nb_requetes_auth,
+         lambda i: ("POST", "/auth/create_user",
+                    {"json": {"username": f"bench{i}", "email": f"bench{i}@example.com", "password": "motdepasse"}},
+                    (200,))),
+        ("POST /auth/token", nb_requetes_auth,
+         lambda i: ("POST", "/auth/token", {"data": {"username": "bench", "password": "motdepasse"}}, (200,))),
+    ]
+
+
+async def lancer_banc(nb_festivals, nb_requetes, nb_requetes_auth, concurrence, graine=0, ecriture_groupee=False):
+    """
+    Prépare la base synthétique, exécute tous les scénarios et retourne le rapport.
+    """
+    dossier = tempfile.mkdtemp(prefix="bench_festivals_")
+    engine = create_engine(f"sqlite:///{dossier}/bench.db", connect_args={"check_same_thread": False},
+                           pool_size=concurrence, max_overflow=concurrence)
+    debut = time.perf_counter()
+    peupler_base(engine, nb_festivals, graine)
+    duree_peuplement = time.perf_counter() - debut
+    SessionBench = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_db_bench():
+        db = SessionBench()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = get_db_bench
+    if ecriture_groupee:
+        activer_ecriture_groupee(SessionBench)
+    rng = random.Random(graine)
+    rapport = {
+        "parametres": {"festivals": nb_festivals, "requetes": nb_requetes,
+                       "requetes_auth": nb_requetes_auth, "concurrence": concurrence,
+                       "ecriture_groupee": ecriture_groupee},
+        "peuplement_s": round(duree_peuplement, 3),
+        "scenarios": {},
+    }
+    try:
+        # Les erreurs 500 sont comptées comme des erreurs du scénario au lieu d'interrompre le banc
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            await client.post("/auth/create_user", json={"username": "bench", "email": "bench@example.com",
+                                                          "password": "motdepasse"})
+            jeton = (await client.post("/auth/token", data={"username": "bench", "password": "motdepasse"})).json()["access_token"]
+            for nom, nb, fabrique in construire_scenarios(nb_festivals, rng, jeton, nb_requetes, nb_requetes_auth):
+                rapport["scenarios"][nom] = await executer_scenario(client, nb, concurrence, fabrique)
+    finally:
+        desactiver_ecriture_groupee()
+        app.dependency_overrides.pop(get_db, None)
+        engine.dispose()
+    return rapport
+
+
+def comparer(rapport, reference, tolerance):
+    """
+    Compare le rapport à une référence et retourne la liste des régressions : débit plus
+    faible ou latence p95 plus élevée que la référence au-delà de la tolérance relative.
+    """
+    regressions = []
+    for nom, mesures in rapport["scenarios"].items():
+        ref = reference.get("scenarios", {}).get(nom)
+        if ref is None:
+            continue
+        if mesures["debit_rps"] < ref["debit_rps"] * (1 - tolerance):
+            regressions.append(f"{nom} : débit {mesures['debit_rps']} req/s < référence {ref['debit_rps']} req/s")
+        if mesures["latence_ms"]["p95"] > ref["latence_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{nom} : p95 {mesures['latence_ms']['p95']} ms > référence {ref['latence_ms']['p95']} ms")
+        if mesures["erreurs"] > ref["erreurs"]:
+            regressions.append(f"{nom} : {mesures['erreurs']} erreurs (référence {ref['erreurs']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de performance de l'API des festivals")
+    parser.add_argument("--festivals", type=int, default=10000, help="taille du jeu synthétique (10k à 1M)")
+    parser.add_argument("--requetes", type=int, default=500, help="requêtes par scénario")
+    parser.add_argument("--requetes-auth", type=int, default=20, help="requêtes pour les scénarios bcrypt")
+    parser.add_argument("--concurrence", type=int, default=16)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--ecriture-groupee", action="store_true",
+                        help="regroupe les écritures concurrentes dans une seule transaction")
+    parser.add_argument("--sortie", help="fichier JSON où écrire le rapport (stdout sinon)")
+    parser.add_argument("--reference", help="rapport JSON de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="régression relative tolérée")
+    args = parser.parse_args()
+
+    rapport = asyncio.run(lancer_banc(args.festivals, args.requetes, args.requetes_auth,
+                                      args.concurrence, args.graine, args.ecriture_groupee))
+    texte = json.dumps(rapport, indent=2, ensure_ascii=False)
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            f.write(texte)
+    else:
+        print(texte)
+
+    if args.reference:
+        with open(args.reference, "r", encoding="utf-8") as f:
+            regressions = comparer(rapport, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"RÉGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Banc du temps de démarrage de l'API des festivals.
+
+Chaque mesure est faite dans un nouveau processus Python, pour partir d'un cache
+d'import vide comme un worker qui redémarre : durée de l'import de festival_api.main,
+puis durée jusqu'à la première réponse (cycle de vie de l'application et première
+requête GET /festivals/). Avec --detail, les modules les plus coûteux à importer
+sont listés à partir de python -X importtime.
+
+Utilisation :
+    python -m benchmarks.bench_demarrage --repetitions 5 --sortie demarrage.json
+    python -m benchmarks.bench_demarrage --base /chemin/festival_france.db --detail
+
+Sans --base, une base SQLite temporaire vide est utilisée.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MESURE = r"""
+import asyncio, json, sys, time
+debut = time.perf_counter()
+from festival_api.main import app
+import_fini = time.perf_counter()
+
+async def premiere_reponse():
+    import httpx
+    async with app.router.lifespan_context(app):
+        pret = time.perf_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://banc") as client:
+            reponse = await client.get("/festivals/")
+            # Une base vide répond 404 : seule une erreur serveur fait échouer la mesure
+            assert reponse.status_code < 500, reponse.text
+        return pret
+
+pret = asyncio.run(premiere_reponse())
+fin = time.perf_counter()
+lourds = [m for m in ("numpy", "passlib", "jose", "scipy", "pyarrow") if m in sys.modules]
+print(json.dumps({"import": import_fini - debut, "demarrage": pret - import_fini,
+                  "premiere_reponse": fin - debut, "modules_lourds_importes": lourds}))
+"""
+
+
+def environnement(base):
+    """
+    Construit les variables d'environnement du processus mesuré.
+    """
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "bench-secret")
+    env.setdefault("ALGORITHM", "HS256")
+    env.pop("TESTING", None)
+    env["DATABASE_URL"] = base
+    return env
+
+
+def mesurer(base):
+    """
+    Lance une mesure dans un nouveau processus et retourne ses durées en secondes.
+    """
+    sortie = subprocess.run([sys.executable, "-c", MESURE], cwd=RACINE, env=environnement(base),
+                            capture_output=True, text=True)
+    if sortie.returncode:
+        raise RuntimeError(f"Échec de la mesure du démarrage :\n{sortie.stderr}")
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+
+def modules_couteux(base, nombre=15):
+    """
+    Retourne les modules dont l'import cumulé est le plus long, d'après python -X importtime.
+    """
+    sortie = subprocess.run([sys.executable, "-X", "importtime", "-c", "import festival_api.main"],
+                            cwd=RACINE, env=environnement(base), capture_output=True, text=True, check=True)
+    modules = []
+    for ligne in sortie.stderr.splitlines():
+        if not ligne.startswith("import time:") or "cumulative" in ligne:
+            continue
+        _, cumule, module = ligne[len("import time:"):].split("|")
+        modules.append({"module": module.strip(), "cumule_ms": int(cumule) / 1000})
+    modules.sort(key=lambda m: m["cumule_ms"], reverse=True)
+    return modules[:nombre]
+
+
+def lancer_banc(repetitions=5, base=None, detail=False):
+    """
+    Mesure plusieurs démarrages et retourne le rapport (médianes et minimums en millisecondes).
+    """
+    if base is None:
+        with tempfile.TemporaryDirectory() as dossier:
+            return lancer_banc(repetitions, os.path.join(dossier, "demarrage.db"), detail)
+    mesures = [mesurer(base) for _ in range(repetitions)]
+    rapport = {"repetitions": repetitions, "base": base,
+               "modules_lourds_importes": mesures[-1]["modules_lourds_importes"]}
+    for cle in ("import", "demarrage", "premiere_reponse"):
+        valeurs = [m[cle] * 1000 for m in mesures]
+        rapport[cle] = {"median_ms": round(statistics.median(valeurs), 1), "min_ms": round(min(valeurs), 1)}
+    if detail:
+        rapport["modules"] = modules_couteux(base)
+    return rapport
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc du temps de démarrage de l'API des festivals")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--base", help="base SQLite à ouvrir (base temporaire vide sinon)")
+    parser.add_argument("--detail", action="store_true", help="liste les imports les plus coûteux")
+    parser.add_argument("--sortie", help="fichier JSON où écrire le rapport (stdout sinon)")
+    args = parser.parse_args()
+
+    rapport = lancer_banc(args.repetitions, args.base, args.detail)
+    texte = json.dumps(rapport, indent=2, ensure_ascii=False)
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            f.write(texte)
+    else:
+        print(texte)
+
+
+if __name__ == "__main__":
+    main()
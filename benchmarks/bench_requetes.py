@@ -0,0 +1,127 @@
+"""
+Microbanc du coût Python des requêtes ORM les plus fréquentes.
+
+Pour la lecture d'un festival, la liste des festivals et la recherche d'un utilisateur,
+le script compare par appel :
+- avant : la requête reconstruite à chaque appel avec session.query(...).options(joinedload(...)) ;
+- après : les fonctions de l'API (lambda_stmt sur des select() construits une fois) ;
+- SQLite seul : le même SQL exécuté directement par le pilote sqlite3, sans ORM, comme plancher.
+La part de l'ORM est la part du temps d'un appel qui n'est pas passée dans SQLite.
+
+Utilisation :
+    python -m benchmarks.bench_requetes
+    python -m benchmarks.bench_requetes --festivals 10000 --appels 20000 --sortie requetes.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("TESTING", "True")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import joinedload, sessionmaker
+
+from benchmarks.bench_api import peupler_base
+from festival_api.database.db_authentification import get_user
+from festival_api.database.db_core import DBFestival, DBUsers
+from festival_api.database.db_festivals import read_db_festival, read_db_one_festival
+
+
+def avant_un_festival(id_festival, session):
+    return session.query(DBFestival).options(
+        joinedload(DBFestival.adresse),
+        joinedload(DBFestival.categorie),
+        joinedload(DBFestival.periode)
+    ).filter(DBFestival.id_festival == id_festival).first()
+
+
+def avant_liste(session):
+    return session.query(DBFestival).options(
+        joinedload(DBFestival.adresse),
+        joinedload(DBFestival.categorie),
+        joinedload(DBFestival.periode)
+    ).limit(5).all()
+
+
+def avant_utilisateur(username, session):
+    return session.query(DBUsers).filter(DBUsers.username == username).first()
+
+
+def sql_compile(fonction, session):
+    """
+    Retourne le SQL et les paramètres émis par une fonction de lecture, capturés au premier appel.
+    """
+    from sqlalchemy import event
+
+    emis = []
+
+    def capturer(conn, curseur, sql, parametres, contexte, executemany):
+        emis.append((sql, parametres))
+
+    moteur = session.get_bind()
+    event.listen(moteur, "before_cursor_execute", capturer)
+    try:
+        fonction()
+    finally:
+        event.remove(moteur, "before_cursor_execute", capturer)
+    return emis[-1]
+
+
+def par_appel(fonction, appels):
+    """
+    Durée moyenne d'un appel en microsecondes, après un appel de chauffe.
+    """
+    fonction()
+    debut = time.perf_counter()
+    for _ in range(appels):
+        fonction()
+    return (time.perf_counter() - debut) / appels * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--festivals", type=int, default=1000)
+    parser.add_argument("--appels", type=int, default=5000)
+    parser.add_argument("--sortie", help="fichier JSON du rapport")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        engine = create_engine(f"sqlite:///{dossier}/requetes.db")
+        peupler_base(engine, args.festivals)
+        with engine.begin() as conn:
+            conn.execute(DBUsers.__table__.insert(), {"username": "banc", "email": "banc@festival.fr",
+                                                      "hashed_password": "x", "disabled": False})
+        session = sessionmaker(bind=engine)()
+        brut = engine.raw_connection()
+        cas = {
+            "un_festival": (lambda: avant_un_festival(42, session), lambda: read_db_one_festival(42, session)),
+            "liste": (lambda: avant_liste(session), lambda: read_db_festival(session)),
+            "utilisateur": (lambda: avant_utilisateur("banc", session), lambda: get_user("banc", session)),
+        }
+        rapport = {}
+        for nom, (avant, apres) in cas.items():
+            sql, parametres = sql_compile(apres, session)
+            mesures = {
+                "avant_us": par_appel(lambda: (avant(), session.expunge_all()), args.appels),
+                "apres_us": par_appel(lambda: (apres(), session.expunge_all()), args.appels),
+                "sqlite_us": par_appel(lambda: brut.execute(sql, parametres).fetchall(), args.appels),
+            }
+            mesures["part_orm_avant_pct"] = 100 * (1 - mesures["sqlite_us"] / mesures["avant_us"])
+            mesures["part_orm_apres_pct"] = 100 * (1 - mesures["sqlite_us"] / mesures["apres_us"])
+            rapport[nom] = {cle: round(valeur, 1) for cle, valeur in mesures.items()}
+        session.close()
+        brut.close()
+        engine.dispose()
+
+    print(json.dumps(rapport, indent=2, ensure_ascii=False))
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(rapport, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Banc de la validation des enregistrements bruts par le schéma JSON des festivals.
+
+Les enregistrements sont ceux du dernier instantané de l'export s'il existe, sinon ceux
+de data/festivals_data.csv, répétés --facteur fois. Sont mesurés : la compilation du
+schéma, la validation avec le validateur complet de jsonschema (un parcours du schéma
+par enregistrement), la validation par le schéma compilé de data.validation, séquentielle puis en
+parallèle, puis les étapes suivantes du pipeline sur les enregistrements valides (nettoyage
+avec géocodage local, détection des doublons, insertion dans une base SQLite temporaire avec
+FESTIVAL_FLAT et les festivals similaires), pour rapporter le coût de la validation à celui
+du pipeline hors téléchargement.
+
+Utilisation :
+    python -m benchmarks.bench_validation
+    python -m benchmarks.bench_validation --facteur 10 --processus 4 --sortie validation.json
+"""
+import argparse
+import ast
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_ID = "festivals-global-festivals-_-pl"
+
+
+def charger_enregistrements():
+    """
+    Charge les enregistrements bruts : l'instantané de l'export, ou à défaut le CSV brut.
+    """
+    from data import data_festival
+
+    meta = data_festival.lire_instantane(DATASET_ID)
+    if meta is not None:
+        return data_festival.charger_instantane(meta)
+    import pandas as pd
+
+    df = pd.read_csv(os.path.join(RACINE, "data/festivals_data.csv"), dtype=str)
+    enregistrements = df.astype(object).where(df.notna(), None).to_dict("records")
+    for enregistrement in enregistrements:
+        if enregistrement["geocodage_xy"]:
+            enregistrement["geocodage_xy"] = ast.literal_eval(enregistrement["geocodage_xy"])
+    return enregistrements
+
+
+def inserer(df, dossier):
+    """
+    Insère les festivals nettoyés dans une base SQLite temporaire, comme l'étape d'insertion.
+    """
+    from database_building import insertion_data, similarite
+
+    chemin = os.path.join(dossier, "festivals.parquet")
+    df.to_parquet(chemin, index=False)
+    conn = sqlite3.connect(os.path.join(dossier, "festivals.db"))
+    with open(os.path.join(insertion_data.DOSSIER_SCRIPTS, "script_sqlite.sql"), encoding="utf-8") as f:
+        conn.executescript(f.read())
+    cur = conn.cursor()
+    for lot in insertion_data.lire_lots(chemin):
+        insertion_data.inserer_lot(cur, lot)
+    conn.commit()
+    insertion_data.reconstruire_festival_flat(conn)
+    similarite.calculer_similaires(conn)
+    conn.close()
+
+
+def chronometrer(fonction):
+    debut = time.perf_counter()
+    resultat = fonction()
+    return time.perf_counter() - debut, resultat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--facteur", type=int, default=1, help="nombre de copies des enregistrements")
+    parser.add_argument("--processus", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--sortie", help="fichier JSON du rapport")
+    args = parser.parse_args()
+
+    os.chdir(RACINE)
+    sys.path.insert(0, RACINE)
+    import pandas as pd
+    from data import data_festival, deduplication, validation
+
+    enregistrements = [dict(e) for e in charger_enregistrements() for _ in range(args.facteur)]
+    compilation, _ = chronometrer(validation.verificateur)
+    complet, _ = chronometrer(lambda: [validation.validateur().is_valid(e) for e in enregistrements])
+    sequentiel, (valides, quarantaine) = chronometrer(lambda: validation.valider_enregistrements(enregistrements))
+    parallele, _ = chronometrer(lambda: validation.valider_enregistrements(enregistrements, nb_processus=args.processus))
+    nettoyage, df = chronometrer(lambda: data_festival.nettoyer_donnees(
+        data_festival.renommer_et_creer_colonnes(pd.DataFrame(valides))))
+    doublons, _ = chronometrer(lambda: deduplication.detecter_doublons(df))
+    dossier = tempfile.mkdtemp()
+    try:
+        insertion, _ = chronometrer(lambda: inserer(df, dossier))
+    finally:
+        shutil.rmtree(dossier)
+    pipeline = sequentiel + nettoyage + doublons + insertion
+
+    rapport = {
+        "enregistrements": len(enregistrements),
+        "quarantaine": len(quarantaine),
+        "compilation_s": round(compilation, 4),
+        "validateur_complet_s": round(complet, 3),
+        "validation_compilee_s": round(sequentiel, 3),
+        f"validation_{args.processus}_processus_s": round(parallele, 3),
+        "nettoyage_s": round(nettoyage, 3),
+        "doublons_s": round(doublons, 3),
+        "insertion_s": round(insertion, 3),
+        "pipeline_hors_telechargement_s": round(pipeline, 3),
+        "part_validation_pct": round(100 * sequentiel / pipeline, 1),
+    }
+    print(json.dumps(rapport, indent=2, ensure_ascii=False))
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            json.dump(rapport, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,44 @@
+import numpy as np
 import pandas as pd
 import requests
+from scipy.spatial import cKDTree
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 from dotenv import load_dotenv
 import json
+import gzip
+import hashlib
 import re
 import time
 import logging
+import sys
+
+try:
+    from festival_api.database.periodes import jours_periode
+except ImportError:  # lancé directement depuis data/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from festival_api.database.periodes import jours_periode
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+URL_API_CULTURE = "https://data.culture.gouv.fr"
+# API Découpage administratif (communes du Code officiel géographique de l'INSEE et leur centre)
+URL_API_GEO = "https://geo.api.gouv.fr"
+# Dossier où sont conservés les exports bruts de l'API, nommés par leur empreinte SHA-256
+DOSSIER_INSTANTANES = "data/instantanes"
+# (connexion, lecture) en secondes
+DELAI_REQUETE = (10, 120)
+# Table de référence des communes (code INSEE, nom, département, région, code postal, centroïde)
+CHEMIN_REFERENCE_COMMUNES = "data/reference_communes.csv"
+# Au-delà de cette distance à la commune la plus proche, le point est considéré comme non résolu
+DISTANCE_MAX_KM = 15
+# La commune du festival doit être parmi les VOISINS_COMMUNE communes de référence les plus proches :
+# un point près d'une limite communale peut être plus proche du centre d'une commune voisine
+VOISINS_COMMUNE = 4
+_MOTIF_CODE_INSEE = re.compile(r"^[0-9][0-9AB][0-9]{3}$")
+RAYON_TERRE_KM = 6371.0
+
 
 def charger_variables_env():
     """
@@ -29,14 +59,137 @@ def charger_variables_env():
 
 
 
-def recuperer_donnees_api(dataset_id, api_key):
+def creer_session_http(tentatives=3):
+    """
+    Crée une session HTTP réutilisable avec un pool de connexions et des tentatives automatiques.
+
+    Les requêtes GET sont retentées avec une attente exponentielle en cas d'erreur réseau
+    ou de réponse 429/5xx, et la compression gzip est demandée au serveur.
+
+    Args :
+    --------
+    tentatives : int
+        Le nombre maximal de nouvelles tentatives par requête.
+
+    Return :
+    --------
+    requests.Session
+        La session configurée.
+    """
+    session = requests.Session()
+    strategie = Retry(
+        total=tentatives,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET"],
+    )
+    adaptateur = HTTPAdapter(max_retries=strategie, pool_connections=4, pool_maxsize=4)
+    session.mount("https://", adaptateur)
+    session.mount("http://", adaptateur)
+    session.headers["Accept-Encoding"] = "gzip"
+    return session
+
+
+def lire_instantane(dataset_id, dossier_instantanes=DOSSIER_INSTANTANES):
+    """
+    Lit les métadonnées du dernier instantané connu d'un dataset.
+
+    Args :
+    --------
+    dataset_id : str
+        L'identifiant du dataset.
+    dossier_instantanes : str
+        Le dossier du magasin d'instantanés.
+
+    Return :
+    --------
+    dict ou None
+        Les métadonnées ('sha256', 'etag', 'last_modified') si l'instantané existe, sinon None.
+    """
+    chemin_meta = os.path.join(dossier_instantanes, f"{dataset_id}.json")
+    if not os.path.exists(chemin_meta):
+        return None
+    with open(chemin_meta, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if not os.path.exists(os.path.join(dossier_instantanes, f"{meta['sha256']}.json.gz")):
+        return None
+    return meta
+
+
+def charger_instantane(meta, dossier_instantanes=DOSSIER_INSTANTANES):
+    """
+    Charge le contenu JSON d'un instantané à partir de ses métadonnées.
+
+    Args :
+    --------
+    meta : dict
+        Les métadonnées retournées par lire_instantane.
+    dossier_instantanes : str
+        Le dossier du magasin d'instantanés.
+
+    Return :
+    --------
+    list
+        Les données de l'export sous forme de liste de dictionnaires.
+    """
+    with gzip.open(os.path.join(dossier_instantanes, f"{meta['sha256']}.json.gz"), "rb") as f:
+        return json.loads(f.read())
+
+
+def enregistrer_instantane(dataset_id, contenu, response, dossier_instantanes=DOSSIER_INSTANTANES):
+    """
+    Enregistre un export brut dans le magasin d'instantanés.
+
+    Le contenu est stocké compressé sous le nom de son empreinte SHA-256 (un contenu déjà
+    connu n'est pas réécrit), puis les métadonnées du dataset sont mises à jour avec
+    l'ETag et la date Last-Modified renvoyés par le serveur.
+
+    Args :
+    --------
+    dataset_id : str
+        L'identifiant du dataset.
+    contenu : bytes
+        Le corps brut (décompressé) de la réponse.
+    response : requests.Response
+        La réponse HTTP, pour ses en-têtes de cache.
+    dossier_instantanes : str
+        Le dossier du magasin d'instantanés.
+
+    Return :
+    --------
+    dict
+        Les nouvelles métadonnées de l'instantané.
+    """
+    os.makedirs(dossier_instantanes, exist_ok=True)
+    empreinte = hashlib.sha256(contenu).hexdigest()
+    chemin = os.path.join(dossier_instantanes, f"{empreinte}.json.gz")
+    if not os.path.exists(chemin):
+        with gzip.open(chemin + ".tmp", "wb") as f:
+            f.write(contenu)
+        os.replace(chemin + ".tmp", chemin)
+
+    meta = {
+        "sha256": empreinte,
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+    }
+    chemin_meta = os.path.join(dossier_instantanes, f"{dataset_id}.json")
+    with open(chemin_meta + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(chemin_meta + ".tmp", chemin_meta)
+    return meta
+
+
+def recuperer_donnees_api(dataset_id, api_key, url_base=URL_API_CULTURE, dossier_instantanes=DOSSIER_INSTANTANES, session=None):
     """
     Récupère les données depuis l'API donnée en utilisant le dataset_id et la clé API.
 
-    Cette fonction envoie une requête HTTP GET à l'API en utilisant l'identifiant
-    du dataset et la clé API fournie. Elle tente de récupérer les données sous
-    forme de JSON et les retourne. En cas d'erreur, elle affiche un message d'erreur
-    approprié.
+    Cette fonction envoie une requête HTTP GET conditionnelle à l'API : si un instantané
+    de l'export existe déjà localement, son ETag et sa date Last-Modified sont envoyés
+    (If-None-Match / If-Modified-Since) et une réponse 304 réutilise l'instantané sans
+    retélécharger l'export. Une nouvelle version est enregistrée dans le magasin
+    d'instantanés. En cas d'erreur réseau ou de réponse invalide, le dernier instantané
+    valide est utilisé s'il existe.
 
     Args :
     --------
@@ -44,28 +197,57 @@ def recuperer_donnees_api(dataset_id, api_key):
         L'identifiant du dataset à récupérer.
     api_key : str
         La clé API pour l'accès aux données.
+    url_base : str
+        L'URL racine de l'API (modifiable pour pointer vers un serveur local en test).
+    dossier_instantanes : str
+        Le dossier du magasin d'instantanés.
+    session : requests.Session ou None
+        La session HTTP à utiliser, créée avec creer_session_http si absente.
 
     Return :
     --------
     list ou None
-        Les données récupérées sous forme de liste de dictionnaires, ou None en cas d'échec.
+        Les données récupérées sous forme de liste de dictionnaires, ou None en cas d'échec
+        sans instantané disponible.
     """
-    url = f"https://data.culture.gouv.fr/api/v2/catalog/datasets/{dataset_id}/exports/json"
-    headers = {'X-API-KEY': api_key}
+    url = f"{url_base}/api/v2/catalog/datasets/{dataset_id}/exports/json"
+    headers = {'X-API-KEY': api_key} if api_key else {}
+    meta = lire_instantane(dataset_id, dossier_instantanes)
+    if meta is not None:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    session = session or creer_session_http()
     logging.info(f"Envoi de la requête à l'API pour le dataset {dataset_id}.")
-    
-    response = requests.get(url, headers=headers)
 
-    if response.status_code == 200:
+    try:
+        response = session.get(url, headers=headers, timeout=DELAI_REQUETE)
+    except requests.RequestException as e:
+        logging.error(f"Échec de la requête : {e}")
+        response = None
+
+    if response is not None and response.status_code == 304 and meta is not None:
+        logging.info("Export inchangé, utilisation de l'instantané local.")
+        return charger_instantane(meta, dossier_instantanes)
+
+    if response is not None and response.status_code == 200:
         try:
-            logging.info("Données récupérées avec succès.")
-            return response.json()
+            donnees = json.loads(response.content)
         except json.JSONDecodeError as e:
-            logging.error("Erreur de décodage JSON:", e)
-            return None
-    else:
+            logging.error(f"Erreur de décodage JSON: {e}")
+        else:
+            enregistrer_instantane(dataset_id, response.content, response, dossier_instantanes)
+            logging.info("Données récupérées avec succès.")
+            return donnees
+    elif response is not None:
         logging.error(f"Échec de la requête. Code d'état: {response.status_code}")
-        return None
+
+    if meta is not None:
+        logging.warning("Utilisation du dernier instantané valide.")
+        return charger_instantane(meta, dossier_instantanes)
+    return None
 
 
 def extraire_annee(annee_str):
@@ -211,6 +393,32 @@ def uniformiser_periode(period):
     return period.strip()
 
 
+def extraire_jours_periode(periodes):
+    """
+    Convertit les périodes textuelles en jours de l'année de début et de fin (voir
+    festival_api.database.periodes.jours_periode pour les formats reconnus).
+
+    Seules les valeurs distinctes sont analysées, puis le résultat est redistribué sur
+    toutes les lignes.
+
+    Args :
+    --------
+    periodes : pandas.Series
+        Les périodes uniformisées (par exemple "21 Juin - 5 Septembre").
+
+    Return :
+    --------
+    pandas.DataFrame
+        Un DataFrame avec les colonnes 'Jour_Debut' et 'Jour_Fin' (Int64, de 1 à 365).
+    """
+    codes, valeurs = pd.factorize(periodes)
+    jours = pd.DataFrame([jours_periode(valeur) for valeur in valeurs], columns=['Jour_Debut', 'Jour_Fin'],
+                         dtype=float).reindex(range(len(valeurs)))
+    resultat = jours.iloc[np.where(codes >= 0, codes, 0)].set_axis(periodes.index)
+    resultat[codes < 0] = np.nan
+    return resultat.astype('Int64')
+
+
 def gen_adresse_depuis_coordonnees(lat, lon):
     """
     Récupère une adresse complète à partir de coordonnées de latitude et de longitude en utilisant l'API Nominatim d'OpenStreetMap.
@@ -259,6 +467,197 @@ def gen_adresse_depuis_coordonnees(lat, lon):
     return ""
 
 
+def coordonnees_cartesiennes(latitudes, longitudes):
+    """
+    Convertit des latitudes et longitudes en degrés en points de la sphère unité.
+
+    La distance euclidienne entre deux de ces points croît avec la distance sur le globe,
+    ce qui permet d'utiliser un KD-tree euclidien pour la recherche du plus proche voisin.
+
+    Args :
+    --------
+    latitudes : numpy.ndarray
+        Les latitudes en degrés.
+    longitudes : numpy.ndarray
+        Les longitudes en degrés.
+
+    Return :
+    --------
+    numpy.ndarray
+        Un tableau (n, 3) de coordonnées x, y, z.
+    """
+    lat = np.radians(latitudes)
+    lon = np.radians(longitudes)
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def normaliser_code_insee(code):
+    """
+    Normalise un code INSEE de commune en chaîne de 5 caractères.
+
+    Les exports lus comme des nombres perdent le zéro initial des départements 01 à 09
+    (« 1004 » pour Ambérieu-en-Bugey, 01004) : il est rétabli.
+
+    Args :
+    --------
+    code : str, int ou float
+        Le code INSEE brut.
+
+    Return :
+    --------
+    str
+        Le code sur 5 caractères (« 01004 », « 2A004 »), ou None s'il est manquant ou invalide.
+    """
+    if code is None or (isinstance(code, float) and np.isnan(code)):
+        return None
+    if isinstance(code, float) and code.is_integer():
+        code = int(code)
+    code = str(code).strip().upper()
+    if code.isdigit() and len(code) == 4:
+        code = code.zfill(5)
+    return code if _MOTIF_CODE_INSEE.match(code) else None
+
+
+def telecharger_reference_communes(chemin_sortie=CHEMIN_REFERENCE_COMMUNES, url_base=URL_API_GEO, session=None):
+    """
+    Télécharge les communes et les arrondissements municipaux du Code officiel géographique
+    (API Découpage administratif) et écrit la table de référence du géocodeur local.
+
+    Args :
+    --------
+    chemin_sortie : str
+        Le fichier CSV de référence à écrire.
+    url_base : str
+        L'URL de l'API Découpage administratif.
+    session : requests.Session
+        La session HTTP à utiliser, une session avec nouvelles tentatives par défaut.
+
+    Return :
+    --------
+    pandas.DataFrame
+        La table de référence.
+    """
+    session = session or creer_session_http()
+    response = session.get(f"{url_base}/communes", timeout=DELAI_REQUETE, params={
+        "type": "commune-actuelle,arrondissement-municipal",
+        "fields": "code,nom,codesPostaux,centre,departement,region",
+        "format": "json",
+    })
+    response.raise_for_status()
+    return construire_reference_communes(response.json(), chemin_sortie)
+
+
+def construire_reference_communes(communes, chemin_sortie=CHEMIN_REFERENCE_COMMUNES):
+    """
+    Construit la table de référence des communes à partir de la liste des communes de l'API
+    Découpage administratif (ou d'un export au même format).
+
+    La position retenue est le centre de la commune et le code postal le plus petit de ses
+    codes postaux ; les communes sans centre sont ignorées. Les codes restent des chaînes
+    sur 5 caractères.
+
+    Args :
+    --------
+    communes : list[dict]
+        Les communes, avec les clés 'code', 'nom', 'codesPostaux', 'centre' (point GeoJSON),
+        'departement' et 'region' ({'code', 'nom'}).
+    chemin_sortie : str
+        Le fichier CSV de référence à écrire.
+
+    Return :
+    --------
+    pandas.DataFrame
+        La table de référence.
+    """
+    lignes = [{
+        'code_insee': normaliser_code_insee(commune['code']),
+        'commune': commune['nom'],
+        'departement': (commune.get('departement') or {}).get('nom'),
+        'region': (commune.get('region') or {}).get('nom'),
+        'code_postal': min(commune.get('codesPostaux') or [None], key=lambda code: code or ''),
+        'latitude': commune['centre']['coordinates'][1],
+        'longitude': commune['centre']['coordinates'][0],
+    } for commune in communes if commune.get('centre')]
+    reference = pd.DataFrame(lignes, columns=['code_insee', 'commune', 'departement', 'region', 'code_postal',
+                                              'latitude', 'longitude'])
+    reference = reference.dropna(subset=['code_insee']).sort_values('code_insee')
+    reference.to_csv(chemin_sortie, index=False)
+    logging.info(f"Table de référence de {len(reference)} communes écrite dans {chemin_sortie}.")
+    return reference
+
+
+class GeocodeurLocal:
+    """
+    Géocodeur inverse hors ligne : un KD-tree construit sur la table de référence des
+    communes associe chaque coordonnée à sa commune, sans appel réseau. La table n'est pas
+    versionnée : absente, elle est téléchargée une fois depuis le Code officiel géographique.
+    """
+
+    def __init__(self, chemin_reference=CHEMIN_REFERENCE_COMMUNES):
+        if not os.path.exists(chemin_reference):
+            logging.info("Table de référence des communes absente, téléchargement depuis l'API Découpage administratif.")
+            telecharger_reference_communes(chemin_reference)
+        reference = pd.read_csv(chemin_reference, dtype={'code_insee': str, 'code_postal': str})
+        colonnes = reference[['commune', 'departement', 'region', 'code_postal']].fillna('')
+        self.adresses = colonnes.agg(lambda ligne: ", ".join(filter(None, ligne)), axis=1).to_numpy(dtype=object)
+        self.codes = reference['code_insee'].map(normaliser_code_insee).to_numpy(dtype=object)
+        self.arbre = cKDTree(coordonnees_cartesiennes(reference['latitude'].to_numpy(float),
+                                                      reference['longitude'].to_numpy(float)))
+
+    def geocoder(self, latitudes, longitudes, codes_insee=None, distance_max_km=DISTANCE_MAX_KM):
+        """
+        Retrouve l'adresse de chaque coordonnée par une seule requête vectorisée sur le KD-tree.
+
+        Quand le code INSEE de chaque point est connu, seule sa propre commune est retenue :
+        elle doit être parmi les VOISINS_COMMUNE communes les plus proches et à moins de
+        distance_max_km. Une commune voisine n'est jamais retenue à sa place, le point est
+        alors non résolu. Sans code, la commune la plus proche est retenue.
+
+        Args :
+        --------
+        latitudes : numpy.ndarray
+            Les latitudes en degrés (NaN si inconnues).
+        longitudes : numpy.ndarray
+            Les longitudes en degrés (NaN si inconnues).
+        codes_insee : numpy.ndarray
+            Les codes INSEE normalisés des communes des points (None si inconnu).
+        distance_max_km : float
+            La distance au-delà de laquelle une commune n'est pas retenue.
+
+        Return :
+        --------
+        tuple (numpy.ndarray, numpy.ndarray)
+            Les adresses de commune (chaîne vide si non résolue) et un masque des coordonnées
+            connues mais non résolues (trop éloignées, ou hors de leur commune de référence).
+        """
+        adresses = np.full(len(latitudes), "", dtype=object)
+        non_resolues = np.zeros(len(latitudes), dtype=bool)
+        connues = ~(np.isnan(latitudes) | np.isnan(longitudes))
+        if not connues.any():
+            return adresses, non_resolues
+
+        k = min(VOISINS_COMMUNE, self.arbre.n)
+        corde, index = self.arbre.query(coordonnees_cartesiennes(latitudes[connues], longitudes[connues]), k=k)
+        corde, index = corde.reshape(-1, k), index.reshape(-1, k)
+        distance_km = 2 * RAYON_TERRE_KM * np.arcsin(np.clip(corde / 2, 0, 1))
+        retenues = distance_km <= distance_max_km
+        if codes_insee is None:
+            retenues[:, 1:] = False
+        else:
+            codes = np.asarray(codes_insee, dtype=object)[connues]
+            sans_code = np.array([code is None for code in codes])
+            retenues &= (self.codes[index] == codes[:, None]) | sans_code[:, None]
+            # Sans code, seule la commune la plus proche compte
+            retenues[sans_code, 1:] = False
+        trouvees = retenues.any(axis=1)
+        premieres = retenues.argmax(axis=1)
+
+        resolues = np.flatnonzero(connues)
+        adresses[resolues[trouvees]] = self.adresses[index[trouvees, premieres[trouvees]]]
+        non_resolues[resolues[~trouvees]] = True
+        return adresses, non_resolues
+
+
 def renommer_et_creer_colonnes(df):
     """
     Renomme les colonnes du DataFrame et crée de nouvelles colonnes combinées.
@@ -289,8 +688,11 @@ def renommer_et_creer_colonnes(df):
         'annee_de_creation_du_festival': 'Annee_Creation',
         'discipline_dominante': 'Discipline_Principale',
         'periode_principale_de_deroulement_du_festival': 'Periode',
-        'geocodage_xy': 'Geocode'
+        'geocodage_xy': 'Geocode',
+        'adresse_postale': 'Voie'
     })
+    if 'Voie' not in df_renomme:
+        df_renomme['Voie'] = None
     
     colonnes_sous_categorie = [
         'sous_categorie_spectacle_vivant', 'sous_categorie_musique',
@@ -305,26 +707,30 @@ def renommer_et_creer_colonnes(df):
     colonnes_selectionnees = [
         'Nom_Festival', 'Region', 'Departement', 'Commune', 
         'Code_INSEE', 'Annee_Creation', 'Discipline_Principale', 
-        'Sous_Categorie', 'Periode', 'Geocode'
+        'Sous_Categorie', 'Periode', 'Geocode', 'Site_Internet', 'Voie'
     ]
 
     return df_renomme[colonnes_selectionnees]
 
 
 
-def nettoyer_donnees(df):
+def nettoyer_donnees(df, repli_nominatim=False):
     """
     Nettoie et transforme les données du DataFrame.
 
     Cette fonction effectue plusieurs opérations de nettoyage et de transformation
     sur les données du DataFrame. Elle extrait les coordonnées géographiques,
-    normalise les sous-catégories, catégorise les périodes, uniformise les périodes,
-    et génère des adresses complètes à partir des coordonnées.
+    normalise les codes INSEE et les sous-catégories, catégorise les périodes, uniformise
+    les périodes, et génère des adresses complètes : la voie de l'export suivie de la commune
+    retrouvée à partir des coordonnées par le géocodeur local.
 
     Args :
     --------
     df : pandas.DataFrame
         Le DataFrame contenant les données initiales à nettoyer.
+    repli_nominatim : bool
+        Si True, les coordonnées non résolues par le géocodeur local (trop éloignées de
+        leur commune de référence) sont géocodées avec l'API Nominatim (une requête par seconde).
 
     Return :
     --------
@@ -337,18 +743,32 @@ def nettoyer_donnees(df):
     # extraire uniquement la coordonnée delongitude depuis le format {'lon':  -0.558212256384} dans une nouvelle colonne Longitude
     df['Longitude'] = df['Geocode'].apply(lambda x: x['lon'] if x is not None else None)
 
+    df['Code_INSEE'] = df['Code_INSEE'].map(normaliser_code_insee)
     df['Annee_Creation'] = df['Annee_Creation'].apply(extraire_annee).astype('Int64')
     df['Sous_Categorie'] = df['Sous_Categorie'].apply(uniformiser_sous_categorie)
     df['Categorie_Periode'] = df['Periode'].apply(categoriser_periode)
     df['Periode'] = df['Periode'].apply(uniformiser_periode)
+    df[['Jour_Debut', 'Jour_Fin']] = extraire_jours_periode(df['Periode'])
 
     logging.info("1ere partie de nettoyage des données terminé.")
     logging.info("Debut de la récuperaion des adresses avec les coordonnées.")
 
-    df['Adresse_Complete'] = df.apply(lambda row: gen_adresse_depuis_coordonnees(row['Latitude'], row['Longitude']) if not pd.isna(row['Latitude']) and not pd.isna(row['Longitude']) else "", axis=1)
-    logging.info("Adresse récupérée avec succès.") # Si l'adresse est récupérée avec succès, pour chaque ligne du DF le message s'affiche 
-
-    df = df.drop(columns=['Geocode'], axis=1)
+    communes, non_resolues = GeocodeurLocal().geocoder(df['Latitude'].to_numpy(dtype=float),
+                                                       df['Longitude'].to_numpy(dtype=float),
+                                                       df['Code_INSEE'].to_numpy(dtype=object))
+    voies = df['Voie'].where(df['Voie'].notna(), '').astype(str).str.strip().to_numpy(dtype=object)
+    adresses = np.array([", ".join(filter(None, (voie, commune))) if commune else ""
+                         for voie, commune in zip(voies, communes)], dtype=object)
+    if non_resolues.any():
+        logging.info(f"{non_resolues.sum()} coordonnées hors de leur commune de référence.")
+    if repli_nominatim and non_resolues.any():
+        logging.info("Repli sur Nominatim pour les coordonnées non résolues.")
+        for i in np.flatnonzero(non_resolues):
+            adresses[i] = gen_adresse_depuis_coordonnees(df['Latitude'].iat[i], df['Longitude'].iat[i])
+    df['Adresse_Postale'] = adresses
+    logging.info("Adresse récupérée avec succès.")
+
+    df = df.drop(columns=['Geocode', 'Voie'], axis=1)
     
     logging.info("Récuperation des adresses términé.")
     logging.info("Nettoyage des données terminé.")
@@ -357,23 +777,28 @@ def nettoyer_donnees(df):
 
 def sauvegarder_en_csv(df, nom_fichier):
     """
-    Sauvegarde le DataFrame dans un fichier CSV.
+    Sauvegarde le DataFrame dans un fichier CSV ou Parquet.
 
-    Cette fonction prend un DataFrame en entrée et le sauvegarde dans un fichier CSV
-    avec le nom de fichier spécifié.
+    Cette fonction prend un DataFrame en entrée et le sauvegarde avec le nom de fichier
+    spécifié. Si le nom se termine par '.parquet', les données sont écrites au format
+    Parquet (colonnes typées et compressées) : les années restent des entiers et les
+    coordonnées des flottants, sans repasser par du texte. Sinon un CSV est écrit.
 
     Args :
     --------
     df : pandas.DataFrame
         Le DataFrame à sauvegarder.
     nom_fichier : str
-        Le nom du fichier CSV où les données seront sauvegardées.
+        Le nom du fichier CSV ou Parquet où les données seront sauvegardées.
 
     Return :
     --------
     None
     """
-    df.to_csv(nom_fichier, index=False)
+    if nom_fichier.endswith('.parquet'):
+        df.to_parquet(nom_fichier, index=False, engine='pyarrow', compression='zstd')
+    else:
+        df.to_csv(nom_fichier, index=False)
     logging.info(f"Les données ont été sauvegardées dans {nom_fichier}.")
 
 
@@ -383,7 +808,8 @@ def main():
 
     Cette fonction charge les variables d'environnement pour obtenir la clé API,
     utilise cette clé pour récupérer les données du dataset spécifié via l'API,
-    nettoie et transforme ces données, puis les sauvegarde dans un fichier CSV.
+    nettoie et transforme ces données, puis les sauvegarde dans un fichier CSV et
+    dans un fichier Parquet destiné au script d'insertion.
 
     Args :
     --------
@@ -401,8 +827,9 @@ def main():
     if donnees is not None:
         df = pd.DataFrame(donnees)
         df_renomme = renommer_et_creer_colonnes(df)
-        df_nettoye = nettoyer_donnees(df_renomme)
+        df_nettoye = nettoyer_donnees(df_renomme, repli_nominatim=os.getenv('REPLI_NOMINATIM') == 'True')
         sauvegarder_en_csv(df_nettoye, 'data/clean_festival_data.csv')
+        sauvegarder_en_csv(df_nettoye, 'data/clean_festival_data.parquet')
     logging.info("Fin de l'exécution du script.")
 
 if __name__ == "__main__":
@@ -0,0 +1,305 @@
+import logging
+import os
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Nombre de fonctions de hachage MinHash, découpées en bandes de LIGNES_PAR_BANDE valeurs :
+# deux noms dont la similarité de Jaccard vaut s partagent au moins une bande avec la
+# probabilité 1 - (1 - s^4)^16, soit 0,98 pour s = 0,7 et 0,05 pour s = 0,3
+NB_PERMUTATIONS = 64
+LIGNES_PAR_BANDE = 4
+# Similarité de Jaccard minimale entre les trigrammes de deux noms d'une même commune et d'une
+# même discipline, et entre deux noms d'une même commune quelle que soit leur discipline
+SEUIL_JACCARD = 0.7
+SEUIL_JACCARD_AUTRE_DISCIPLINE = 0.9
+TAILLE_SHINGLE = 3
+# Nombre premier de Mersenne 2^31 - 1 : (a * x + b) tient dans un entier 64 bits
+PREMIER = (1 << 31) - 1
+GRAINE = 20240621
+CHEMIN_RAPPORT_DOUBLONS = "data/rapport_doublons.csv"
+_NON_ALPHANUMERIQUE = re.compile(r"[^0-9a-z]+")
+
+
+def normaliser_nom(nom):
+    """
+    Normalise un nom de festival pour la comparaison.
+
+    Les accents, les majuscules, la ponctuation et les espaces multiples sont retirés :
+    « Jazz à Vienne ! » et « JAZZ A VIENNE » donnent le même nom.
+
+    Args :
+    --------
+    nom : str
+        Le nom du festival.
+
+    Return :
+    --------
+    str
+        Le nom normalisé, vide si le nom est manquant.
+    """
+    if not isinstance(nom, str):
+        return ""
+    sans_accents = "".join(c for c in unicodedata.normalize("NFKD", nom.lower()) if not unicodedata.combining(c))
+    return _NON_ALPHANUMERIQUE.sub(" ", sans_accents).strip()
+
+
+def shingles(nom, taille=TAILLE_SHINGLE):
+    """
+    Découpe un nom normalisé en trigrammes de caractères, hachés en entiers.
+
+    Le nom est encadré d'espaces pour que le début et la fin des mots comptent.
+    Le hachage CRC32 est le même d'une exécution à l'autre, contrairement à hash().
+
+    Args :
+    --------
+    nom : str
+        Le nom normalisé.
+    taille : int
+        Le nombre de caractères par shingle.
+
+    Return :
+    --------
+    set[int]
+        Les shingles hachés, vide pour un nom vide.
+    """
+    if not nom:
+        return set()
+    texte = f" {nom} "
+    return {zlib.crc32(texte[i:i + taille].encode("utf-8")) % PREMIER
+            for i in range(max(1, len(texte) - taille + 1))}
+
+
+def signatures_minhash(ensembles, nb_permutations=NB_PERMUTATIONS, graine=GRAINE):
+    """
+    Calcule la signature MinHash de chaque ensemble de shingles.
+
+    Chaque permutation est simulée par un hachage universel (a * x + b) mod PREMIER ;
+    tous les shingles de tous les noms sont hachés en une seule opération NumPy, puis
+    le minimum de chaque nom est pris avec np.minimum.reduceat.
+
+    Args :
+    --------
+    ensembles : list[set[int]]
+        Les shingles de chaque nom, aucun ne doit être vide.
+    nb_permutations : int
+        Le nombre de valeurs par signature.
+    graine : int
+        La graine des coefficients des hachages.
+
+    Return :
+    --------
+    numpy.ndarray
+        Les signatures, de taille (len(ensembles), nb_permutations).
+    """
+    generateur = np.random.default_rng(graine)
+    a = generateur.integers(1, PREMIER, size=(nb_permutations, 1), dtype=np.uint64)
+    b = generateur.integers(0, PREMIER, size=(nb_permutations, 1), dtype=np.uint64)
+    tailles = np.fromiter((len(e) for e in ensembles), dtype=np.int64, count=len(ensembles))
+    if len(ensembles) == 0:
+        return np.empty((0, nb_permutations), dtype=np.uint64)
+    valeurs = np.fromiter((x for e in ensembles for x in e), dtype=np.uint64, count=int(tailles.sum()))
+    debuts = np.concatenate(([0], np.cumsum(tailles)[:-1]))
+    hachages = (a * valeurs[None, :] + b) % PREMIER
+    return np.minimum.reduceat(hachages, debuts, axis=1).T
+
+
+def paires_candidates(signatures, blocs, lignes_par_bande=LIGNES_PAR_BANDE):
+    """
+    Trouve les paires de noms susceptibles d'être similaires par LSH en bandes.
+
+    Chaque signature est découpée en bandes ; deux noms d'un même bloc (même code INSEE)
+    dont une bande est identique tombent dans le même seau et forment une paire candidate.
+    Le coût est proportionnel au nombre de noms et de paires trouvées, et non au carré
+    du nombre de noms.
+
+    Args :
+    --------
+    signatures : numpy.ndarray
+        Les signatures MinHash.
+    blocs : list
+        Le bloc de chaque nom ; seuls les noms d'un même bloc sont comparés.
+    lignes_par_bande : int
+        Le nombre de valeurs de signature par bande.
+
+    Return :
+    --------
+    set[tuple[int, int]]
+        Les paires (i, j), i < j, d'indices de noms candidats.
+    """
+    paires = set()
+    for debut in range(0, signatures.shape[1], lignes_par_bande):
+        seaux = defaultdict(list)
+        bandes = np.ascontiguousarray(signatures[:, debut:debut + lignes_par_bande])
+        for i, (bloc, bande) in enumerate(zip(blocs, bandes)):
+            seaux[(bloc, bande.tobytes())].append(i)
+        for membres in seaux.values():
+            for x, i in enumerate(membres):
+                for j in membres[x + 1:]:
+                    paires.add((i, j))
+    return paires
+
+
+def jaccard(a, b):
+    """
+    Calcule la similarité de Jaccard de deux ensembles de shingles.
+    """
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def detecter_doublons(df, seuil=SEUIL_JACCARD):
+    """
+    Détecte les festivals en double : même commune (code INSEE) et noms presque identiques.
+
+    Les paires candidates trouvées par MinHash/LSH sont vérifiées par la similarité de
+    Jaccard exacte de leurs trigrammes : au moins `seuil` pour deux festivals de la même
+    discipline, au moins SEUIL_JACCARD_AUTRE_DISCIPLINE sinon (« Festival de Marseille » et
+    « Festival du livre de Marseille » ne sont pas fusionnés). Elles sont ensuite regroupées par union-find (A ~ B et B ~ C
+    forment un seul groupe). Dans chaque groupe, le représentant est le festival qui a le
+    plus de champs renseignés (le premier en cas d'égalité).
+
+    Args :
+    --------
+    df : pandas.DataFrame
+        Les festivals nettoyés, avec les colonnes 'Nom_Festival', 'Code_INSEE' et
+        'Discipline_Principale'.
+    seuil : float
+        La similarité de Jaccard minimale entre deux noms en double de la même discipline.
+
+    Return :
+    --------
+    pandas.DataFrame
+        Le rapport de fusion, une ligne par festival d'un groupe de doublons : 'Groupe',
+        'Index' (dans df), 'Nom_Festival', 'Code_INSEE', 'Discipline_Principale',
+        'Representant' (bool) et 'Similarite' (Jaccard avec le nom du représentant).
+    """
+    noms = [normaliser_nom(nom) for nom in df['Nom_Festival']]
+    ensembles = [shingles(nom) for nom in noms]
+    indices = [i for i, ensemble in enumerate(ensembles) if ensemble]
+    blocs = df['Code_INSEE'].astype(str).to_numpy()
+    disciplines = df['Discipline_Principale'].to_numpy()
+    signatures = signatures_minhash([ensembles[i] for i in indices])
+    candidates = paires_candidates(signatures, [blocs[i] for i in indices])
+
+    parents = list(range(len(df)))
+
+    def racine(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    nb_confirmees = 0
+    for x, y in candidates:
+        i, j = indices[x], indices[y]
+        similarite = jaccard(ensembles[i], ensembles[j])
+        if similarite >= SEUIL_JACCARD_AUTRE_DISCIPLINE or (similarite >= seuil and disciplines[i] == disciplines[j]):
+            nb_confirmees += 1
+            parents[racine(j)] = racine(i)
+
+    groupes = defaultdict(list)
+    for i in range(len(df)):
+        groupes[racine(i)].append(i)
+    renseignes = df.notna().sum(axis=1).to_numpy()
+    lignes = []
+    for numero, membres in enumerate(m for m in groupes.values() if len(m) > 1):
+        representant = max(membres, key=lambda i: (renseignes[i], -i))
+        for i in sorted(membres):
+            lignes.append({
+                'Groupe': numero, 'Index': df.index[i], 'Nom_Festival': df['Nom_Festival'].iat[i],
+                'Code_INSEE': blocs[i], 'Discipline_Principale': disciplines[i],
+                'Representant': i == representant,
+                'Similarite': round(jaccard(ensembles[i], ensembles[representant]), 3),
+            })
+    logging.info(f"{len(candidates)} paires candidates, {nb_confirmees} confirmées, "
+                 f"{len(lignes)} festivals dans {len({l['Groupe'] for l in lignes})} groupes de doublons.")
+    return pd.DataFrame(lignes, columns=['Groupe', 'Index', 'Nom_Festival', 'Code_INSEE', 'Discipline_Principale',
+                                         'Representant', 'Similarite'])
+
+
+def fusionner_doublons(df, rapport):
+    """
+    Ne garde qu'un festival par groupe de doublons.
+
+    Le représentant de chaque groupe est conservé ; ses champs manquants sont complétés
+    par ceux des autres festivals du groupe (site internet, année de création...).
+
+    Args :
+    --------
+    df : pandas.DataFrame
+        Les festivals nettoyés.
+    rapport : pandas.DataFrame
+        Le rapport de fusion retourné par detecter_doublons.
+
+    Return :
+    --------
+    pandas.DataFrame
+        Les festivals sans doublons, dans l'ordre d'origine des représentants.
+    """
+    if rapport.empty:
+        return df
+    representants = rapport[rapport['Representant']].set_index('Groupe')['Index']
+    resultat = df.drop(index=rapport['Index'][~rapport['Representant']])
+    for groupe, membres in rapport.groupby('Groupe')['Index']:
+        representant = representants[groupe]
+        groupe_df = df.loc[[representant] + [i for i in membres if i != representant]]
+        # Première valeur renseignée de chaque colonne, en commençant par le représentant
+        premieres = groupe_df.notna().to_numpy().argmax(axis=0)
+        for colonne, position in zip(df.columns, premieres):
+            resultat.at[representant, colonne] = groupe_df[colonne].iat[position]
+    return resultat
+
+
+def dedoublonner(chemin_entree, chemin_sortie=None, chemin_rapport=CHEMIN_RAPPORT_DOUBLONS):
+    """
+    Détecte les doublons d'un fichier de festivals nettoyés et écrit le rapport de fusion.
+
+    Args :
+    --------
+    chemin_entree : str
+        Le fichier Parquet ou CSV des festivals nettoyés.
+    chemin_sortie : str
+        Si renseigné, le fichier où écrire les festivals sans doublons.
+    chemin_rapport : str
+        Le fichier CSV du rapport de fusion.
+
+    Return :
+    --------
+    int
+        Le nombre de festivals après fusion (ou lus, sans chemin de sortie).
+    """
+    df = pd.read_parquet(chemin_entree) if chemin_entree.endswith('.parquet') else pd.read_csv(chemin_entree)
+    rapport = detecter_doublons(df)
+    rapport.to_csv(chemin_rapport, index=False)
+    if chemin_sortie is None:
+        return len(df)
+    df_fusionne = fusionner_doublons(df, rapport)
+    if chemin_sortie.endswith('.parquet'):
+        df_fusionne.to_parquet(chemin_sortie, index=False, engine='pyarrow', compression='zstd')
+    else:
+        df_fusionne.to_csv(chemin_sortie, index=False)
+    return len(df_fusionne)
+
+
+def main():
+    """
+    Écrit le rapport des doublons du fichier nettoyé, et le fichier sans doublons si
+    FUSION_DOUBLONS vaut True.
+
+    Return :
+    --------
+    None
+    """
+    chemin = os.getenv('CHEMIN_PARQUET') or 'data/clean_festival_data.parquet'
+    sortie = 'data/festival_data_dedoublonne.parquet' if os.getenv('FUSION_DOUBLONS') == 'True' else None
+    logging.info(f"{dedoublonner(chemin, sortie)} festivals.")
+
+
+if __name__ == "__main__":
+    main()
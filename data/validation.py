@@ -0,0 +1,300 @@
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Nombre d'enregistrements validés par lot, et par processus quand la validation est parallèle
+TAILLE_LOT_VALIDATION = 2000
+CHEMIN_QUARANTAINE = "data/quarantaine.jsonl"
+
+_TEXTE = {"type": ["string", "null"]}
+# Années comprises par extraire_annee : « 2014 », « 01/01/2005 00:00 », « 26ème », « 17 ans », « 12ème en 21 »
+MOTIF_ANNEE = r"^\s*$|\b(1[89]|20)\d{2}|\d{1,2}\D*ème|\d{1,2}\s?ans"
+
+# Schéma d'un enregistrement brut de l'export des festivals de data.culture.gouv.fr.
+# Seuls les champs utilisés par le nettoyage sont contraints ; les autres sont libres.
+SCHEMA_FESTIVAL = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "type": "object",
+    "required": ["nom_du_festival", "geocodage_xy", "code_insee_commune", "discipline_dominante"],
+    "properties": {
+        "nom_du_festival": {"type": "string", "pattern": r"\S"},
+        "geocodage_xy": {
+            "type": "object",
+            "required": ["lat", "lon"],
+            "properties": {
+                "lat": {"type": "number", "minimum": -90, "maximum": 90},
+                "lon": {"type": "number", "minimum": -180, "maximum": 180},
+            },
+        },
+        "code_insee_commune": {"type": ["string", "integer"], "pattern": r"^[0-9][0-9AB]?[0-9]{3}$"},
+        "annee_de_creation_du_festival": {
+            "anyOf": [
+                {"type": "null"},
+                {"type": "integer", "minimum": 1800, "maximum": 2100},
+                {"type": "string", "pattern": MOTIF_ANNEE},
+            ],
+        },
+        "discipline_dominante": {"type": "string", "pattern": r"\S"},
+        "region_principale_de_deroulement": _TEXTE,
+        "departement_principal_de_deroulement": _TEXTE,
+        "commune_principale_de_deroulement": _TEXTE,
+        "site_internet_du_festival": _TEXTE,
+        "periode_principale_de_deroulement_du_festival": _TEXTE,
+        "sous_categorie_spectacle_vivant": _TEXTE,
+        "sous_categorie_musique": _TEXTE,
+        "sous_categorie_musique_cnm": _TEXTE,
+        "sous_categorie_cinema_et_audiovisuel": _TEXTE,
+        "sous_categorie_arts_visuels_et_arts_numeriques": _TEXTE,
+        "sous_categorie_livre_et_litterature": _TEXTE,
+    },
+}
+
+
+@lru_cache(maxsize=None)
+def validateur():
+    """
+    Compile le schéma des enregistrements une seule fois par processus.
+
+    Le schéma lui-même est vérifié à la compilation ; le validateur retourné réutilise
+    ses expressions régulières et ses sous-validateurs pour tous les enregistrements.
+
+    Return :
+    --------
+    jsonschema.protocols.Validator
+        Le validateur du schéma SCHEMA_FESTIVAL.
+    """
+    from jsonschema import Draft202012Validator
+
+    Draft202012Validator.check_schema(SCHEMA_FESTIVAL)
+    return Draft202012Validator(SCHEMA_FESTIVAL)
+
+
+# Types Python de chaque type JSON Schema
+_TYPES = {"null": type(None), "boolean": bool, "integer": int, "number": (int, float), "string": str,
+          "array": list, "object": dict}
+
+
+def compiler_type(noms):
+    """
+    Compile le mot-clé type : un seul isinstance, en écartant les booléens (True est un int en
+    Python mais pas un entier JSON) et en acceptant les flottants entiers (1.0) comme entiers.
+    """
+    noms = [noms] if isinstance(noms, str) else list(noms)
+    types = tuple(t for nom in noms for t in (_TYPES[nom] if isinstance(_TYPES[nom], tuple) else (_TYPES[nom],)))
+    exclure_bool = "boolean" not in noms and int in types
+    flottant_entier = "integer" in noms and "number" not in noms
+
+    def verifier(v):
+        if isinstance(v, types):
+            return not (exclure_bool and isinstance(v, bool))
+        return flottant_entier and isinstance(v, float) and v.is_integer()
+    return verifier
+
+
+def compiler_schema(schema):
+    """
+    Compile un schéma JSON en une fonction Python qui indique si une valeur le respecte.
+
+    Chaque mot-clé est traduit une fois en une vérification Python (isinstance, expression
+    régulière compilée, comparaison...) : valider une valeur n'appelle plus que ces fonctions,
+    sans le parcours générique du schéma que jsonschema refait à chaque enregistrement.
+    Seuls les mots-clés de SCHEMA_FESTIVAL sont compilés ; un schéma qui en utilise d'autres
+    est délégué tel quel à jsonschema, qui reste la référence et liste les erreurs.
+
+    Args :
+    --------
+    schema : dict
+        Le schéma (ou sous-schéma) JSON.
+
+    Return :
+    --------
+    callable
+        Une fonction valeur -> bool.
+    """
+    import re
+    from jsonschema import Draft202012Validator
+
+    verifications = []
+    for mot_cle, valeur in schema.items():
+        if mot_cle == "$schema":
+            continue
+        if mot_cle == "type":
+            verifications.append(compiler_type(valeur))
+        elif mot_cle == "pattern":
+            cherche = re.compile(valeur).search
+            verifications.append(lambda v, cherche=cherche: v.__class__ is not str or cherche(v) is not None)
+        elif mot_cle == "minimum":
+            verifications.append(lambda v, borne=valeur: v.__class__ not in (int, float) or v >= borne)
+        elif mot_cle == "maximum":
+            verifications.append(lambda v, borne=valeur: v.__class__ not in (int, float) or v <= borne)
+        elif mot_cle == "required":
+            requis = frozenset(valeur)
+            verifications.append(lambda v, requis=requis: v.__class__ is not dict or requis <= v.keys())
+        elif mot_cle == "properties":
+            verifications.append(compiler_proprietes({nom: compiler_schema(sous_schema)
+                                                      for nom, sous_schema in valeur.items()}))
+        elif mot_cle == "anyOf":
+            alternatives = [compiler_schema(sous_schema) for sous_schema in valeur]
+            verifications.append(lambda v, alternatives=alternatives: any(verifier(v) for verifier in alternatives))
+        else:
+            return Draft202012Validator(schema).is_valid
+    return compiler_tout(verifications)
+
+
+def compiler_proprietes(champs):
+    """
+    Compile le mot-clé properties : chaque champ présent est vérifié par son sous-schéma compilé.
+    """
+    champs = list(champs.items())
+
+    def verifier(v):
+        if v.__class__ is not dict:
+            return True
+        for nom, verifier_champ in champs:
+            if nom in v and not verifier_champ(v[nom]):
+                return False
+        return True
+    return verifier
+
+
+def compiler_tout(verifications):
+    """
+    Combine les vérifications des mots-clés d'un schéma : la valeur doit toutes les passer.
+    """
+    if len(verifications) == 1:
+        return verifications[0]
+    if len(verifications) == 2:
+        premiere, seconde = verifications
+        return lambda v: premiere(v) and seconde(v)
+
+    def verifier(v):
+        for verification in verifications:
+            if not verification(v):
+                return False
+        return True
+    return verifier
+
+
+@lru_cache(maxsize=None)
+def verificateur():
+    """
+    Compile le schéma des enregistrements en une fonction Python, une seule fois par processus.
+
+    Return :
+    --------
+    callable
+        Une fonction enregistrement -> bool, équivalente à validateur().is_valid.
+    """
+    validateur()
+    return compiler_schema(SCHEMA_FESTIVAL)
+
+
+def raisons(erreur):
+    """
+    Décrit une erreur de validation : le chemin du champ fautif et le message.
+
+    Args :
+    --------
+    erreur : jsonschema.ValidationError
+        L'erreur de validation.
+
+    Return :
+    --------
+    str
+        Par exemple « geocodage_xy : None is not of type 'object' ».
+    """
+    chemin = "/".join(str(partie) for partie in erreur.absolute_path) or "(enregistrement)"
+    return f"{chemin} : {erreur.message}"
+
+
+def valider_lot(enregistrements, debut=0):
+    """
+    Valide un lot d'enregistrements.
+
+    Chaque enregistrement est vérifié par le schéma compilé (voir compiler_schema) ; toutes
+    les erreurs ne sont listées, avec jsonschema, que pour les enregistrements invalides.
+
+    Args :
+    --------
+    enregistrements : list[dict]
+        Les enregistrements bruts du lot.
+    debut : int
+        La position du premier enregistrement du lot dans l'export.
+
+    Return :
+    --------
+    tuple[list[int], list[dict]]
+        Les positions des enregistrements valides, et pour chaque enregistrement invalide
+        sa position ('index'), l'enregistrement et la liste de ses 'raisons'.
+    """
+    est_valide = verificateur()
+    valides, invalides = [], []
+    for position, enregistrement in enumerate(enregistrements, start=debut):
+        if est_valide(enregistrement):
+            valides.append(position)
+        else:
+            invalides.append({
+                "index": position,
+                "raisons": sorted(raisons(e) for e in validateur().iter_errors(enregistrement)),
+                "enregistrement": enregistrement,
+            })
+    return valides, invalides
+
+
+def valider_enregistrements(enregistrements, taille_lot=TAILLE_LOT_VALIDATION, nb_processus=1):
+    """
+    Valide les enregistrements bruts par lots, en parallèle si nb_processus > 1.
+
+    Chaque processus compile le schéma une fois puis valide des lots entiers, pour que le
+    coût d'envoi des lots reste faible devant celui de la validation.
+
+    Args :
+    --------
+    enregistrements : list[dict]
+        Les enregistrements bruts de l'export.
+    taille_lot : int
+        Le nombre d'enregistrements par lot.
+    nb_processus : int
+        Le nombre de processus de validation.
+
+    Return :
+    --------
+    tuple[list[dict], list[dict]]
+        Les enregistrements valides, dans l'ordre de l'export, et les enregistrements mis
+        en quarantaine avec leurs raisons.
+    """
+    lots = [(enregistrements[debut:debut + taille_lot], debut) for debut in range(0, len(enregistrements), taille_lot)]
+    if nb_processus > 1 and len(lots) > 1:
+        with ProcessPoolExecutor(max_workers=nb_processus) as executeur:
+            resultats = list(executeur.map(valider_lot, *zip(*lots)))
+    else:
+        resultats = [valider_lot(lot, debut) for lot, debut in lots]
+    valides = [enregistrements[position] for positions, _ in resultats for position in positions]
+    quarantaine = [invalide for _, invalides in resultats for invalide in invalides]
+    return valides, quarantaine
+
+
+def ecrire_quarantaine(quarantaine, chemin=CHEMIN_QUARANTAINE):
+    """
+    Écrit les enregistrements mis en quarantaine, un objet JSON par ligne.
+
+    Args :
+    --------
+    quarantaine : list[dict]
+        Les enregistrements invalides retournés par valider_enregistrements.
+    chemin : str
+        Le fichier JSON Lines de quarantaine, remplacé à chaque validation.
+
+    Return :
+    --------
+    None
+    """
+    with open(chemin + ".tmp", "w", encoding="utf-8") as f:
+        for invalide in quarantaine:
+            f.write(json.dumps(invalide, ensure_ascii=False) + "\n")
+    os.replace(chemin + ".tmp", chemin)
+    logging.info(f"{len(quarantaine)} enregistrements mis en quarantaine dans {chemin}.")
@@ -1,10 +1,22 @@
 import sqlite3
 import csv
 import os
+import sys
 from dotenv import load_dotenv
 
+try:
+    from festival_api.database.migration import migrer
+except ImportError:  # lancé directement depuis database_building/
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from festival_api.database.migration import migrer
+from festival_api.database.periodes import jours_periode
+
 load_dotenv()
 
+# Nombre de lignes lues et insérées à la fois depuis le fichier de données
+TAILLE_LOT = 1024
+DOSSIER_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+
 def get_periode_id(cur, periode_value):
     """
     Récupère l'ID de la période donnée à partir de la base de données.
@@ -61,49 +73,186 @@ def get_adresse_id(cur, adresse_postale, code_insee):
     else:
         return None
 
-def main():
+def get_festival_id(cur, nom_festival, adresse_id, categorie_id, periode_id, annee_creation, site_internet):
     """
-    Exécute le script principal pour insérer des données de festivals dans une base de données SQLite.
+    Récupère l'ID d'un festival identique (mêmes nom, adresse, catégorie, période, année de création
+    et site internet) déjà présent dans la base de données.
 
-    Cette fonction lit les variables d'environnement pour obtenir les chemins vers la base de données
-    et le fichier CSV, puis insère les données du CSV dans la base de données en vérifiant et en
-    insérant les entrées nécessaires dans les tables associées.
+    Args:
+        cur (sqlite3.Cursor): Le curseur de la base de données.
+        nom_festival (str): Le nom du festival.
+        adresse_id (int): L'ID de son adresse.
+        categorie_id (int): L'ID de sa catégorie.
+        periode_id (int): L'ID de sa période.
+        annee_creation (int): Son année de création.
+        site_internet (str): Son site internet.
 
     Returns:
-        None
+        int: L'ID du festival s'il existe, sinon None.
     """
-    chemin_bdd = os.getenv('CHEMIN_BDD')
-    chemin_csv = os.getenv('CHEMIN_CSV')
+    # Le + unaire écarte les index de la catégorie et de la période, bien moins sélectifs que celui de l'adresse et du nom
+    cur.execute("SELECT ID_Festival FROM FESTIVAL WHERE ID_Adresse = ? AND Nom_Festival = ? AND +ID_Categorie IS ? "
+                "AND +ID_Periode IS ? AND Annee_Creation IS ? AND Site_Internet IS ?",
+                (adresse_id, nom_festival, categorie_id, periode_id, annee_creation, site_internet))
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    else:
+        return None
 
-    conn = sqlite3.connect(chemin_bdd)
-    cur = conn.cursor()
+def lire_lots(chemin_donnees, taille_lot=TAILLE_LOT):
+    """
+    Lit le fichier de données nettoyées par lots de lignes.
+
+    Un fichier '.parquet' est lu en flux par record batches avec pyarrow : les valeurs
+    arrivent déjà typées (entiers, flottants, None pour les valeurs manquantes) sans
+    analyse de texte. Tout autre fichier est lu comme un CSV avec csv.DictReader.
+
+    Args:
+        chemin_donnees (str): Le chemin du fichier Parquet ou CSV.
+        taille_lot (int): Le nombre de lignes par lot.
+
+    Yields:
+        list[dict]: Un lot de lignes, chaque ligne étant un dictionnaire colonne -> valeur.
+    """
+    if chemin_donnees.endswith('.parquet'):
+        import pyarrow.parquet as pq
+
+        fichier = pq.ParquetFile(chemin_donnees)
+        for lot in fichier.iter_batches(batch_size=taille_lot):
+            yield lot.to_pylist()
+        return
+
+    with open(chemin_donnees, 'r', encoding='utf-8') as csvfile:
+        lot = []
+        for row in csv.DictReader(csvfile):
+            lot.append(row)
+            if len(lot) == taille_lot:
+                yield lot
+                lot = []
+        if lot:
+            yield lot
+
+def inserer_lot(cur, lot):
+    """
+    Insère un lot de lignes de festivals dans la base de données.
+
+    Pour chaque ligne, l'adresse, la période et la catégorie sont réutilisées si elles
+    existent déjà, sinon elles sont créées, puis le festival est inséré s'il n'est pas déjà
+    présent à l'identique : relancer l'insertion du même fichier n'ajoute aucun festival.
+
+    Args:
+        cur (sqlite3.Cursor): Le curseur de la base de données.
+        lot (list[dict]): Les lignes à insérer.
 
-    with open(chemin_csv, 'r', encoding='utf-8') as csvfile:
-        print("Début de l'insertion des données dans la base de données")
-        csv_reader = csv.DictReader(csvfile)
+    Returns:
+        int: Le nombre de festivals insérés.
+    """
+    inseres = 0
+    for row in lot:
+        adresse_id = get_adresse_id(cur, row['Adresse_Postale'], row['Code_INSEE'])
+
+        if adresse_id is None:
+            cur.execute("INSERT INTO ADRESSE (Adresse_Postale, Code_INSEE, Region, Departement, Commune, Longitude, Latitude) VALUES (?, ?, ?, ?, ?, ?, ?)", (row['Adresse_Postale'], row['Code_INSEE'], row['Region'], row['Departement'], row['Commune'], row['Longitude'], row['Latitude']))
+            adresse_id = cur.lastrowid
+
+        periode_id = get_periode_id(cur, row['Periode'])
+        if periode_id is None:
+            # Les fichiers nettoyés avant l'ajout des jours n'ont pas ces colonnes : ils sont calculés ici
+            if 'Jour_Debut' in row:
+                jours = (row['Jour_Debut'] or None, row['Jour_Fin'] or None)
+            else:
+                jours = jours_periode(row['Periode'])
+            cur.execute("INSERT INTO PERIODE (Periode, Categorie_Periode, Jour_Debut, Jour_Fin) VALUES (?, ?, ?, ?)", (row['Periode'], row['Categorie_Periode'], *jours))
+            periode_id = cur.lastrowid
 
-        for row in csv_reader:
-            adresse_id = get_adresse_id(cur, row['Adresse_Postale'], row['Code_INSEE'])
+        categorie_id = get_categorie_id(cur, row['Discipline_Principale'], row['Sous_Categorie'])
+        if categorie_id is None:
+            cur.execute("INSERT INTO CATEGORIE (Discipline_Dominante, Sous_Categorie) VALUES (?, ?)", (row['Discipline_Principale'], row['Sous_Categorie']))
+            categorie_id = cur.lastrowid
 
-            if adresse_id is None:
-                cur.execute("INSERT INTO ADRESSE (Adresse_Postale, Code_INSEE, Region, Departement, Commune, Longitude, Latitude) VALUES (?, ?, ?, ?, ?, ?, ?)", (row['Adresse_Postale'], row['Code_INSEE'], row['Region'], row['Departement'], row['Commune'], row['Longitude'], row['Latitude']))
-                adresse_id = cur.lastrowid
+        if get_festival_id(cur, row['Nom_Festival'], adresse_id, categorie_id, periode_id, row['Annee_Creation'], row['Site_Internet']) is not None:
+            continue
+        cur.execute("INSERT INTO FESTIVAL (ID_Periode, ID_Categorie, ID_Adresse, Nom_Festival, Annee_Creation, Site_Internet) VALUES (?, ?, ?, ?, ?, ?)", (periode_id, categorie_id, adresse_id, row['Nom_Festival'], row['Annee_Creation'], row['Site_Internet']))
+        inseres += 1
+    return inseres
 
-            periode_id = get_periode_id(cur, row['Periode'])
-            if periode_id is None:
-                cur.execute("INSERT INTO PERIODE (Periode, Categorie_Periode) VALUES (?, ?)", (row['Periode'], row['Categorie_Periode']))
-                periode_id = cur.lastrowid
+def reconstruire_festival_flat(conn):
+    """
+    Reconstruit en une fois la table dénormalisée FESTIVAL_FLAT, puis installe les triggers
+    qui la tiennent à jour lors des écritures suivantes.
 
-            categorie_id = get_categorie_id(cur, row['Discipline_Principale'], row['Sous_Categorie'])
-            if categorie_id is None:
-                cur.execute("INSERT INTO CATEGORIE (Discipline_Dominante, Sous_Categorie) VALUES (?, ?)", (row['Discipline_Principale'], row['Sous_Categorie']))
-                categorie_id = cur.lastrowid
+    Appelée après le chargement en masse : les triggers ne sont donc pas déclenchés ligne
+    par ligne pendant l'insertion.
 
-            cur.execute("INSERT INTO FESTIVAL (ID_Periode, ID_Categorie, ID_Adresse, Nom_Festival, Annee_Creation, Site_Internet) VALUES (?, ?, ?, ?, ?, ?)", (periode_id, categorie_id, adresse_id, row['Nom_Festival'], row['Annee_Creation'], row['Site_Internet']))
-        print("Données insérées avec succès dans la base de données")
+    Args:
+        conn (sqlite3.Connection): La connexion à la base de données.
 
+    Returns:
+        None
+    """
+    for script in ("script_festival_flat.sql", "reconstruction_festival_flat.sql"):
+        with open(os.path.join(DOSSIER_SCRIPTS, script), 'r', encoding='utf-8') as f:
+            conn.executescript(f.read())
     conn.commit()
 
+def charger(conn, chemin_donnees):
+    """
+    Charge un fichier de festivals nettoyés dans une base existante, en place.
+
+    Le schéma n'est créé que s'il manque et les tables existantes sont migrées, les festivals déjà présents ne sont pas réinsérés,
+    et les autres tables (utilisateurs, jetons, journal des changements) comme les festivals
+    créés par l'API sont conservés. Les insertions sont validées en une seule transaction :
+    en cas d'erreur, la base reste dans son état précédent. FESTIVAL_FLAT est ensuite
+    reconstruite et les festivals similaires recalculés.
+
+    Args:
+        conn (sqlite3.Connection): La connexion à la base de données.
+        chemin_donnees (str): Le fichier Parquet ou CSV des festivals nettoyés.
+
+    Returns:
+        int: Le nombre de festivals insérés.
+    """
+    # Le schéma n'est créé que s'il manque (bases créées avant l'index des festivals comprises),
+    # puis les colonnes ajoutées depuis sont ajoutées aux tables existantes
+    with open(os.path.join(DOSSIER_SCRIPTS, "script_sqlite.sql"), 'r', encoding='utf-8') as f:
+        conn.executescript(f.read())
+    migrer(conn)
+    cur = conn.cursor()
+    inseres = 0
+    try:
+        for lot in lire_lots(chemin_donnees):
+            inseres += inserer_lot(cur, lot)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    reconstruire_festival_flat(conn)
+    try:
+        from database_building.similarite import calculer_similaires
+    except ImportError:  # lancé directement depuis database_building/
+        from similarite import calculer_similaires
+    calculer_similaires(conn)
+    return inseres
+
+def main():
+    """
+    Exécute le script principal pour insérer des données de festivals dans une base de données SQLite.
+
+    Cette fonction lit les variables d'environnement pour obtenir les chemins vers la base de données
+    et le fichier de données (Parquet via CHEMIN_PARQUET s'il est défini, sinon le CSV de CHEMIN_CSV),
+    puis charge les données dans la base existante (voir charger).
+
+    Returns:
+        None
+    """
+    chemin_bdd = os.getenv('CHEMIN_BDD')
+    chemin_donnees = os.getenv('CHEMIN_PARQUET') or os.getenv('CHEMIN_CSV')
+
+    conn = sqlite3.connect(chemin_bdd)
+    print("Début de l'insertion des données dans la base de données")
+    inseres = charger(conn, chemin_donnees)
+    print(f"{inseres} festivals insérés avec succès dans la base de données")
     conn.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,7 @@
+-- Reconstruction complète de FESTIVAL_FLAT, après un chargement en masse
+-- Dans une transaction : une lecture concurrente ne voit jamais la table vide
+
+BEGIN;
+DELETE FROM FESTIVAL_FLAT;
+INSERT INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET;
+COMMIT;
@@ -0,0 +1,80 @@
+-- Script SQL pour créer la table dénormalisée FESTIVAL_FLAT et les triggers qui la tiennent à jour
+
+-- Vue d'un festival complet, une ligne par festival
+CREATE VIEW IF NOT EXISTS FESTIVAL_COMPLET AS
+SELECT f.ID_Festival, f.Nom_Festival, f.Annee_Creation, f.Site_Internet,
+       f.ID_Adresse, a.Adresse_Postale, a.Code_INSEE, a.Region, a.Departement, a.Commune, a.Longitude, a.Latitude,
+       f.ID_Categorie, c.Discipline_Dominante, c.Sous_Categorie,
+       f.ID_Periode, p.Periode, p.Categorie_Periode, p.Jour_Debut, p.Jour_Fin
+FROM FESTIVAL f
+LEFT JOIN ADRESSE a ON f.ID_Adresse = a.ID_Adresse
+LEFT JOIN CATEGORIE c ON f.ID_Categorie = c.ID_Categorie
+LEFT JOIN PERIODE p ON f.ID_Periode = p.ID_Periode;
+
+-- Création de la table FESTIVAL_FLAT
+CREATE TABLE IF NOT EXISTS FESTIVAL_FLAT (
+    ID_Festival INTEGER PRIMARY KEY,
+    Nom_Festival TEXT,
+    Annee_Creation INTEGER,
+    Site_Internet TEXT,
+    ID_Adresse INTEGER,
+    Adresse_Postale TEXT,
+    Code_INSEE TEXT,
+    Region TEXT,
+    Departement TEXT,
+    Commune TEXT,
+    Longitude REAL,
+    Latitude REAL,
+    ID_Categorie INTEGER,
+    Discipline_Dominante TEXT,
+    Sous_Categorie TEXT,
+    ID_Periode INTEGER,
+    Periode TEXT,
+    Categorie_Periode TEXT,
+    Jour_Debut INTEGER,
+    Jour_Fin INTEGER
+);
+
+-- Index des clés étrangères, pour retrouver les festivals d'une adresse, catégorie ou période modifiée
+CREATE INDEX IF NOT EXISTS IDX_FESTIVAL_ADRESSE ON FESTIVAL (ID_Adresse);
+CREATE INDEX IF NOT EXISTS IDX_FESTIVAL_CATEGORIE ON FESTIVAL (ID_Categorie);
+CREATE INDEX IF NOT EXISTS IDX_FESTIVAL_PERIODE ON FESTIVAL (ID_Periode);
+
+-- Triggers sur FESTIVAL
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_INSERT AFTER INSERT ON FESTIVAL BEGIN
+    INSERT OR REPLACE INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET WHERE ID_Festival = NEW.ID_Festival;
+END;
+
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_UPDATE AFTER UPDATE ON FESTIVAL BEGIN
+    DELETE FROM FESTIVAL_FLAT WHERE ID_Festival = OLD.ID_Festival;
+    INSERT OR REPLACE INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET WHERE ID_Festival = NEW.ID_Festival;
+END;
+
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_DELETE AFTER DELETE ON FESTIVAL BEGIN
+    DELETE FROM FESTIVAL_FLAT WHERE ID_Festival = OLD.ID_Festival;
+END;
+
+-- Triggers sur les tables liées : les festivals qui les référencent sont recopiés
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_ADRESSE_UPDATE AFTER UPDATE ON ADRESSE BEGIN
+    INSERT OR REPLACE INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET WHERE ID_Adresse = NEW.ID_Adresse;
+END;
+
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_ADRESSE_DELETE AFTER DELETE ON ADRESSE BEGIN
+    INSERT OR REPLACE INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET WHERE ID_Adresse = OLD.ID_Adresse;
+END;
+
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_CATEGORIE_UPDATE AFTER UPDATE ON CATEGORIE BEGIN
+    INSERT OR REPLACE INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET WHERE ID_Categorie = NEW.ID_Categorie;
+END;
+
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_CATEGORIE_DELETE AFTER DELETE ON CATEGORIE BEGIN
+    INSERT OR REPLACE INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET WHERE ID_Categorie = OLD.ID_Categorie;
+END;
+
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_PERIODE_UPDATE AFTER UPDATE ON PERIODE BEGIN
+    INSERT OR REPLACE INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET WHERE ID_Periode = NEW.ID_Periode;
+END;
+
+CREATE TRIGGER IF NOT EXISTS FESTIVAL_FLAT_PERIODE_DELETE AFTER DELETE ON PERIODE BEGIN
+    INSERT OR REPLACE INTO FESTIVAL_FLAT SELECT * FROM FESTIVAL_COMPLET WHERE ID_Periode = OLD.ID_Periode;
+END;
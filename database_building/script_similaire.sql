@@ -0,0 +1,12 @@
+-- Script SQL pour créer la table SIMILAIRE des festivals voisins précalculés
+
+-- Les K festivals les plus proches de chaque festival, rangés du plus au moins similaire.
+-- La clé primaire (ID_Festival, Rang) range les voisins d'un festival ensemble sur le disque :
+-- les lire est une seule recherche dans l'arbre de la table.
+CREATE TABLE IF NOT EXISTS SIMILAIRE (
+    ID_Festival INTEGER NOT NULL,
+    Rang INTEGER NOT NULL,
+    ID_Similaire INTEGER NOT NULL,
+    Score REAL NOT NULL,
+    PRIMARY KEY (ID_Festival, Rang)
+) WITHOUT ROWID;
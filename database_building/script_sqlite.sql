@@ -4,7 +4,9 @@
 CREATE TABLE IF NOT EXISTS PERIODE (
     ID_Periode INTEGER PRIMARY KEY AUTOINCREMENT,
     Periode TEXT    ,
-    Categorie_Periode TEXT
+    Categorie_Periode TEXT,
+    Jour_Debut INTEGER,
+    Jour_Fin INTEGER
 );
 
 -- Création de la table CATEGORIE
@@ -41,3 +43,6 @@ CREATE TABLE IF NOT EXISTS FESTIVAL (
 );
 
 
+-- Index utilisé par le script d'insertion pour ne pas insérer deux fois le même festival
+CREATE INDEX IF NOT EXISTS IDX_FESTIVAL_ADRESSE_NOM ON FESTIVAL (ID_Adresse, Nom_Festival);
+CREATE INDEX IF NOT EXISTS IDX_ADRESSE_POSTALE_INSEE ON ADRESSE (Adresse_Postale, Code_INSEE);
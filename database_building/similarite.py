@@ -0,0 +1,200 @@
+import math
+import os
+import re
+import sqlite3
+import unicodedata
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DOSSIER_SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+# Nombre de voisins précalculés par festival
+K_SIMILAIRES = 20
+# Poids de la similarité des catégories et de la proximité géographique dans le score
+POIDS_TEXTE = 0.6
+POIDS_GEO = 0.4
+# Distance en kilomètres à laquelle la proximité géographique vaut 1/e
+ECHELLE_KM = 50.0
+RAYON_TERRE_KM = 6371.0
+# Nombre de lignes de la matrice des scores calculées à la fois
+TAILLE_BLOC = 1024
+_SEPARATEURS = re.compile(r"[^0-9a-z]+")
+
+
+def jetons(champ, texte):
+    """
+    Découpe un texte en mots sans accents ni majuscules, préfixés par le nom du champ.
+
+    Args:
+        champ (str): Le nom du champ, pour ne pas confondre un mot de la discipline et de la sous-catégorie.
+        texte (str): Le texte à découper.
+
+    Returns:
+        set: Les jetons du texte.
+    """
+    if not texte:
+        return set()
+    sans_accents = "".join(c for c in unicodedata.normalize("NFKD", texte.lower()) if not unicodedata.combining(c))
+    return {f"{champ}:{mot}" for mot in _SEPARATEURS.split(sans_accents) if mot}
+
+
+def coordonnee(valeur):
+    """
+    Convertit une latitude ou une longitude lue en base en flottant.
+
+    Args:
+        valeur: La valeur lue (nombre, texte vide si chargée depuis le CSV, ou None).
+
+    Returns:
+        float: La coordonnée, NaN si elle est inconnue.
+    """
+    try:
+        return float(valeur)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def matrice_tfidf(documents):
+    """
+    Construit la matrice TF-IDF normalisée (une ligne par festival) de listes de jetons.
+
+    Args:
+        documents (list[set]): Les jetons de chaque festival.
+
+    Returns:
+        numpy.ndarray: La matrice de taille (festivals, vocabulaire), lignes de norme 1 ou nulles.
+    """
+    import numpy as np
+
+    vocabulaire = {}
+    for document in documents:
+        for jeton in document:
+            vocabulaire.setdefault(jeton, len(vocabulaire))
+    lignes = [i for i, document in enumerate(documents) for _ in document]
+    colonnes = [vocabulaire[jeton] for document in documents for jeton in document]
+    matrice = np.zeros((len(documents), max(1, len(vocabulaire))), dtype=np.float32)
+    matrice[lignes, colonnes] = 1.0
+    frequence = matrice.sum(axis=0)
+    matrice *= (np.log(len(documents) / np.maximum(frequence, 1)) + 1).astype(np.float32)
+    normes = np.linalg.norm(matrice, axis=1, keepdims=True)
+    return matrice / np.where(normes > 0, normes, 1)
+
+
+def vecteurs_unitaires(latitudes, longitudes):
+    """
+    Convertit des coordonnées en vecteurs unitaires de la sphère, pour obtenir l'angle entre deux
+    points par un simple produit scalaire. Un point sans coordonnées donne le vecteur nul.
+
+    Args:
+        latitudes (numpy.ndarray): Les latitudes en degrés (NaN si inconnues).
+        longitudes (numpy.ndarray): Les longitudes en degrés (NaN si inconnues).
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: Les vecteurs (festivals, 3) et le masque des points connus.
+    """
+    import numpy as np
+
+    connus = ~(np.isnan(latitudes) | np.isnan(longitudes))
+    lat, lon = np.radians(np.nan_to_num(latitudes)), np.radians(np.nan_to_num(longitudes))
+    vecteurs = np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+    vecteurs[~connus] = 0
+    return vecteurs, connus
+
+
+def voisins(texte, vecteurs, connus, k=K_SIMILAIRES, taille_bloc=TAILLE_BLOC):
+    """
+    Calcule les k voisins les plus similaires de chaque festival, bloc de lignes par bloc de lignes
+    pour ne jamais tenir en mémoire la matrice complète des scores.
+
+    Le score d'un couple est POIDS_TEXTE × cosinus TF-IDF + POIDS_GEO × exp(-distance / ECHELLE_KM).
+
+    Args:
+        texte (numpy.ndarray): La matrice TF-IDF normalisée.
+        vecteurs (numpy.ndarray): Les vecteurs unitaires des positions.
+        connus (numpy.ndarray): Le masque des festivals dont la position est connue.
+        k (int): Le nombre de voisins par festival.
+        taille_bloc (int): Le nombre de lignes calculées à la fois.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: Les indices des voisins et leurs scores, de taille (festivals, k).
+    """
+    import numpy as np
+
+    n = len(texte)
+    k = min(k, n - 1)
+    indices = np.empty((n, max(k, 0)), dtype=np.int64)
+    scores = np.empty((n, max(k, 0)), dtype=np.float32)
+    if k <= 0:
+        return indices, scores
+    for debut in range(0, n, taille_bloc):
+        fin = min(n, debut + taille_bloc)
+        bloc = POIDS_TEXTE * (texte[debut:fin] @ texte.T)
+        cosinus = np.clip(vecteurs[debut:fin] @ vecteurs.T, -1.0, 1.0)
+        proximite = np.exp(-RAYON_TERRE_KM * np.arccos(cosinus) / ECHELLE_KM)
+        proximite[~connus[debut:fin]] = 0
+        proximite[:, ~connus] = 0
+        bloc += POIDS_GEO * proximite
+        bloc[np.arange(fin - debut), np.arange(debut, fin)] = -np.inf
+        meilleurs = np.argpartition(-bloc, k - 1, axis=1)[:, :k]
+        meilleurs_scores = np.take_along_axis(bloc, meilleurs, axis=1)
+        ordre = np.argsort(-meilleurs_scores, axis=1, kind="stable")
+        indices[debut:fin] = np.take_along_axis(meilleurs, ordre, axis=1)
+        scores[debut:fin] = np.take_along_axis(meilleurs_scores, ordre, axis=1)
+    return indices, scores
+
+
+def calculer_similaires(conn, k=K_SIMILAIRES):
+    """
+    Recalcule la table SIMILAIRE : les k festivals les plus proches de chaque festival par leurs
+    catégories et leur position. Appelée après chaque chargement des données.
+
+    Args:
+        conn (sqlite3.Connection): La connexion à la base de données.
+        k (int): Le nombre de voisins par festival.
+
+    Returns:
+        int: Le nombre de lignes écrites dans SIMILAIRE.
+    """
+    import numpy as np
+
+    with open(os.path.join(DOSSIER_SCRIPTS, "script_similaire.sql"), 'r', encoding='utf-8') as f:
+        conn.executescript(f.read())
+    lignes = conn.execute(
+        "SELECT f.ID_Festival, c.Discipline_Dominante, c.Sous_Categorie, a.Latitude, a.Longitude "
+        "FROM FESTIVAL f "
+        "LEFT JOIN CATEGORIE c ON f.ID_Categorie = c.ID_Categorie "
+        "LEFT JOIN ADRESSE a ON f.ID_Adresse = a.ID_Adresse "
+        "ORDER BY f.ID_Festival").fetchall()
+    ids = np.array([ligne[0] for ligne in lignes], dtype=np.int64)
+    texte = matrice_tfidf([jetons("discipline", ligne[1]) | jetons("sous_categorie", ligne[2]) for ligne in lignes])
+    coordonnees = np.array([[coordonnee(ligne[3]), coordonnee(ligne[4])] for ligne in lignes],
+                           dtype=np.float64).reshape(-1, 2)
+    vecteurs, connus = vecteurs_unitaires(coordonnees[:, 0], coordonnees[:, 1])
+    indices, scores = voisins(texte, vecteurs, connus, k)
+
+    conn.execute("DELETE FROM SIMILAIRE")
+    rangs = np.broadcast_to(np.arange(indices.shape[1]), indices.shape)
+    conn.executemany(
+        "INSERT INTO SIMILAIRE (ID_Festival, Rang, ID_Similaire, Score) VALUES (?, ?, ?, ?)",
+        zip(np.repeat(ids, indices.shape[1]).tolist(), rangs.ravel().tolist(),
+            ids[indices].ravel().tolist(), np.round(scores, 4).ravel().tolist()))
+    conn.commit()
+    return indices.size
+
+
+def main():
+    """
+    Recalcule les festivals similaires de la base désignée par CHEMIN_BDD, par exemple après
+    des modifications faites par l'API.
+
+    Returns:
+        None
+    """
+    conn = sqlite3.connect(os.getenv('CHEMIN_BDD'))
+    print(f"{calculer_similaires(conn)} voisins calculés")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
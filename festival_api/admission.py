@@ -0,0 +1,220 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+# Budgets par classe de requêtes : (rafale maximale, jetons rendus par seconde)
+BUDGETS = {
+    "lecture": (100, 50.0),
+    "ecriture": (20, 5.0),
+    "connexion": (5, 5 / 60),
+}
+# Nombre de clients suivis ; les moins récents sont oubliés au-delà
+MAX_CLIENTS = 10_000
+# Nombre de requêtes traitées en même temps au-delà duquel les nouvelles sont refusées
+MAX_EN_COURS = 256
+# Durée au-delà de laquelle la plus rapide des requêtes d'un intervalle signale une file installée
+DUREE_CIBLE = 0.1
+INTERVALLE_SURVEILLANCE = 0.2
+# Chemins jamais limités
+CHEMINS_EXEMPTES = ("/metrics",)
+
+
+class SeauJetons:
+    """
+    Seau à jetons : jusqu'à `capacite` requêtes d'affilée, puis `debit` requêtes par seconde.
+    """
+
+    __slots__ = ("capacite", "debit", "jetons", "dernier")
+
+    def __init__(self, capacite: float, debit: float):
+        self.capacite = capacite
+        self.debit = debit
+        self.jetons = capacite
+        self.dernier = time.monotonic()
+
+    def prendre(self) -> float:
+        """
+        Prend un jeton. Retourne 0 si la requête est admise, sinon le délai en secondes avant
+        qu'un jeton soit disponible.
+        """
+        maintenant = time.monotonic()
+        self.jetons = min(self.capacite, self.jetons + (maintenant - self.dernier) * self.debit)
+        self.dernier = maintenant
+        if self.jetons >= 1:
+            self.jetons -= 1
+            return 0.0
+        return (1 - self.jetons) / self.debit
+
+
+class LimiteurDebit:
+    """
+    Les seaux à jetons de chaque client et de chaque classe de requêtes, en mémoire.
+    Utilisé depuis la boucle d'événements seulement, il n'a pas besoin de verrou.
+    """
+
+    def __init__(self, budgets: Dict[str, Tuple[float, float]] = BUDGETS, max_clients: int = MAX_CLIENTS):
+        self.budgets = budgets
+        self.max_clients = max_clients
+        self.seaux: "OrderedDict[Tuple[str, str], SeauJetons]" = OrderedDict()
+
+    def prendre(self, classe: str, client: str) -> float:
+        seau = self.seaux.get((classe, client))
+        if seau is None:
+            seau = self.seaux[(classe, client)] = SeauJetons(*self.budgets[classe])
+            if len(self.seaux) > self.max_clients:
+                self.seaux.popitem(last=False)
+        else:
+            self.seaux.move_to_end((classe, client))
+        return seau.prendre()
+
+
+class SurveillanceCharge:
+    """
+    Détection de surcharge inspirée de CoDel : le nombre de requêtes en cours est plafonné, et la
+    plus courte durée des requêtes terminées pendant un intervalle est comparée à une cible. Si même
+    la plus rapide a dépassé la cible, une file d'attente s'est installée et ne se résorbera pas
+    seule : les nouvelles requêtes sont refusées jusqu'à ce qu'elle se vide. Une requête lente de
+    temps en temps ne suffit pas, tant qu'une autre a été servie rapidement dans l'intervalle.
+    Comme LimiteurDebit, elle n'est utilisée que depuis la boucle d'événements.
+    """
+
+    def __init__(self, max_en_cours: int = MAX_EN_COURS, cible: float = DUREE_CIBLE,
+                 intervalle: float = INTERVALLE_SURVEILLANCE):
+        self.max_en_cours = max_en_cours
+        self.cible = cible
+        self.intervalle = intervalle
+        self.en_cours = 0
+        self.surcharge = False
+        self.min_duree: Optional[float] = None
+        self.fin_intervalle = time.monotonic() + intervalle
+
+    def admettre(self) -> bool:
+        maintenant = time.monotonic()
+        if maintenant >= self.fin_intervalle:
+            self.surcharge = self.min_duree is not None and self.min_duree > self.cible
+            self.min_duree = None
+            self.fin_intervalle = maintenant + self.intervalle
+        if self.surcharge or self.en_cours >= self.max_en_cours:
+            return False
+        self.en_cours += 1
+        return True
+
+    def terminer(self, duree: float) -> None:
+        self.en_cours -= 1
+        if self.min_duree is None or duree < self.min_duree:
+            self.min_duree = duree
+
+
+def classe_requete(methode: str, chemin: str) -> str:
+    """
+    Cette fonction range une requête dans sa classe de budget : connexion, lecture ou écriture.
+    """
+    if chemin == "/auth/token":
+        return "connexion"
+    if methode in ("GET", "HEAD", "OPTIONS"):
+        return "lecture"
+    return "ecriture"
+
+
+@lru_cache(maxsize=4096)
+def _sujet_jeton(jeton: str) -> Optional[Tuple[str, float]]:
+    from jose import JWTError, jwt
+    try:
+        contenu = jwt.decode(jeton, os.getenv("SECRET_KEY"), algorithms=[os.getenv("ALGORITHM")])
+    except JWTError:
+        return None
+    if contenu.get("sub") is None:
+        return None
+    return contenu["sub"], contenu.get("exp", math.inf)
+
+
+def cle_client(scope) -> str:
+    """
+    Cette fonction identifie le client d'une requête : l'utilisateur de l'API si le jeton JWT est
+    valide (vérifié une seule fois par jeton), son adresse IP sinon.
+    """
+    for nom, valeur in scope["headers"]:
+        if nom == b"authorization":
+            autorisation = valeur.decode("latin-1")
+            if autorisation[:7].lower() == "bearer ":
+                sujet = _sujet_jeton(autorisation[7:])
+                if sujet is not None and sujet[1] > time.time():
+                    return f"utilisateur:{sujet[0]}"
+            break
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'inconnue'}"
+
+
+class MiddlewareAdmission:
+    """
+    Middleware ASGI du contrôle d'admission. Écrit directement en ASGI, sans BaseHTTPMiddleware,
+    pour qu'une requête refusée coûte le moins possible au serveur déjà surchargé.
+    """
+
+    def __init__(self, app, limiteur: LimiteurDebit, surveillance: SurveillanceCharge):
+        self.app = app
+        self.limiteur = limiteur
+        self.surveillance = surveillance
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in CHEMINS_EXEMPTES:
+            await self.app(scope, receive, send)
+            return
+
+        delai = self.limiteur.prendre(classe_requete(scope["method"], scope["path"]), cle_client(scope))
+        if delai:
+            reponse = JSONResponse({"detail": "Too many requests"}, status_code=429,
+                                   headers={"Retry-After": str(math.ceil(delai))})
+            await reponse(scope, receive, send)
+            return
+        if not self.surveillance.admettre():
+            reponse = JSONResponse({"detail": "Service overloaded"}, status_code=503, headers={"Retry-After": "1"})
+            await reponse(scope, receive, send)
+            return
+
+        debut = time.perf_counter()
+        terminee = False
+
+        async def envoyer(message):
+            nonlocal terminee
+            # La requête quitte la file dès le début de sa réponse (un flux SSE peut durer longtemps)
+            if message["type"] == "http.response.start" and not terminee:
+                terminee = True
+                self.surveillance.terminer(time.perf_counter() - debut)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, envoyer)
+        finally:
+            if not terminee:
+                self.surveillance.terminer(time.perf_counter() - debut)
+
+
+def activer_admission(app, limiteur: Optional[LimiteurDebit] = None,
+                      surveillance: Optional[SurveillanceCharge] = None):
+    """
+    Active le contrôle d'admission sur l'application.
+
+    Chaque client (utilisateur du jeton JWT, ou adresse IP) dispose d'un seau à jetons par classe
+    de requêtes (lectures, écritures, /auth/token) ; un client qui dépasse son budget reçoit 429
+    avec Retry-After, sans pénaliser les autres. Au-delà de `max_en_cours` requêtes simultanées,
+    ou quand une file d'attente s'est installée, les nouvelles requêtes reçoivent 503 avec
+    Retry-After, pour garder bornée la latence de celles qui sont acceptées.
+
+    Args:
+        app (FastAPI): L'application à protéger.
+        limiteur (LimiteurDebit): Les budgets par client, ceux de BUDGETS par défaut.
+        surveillance (SurveillanceCharge): La détection de surcharge, avec les seuils par défaut.
+
+    Returns:
+        Tuple[LimiteurDebit, SurveillanceCharge]: Le limiteur et la surveillance utilisés.
+    """
+    limiteur = limiteur or LimiteurDebit()
+    surveillance = surveillance or SurveillanceCharge()
+    app.add_middleware(MiddlewareAdmission, limiteur=limiteur, surveillance=surveillance)
+    return limiteur, surveillance
@@ -1,6 +1,4 @@
 from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 from .db_core import DBUsers, DBToken, NotFoundError, get_db
 from typing import Annotated, Optional
@@ -8,13 +6,11 @@ from pydantic import BaseModel, EmailStr
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from .db_authentification import get_user
+from .db_revocation import liste_revocation
+from ..profilage import mesurer_phase
 
-from dotenv import load_dotenv
 import os
 
-
-load_dotenv()
-
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv('ALGORITHM')
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
@@ -25,7 +21,8 @@ async def has_access(token: str = Depends(oauth2_scheme), session: Session = Dep
     
     Elle fonctionne comme suit :
     1. Elle essaie de décoder le token JWT fourni.
-    2. Si le décodage réussit, elle extrait le nom d'utilisateur du token.
+    2. Si le décodage réussit, elle extrait le nom d'utilisateur du token et vérifie que le
+       token n'a pas été révoqué (sans requête dans le cas courant, voir db_revocation).
     3. Elle vérifie ensuite si cet utilisateur existe dans la base de données.
     4. Si tout est en ordre, elle renvoie les informations de l'utilisateur.
     
@@ -41,14 +38,18 @@ async def has_access(token: str = Depends(oauth2_scheme), session: Session = Dep
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        db_user = get_user(username, session) 
-        if db_user is None:
+    from jose import JWTError, jwt
+    with mesurer_phase("auth"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+            if payload.get("jti") and liste_revocation.est_revoque(payload["jti"], session):
+                raise credentials_exception
+            db_user = get_user(username, session) 
+            if db_user is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except jwt.JWTError:
-        raise credentials_exception
     return db_user
\ No newline at end of file
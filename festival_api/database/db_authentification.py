@@ -1,21 +1,27 @@
+import secrets
+import uuid
 from datetime import datetime, timedelta, timezone
-from jose import JWTError, jwt
-from passlib.context import CryptContext
+from functools import lru_cache
+from sqlalchemy import lambda_stmt, select, update
 from sqlalchemy.orm import Session
 from .db_core import DBUsers, DBToken, NotFoundError, get_db
 from typing import Annotated, Optional
 from pydantic import BaseModel, EmailStr
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from dotenv import load_dotenv
 import os
+from .db_revocation import empreinte, liste_revocation
+from ..profilage import mesurer_phase
 
-load_dotenv()
 
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class UserCreate(BaseModel):
     username: str
@@ -33,8 +39,17 @@ class User(BaseModel):
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv('ALGORITHM')
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 7
+
+@lru_cache(maxsize=None)
+def contexte_mots_de_passe():
+    """
+    Cette fonction retourne le contexte de hachage des mots de passe. passlib et bcrypt ne sont
+    importés qu'au premier hachage, pour ne pas ralentir le démarrage de l'API.
+    """
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 def create_db_user(user: UserCreate, db: Session) -> DBUsers:
@@ -42,7 +57,7 @@ def create_db_user(user: UserCreate, db: Session) -> DBUsers:
     Cette fonction crée un nouvel utilisateur dans la base de données.
     C'est comme enregistrer un nouveau participant dans le grand livre du festival !
     """
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = contexte_mots_de_passe().hash(user.password)
     db_user = DBUsers(
         username=user.username,
         email=user.email,
@@ -59,26 +74,28 @@ def verify_password(plain_password, hashed_password):
     Cette fonction vérifie si le mot de passe en clair correspond au mot de passe haché.
     C'est comme vérifier si la clé d'un coffre-fort correspond à la bonne combinaison !
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return contexte_mots_de_passe().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     """
     Cette fonction crée un hachage du mot de passe en clair.
     C'est comme transformer une phrase en code secret pour protéger ton coffre-fort !
     """
-    return pwd_context.hash(password)
+    return contexte_mots_de_passe().hash(password)
 
 def get_user(username: str, db: Session) -> Optional[DBUsers]:
     """
-    Cette fonction récupère un utilisateur à partir du nom d'utilisateur.
+    Cette fonction récupère un utilisateur à partir du nom d'utilisateur, avec une requête
+    lambda_stmt compilée une seule fois (appelée à chaque requête authentifiée).
     C'est comme trouver une personne dans un annuaire par son nom !
     """
-    return db.query(DBUsers).filter(DBUsers.username == username).first()
+    return db.scalars(lambda_stmt(lambda: select(DBUsers).where(DBUsers.username == username).limit(1))).first()
 
 def authenticate_user(db: Session, username: str, password: str) -> Optional[DBUsers]:
-    user = get_user(username, db)
-    if not user or not verify_password(password, user.hashed_password):
-        return None
+    with mesurer_phase("auth"):
+        user = get_user(username, db)
+        if not user or not verify_password(password, user.hashed_password):
+            return None
     return user
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -88,9 +105,78 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # L'identifiant unique (jti) permet de révoquer ce jeton avant son expiration
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     to_encode.update({"exp": expire})
+    from jose import jwt
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def create_refresh_token(user_id: int, db: Session, family: Optional[str] = None) -> str:
+    """
+    Cette fonction crée un jeton de rafraîchissement, stocké en base sous forme d'empreinte.
+    C'est comme donner un bracelet pour ressortir et revenir sans repasser par la billetterie !
+    """
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    db.add(DBToken(token_type="refresh", token_hash=empreinte(token), expires_at=int(expires_at.timestamp()),
+                   revoked=False, family=family or uuid.uuid4().hex, user_id=user_id))
+    db.commit()
+    return token
+
+def revoke_refresh_family(family: str, db: Session) -> None:
+    """
+    Cette fonction révoque tous les jetons de rafraîchissement issus d'une même connexion.
+    """
+    db.query(DBToken).filter(DBToken.token_type == "refresh", DBToken.family == family) \
+        .update({DBToken.revoked: True}, synchronize_session=False)
+    db.commit()
+
+def revoke_refresh_token(refresh_token: str, user_id: int, db: Session) -> None:
+    """
+    Cette fonction révoque un jeton de rafraîchissement de l'utilisateur, avec toute sa famille.
+    """
+    db_token = db.query(DBToken).filter(DBToken.token_hash == empreinte(refresh_token),
+                                        DBToken.token_type == "refresh", DBToken.user_id == user_id).first()
+    if db_token is not None:
+        revoke_refresh_family(db_token.family, db)
+
+def rotate_refresh_token(refresh_token: str, db: Session) -> Optional[tuple]:
+    """
+    Cette fonction échange un jeton de rafraîchissement valide contre un nouveau, qui le remplace.
+    Un jeton déjà utilisé qui revient signale un vol : toute sa famille est alors révoquée.
+    Retourne l'utilisateur et le nouveau jeton, ou None si le jeton est refusé.
+    C'est comme échanger son bracelet contre celui du lendemain, l'ancien ne servant plus !
+    """
+    db_token = db.query(DBToken).filter(DBToken.token_hash == empreinte(refresh_token),
+                                        DBToken.token_type == "refresh").first()
+    if db_token is None:
+        return None
+    if db_token.revoked:
+        revoke_refresh_family(db_token.family, db)
+        return None
+    if db_token.expires_at <= datetime.now(timezone.utc).timestamp() or db_token.user.disabled:
+        return None
+    # La révocation conditionnelle est atomique : de deux rafraîchissements simultanés avec le même
+    # jeton, un seul le trouve encore valide, l'autre est traité comme une réutilisation
+    consomme = db.execute(update(DBToken).where(DBToken.id == db_token.id, DBToken.revoked == False)
+                          .values(revoked=True).execution_options(synchronize_session=False))
+    if consomme.rowcount == 0:
+        db.rollback()
+        revoke_refresh_family(db_token.family, db)
+        return None
+    return db_token.user, create_refresh_token(db_token.user_id, db, db_token.family)
+
+def revoke_access_token(token: str, db: Session) -> None:
+    """
+    Cette fonction révoque un jeton d'accès jusqu'à son expiration.
+    C'est comme barrer un badge perdu sur la liste du videur !
+    """
+    from jose import jwt
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    user = get_user(payload.get("sub"), db)
+    if payload.get("jti"):
+        liste_revocation.revoquer(payload["jti"], int(payload["exp"]), db, user.id if user else None)
+
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)) -> DBUsers:
     """
     Cette fonction récupère l'utilisateur actuel à partir du jeton d'accès.
@@ -101,15 +187,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    from jose import JWTError, jwt
+    with mesurer_phase("auth"):
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = get_user(username, db)
+        if payload.get("jti") and liste_revocation.est_revoque(payload["jti"], db):
+            raise credentials_exception
+
+        user = get_user(username, db)
     if user is None:
         raise credentials_exception
     return user
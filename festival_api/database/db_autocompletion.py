@@ -0,0 +1,199 @@
+import bisect
+import heapq
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from .db_index import IndexFestivals, obtenir_index, verrou_index
+
+# Nombre de réponses gardées en mémoire entre deux écritures
+TAILLE_CACHE = 4096
+TYPES = ("festival", "commune", "departement")
+# Les préfixes jusqu'à cette longueur ont leurs libellés déjà classés, les plus longs sont classés à la demande
+LONGUEUR_CLASSEE = 2
+_SEPARATEURS = re.compile(r"[^0-9a-z]+")
+
+
+class Suggestion(BaseModel):
+    libelle: str
+    type: str
+    nombre: int
+    id_festival: Optional[int] = None
+
+
+def plier(texte: str) -> str:
+    """
+    Cette fonction met un texte en minuscules sans accents ni ponctuation (« Fête-Dieu » → « fete dieu »).
+    C'est comme lire les affiches du festival sans se soucier des accents !
+    """
+    decompose = unicodedata.normalize("NFKD", texte.lower())
+    sans_accents = "".join(c for c in decompose if not unicodedata.combining(c))
+    return _SEPARATEURS.sub(" ", sans_accents).strip()
+
+
+def cles_libelle(libelle: str) -> List[str]:
+    """
+    Cette fonction retourne les clés d'un libellé : le libellé plié puis sa fin à partir de
+    chaque mot, pour qu'un préfixe trouve aussi « Jazz » dans « Nancy Jazz Pulsations ».
+    """
+    mots = plier(libelle).split()
+    return [" ".join(mots[i:]) for i in range(len(mots))]
+
+
+class IndexAutocompletion(IndexFestivals):
+    """
+    Index des préfixes des noms de festivals, des communes et des départements.
+
+    Les clés pliées sont gardées dans une liste triée : un préfixe est une recherche dichotomique
+    suivie d'un parcours des clés qui le commencent. Les préfixes courts, qui commencent une
+    grande partie des clés, ont en plus leurs libellés gardés dans l'ordre du classement : leurs
+    suggestions sont les premières entrées de la liste. Communes et départements n'ont qu'une
+    entrée par libellé, avec le nombre de festivals qui s'y déroulent.
+    """
+
+    def construire(self, lignes):
+        # (clé pliée, type, libellé, identifiant du festival ou 0, la clé est-elle le début du libellé)
+        self.cles: List[Tuple[str, str, str, int, bool]] = []
+        self.festivals: Dict[int, Tuple[str, str, str]] = {}
+        self.comptes: Dict[Tuple[str, str], int] = {}
+        # Réponses déjà calculées, par (préfixe plié, limite), oubliées à chaque écriture
+        self.cache: Dict[Tuple[str, int], List[Suggestion]] = {}
+        # Libellés des préfixes courts, triés par rang
+        self.classements: Dict[str, List[Tuple]] = {}
+        for ligne in lignes:
+            self._enregistrer(ligne)
+        self.cles.sort()
+        for id_festival, (nom, _, _) in self.festivals.items():
+            if nom:
+                self._classer_libelle("festival", nom, id_festival, 1)
+        for (type_libelle, libelle), nombre in self.comptes.items():
+            self._classer_libelle(type_libelle, libelle, 0, nombre)
+        for classement in self.classements.values():
+            classement.sort()
+
+    def _libelles(self, id_festival, nom, commune, departement):
+        return [("festival", nom, id_festival), ("commune", commune, 0), ("departement", departement, 0)]
+
+    def _classer_libelle(self, type_libelle, libelle, id_cle, nombre, trier=False, retirer=False):
+        # Une entrée par préfixe court des clés du libellé, avec le rang du libellé pour ce préfixe
+        plie = plier(libelle)
+        prefixes = {cle[:longueur] for cle in cles_libelle(libelle) for longueur in range(1, LONGUEUR_CLASSEE + 1)}
+        for prefixe in prefixes:
+            entree = (not plie.startswith(prefixe), -nombre, len(libelle), libelle, TYPES.index(type_libelle), id_cle)
+            classement = self.classements.setdefault(prefixe, [])
+            if retirer:
+                position = bisect.bisect_left(classement, entree)
+                if position < len(classement) and classement[position] == entree:
+                    del classement[position]
+                if not classement:
+                    del self.classements[prefixe]
+            elif trier:
+                bisect.insort(classement, entree)
+            else:
+                classement.append(entree)
+
+    def _enregistrer(self, ligne, trier=False):
+        id_festival = ligne["id_festival"]
+        self.festivals[id_festival] = (ligne["nom_festival"], ligne["commune"], ligne["departement"])
+        for type_libelle, libelle, id_cle in self._libelles(id_festival, *self.festivals[id_festival]):
+            if not libelle:
+                continue
+            if type_libelle != "festival":
+                compte = self.comptes.get((type_libelle, libelle), 0)
+                self.comptes[(type_libelle, libelle)] = compte + 1
+                if trier:
+                    # Le libellé change de rang avec son nombre de festivals
+                    if compte:
+                        self._classer_libelle(type_libelle, libelle, id_cle, compte, retirer=True)
+                    self._classer_libelle(type_libelle, libelle, id_cle, compte + 1, trier=True)
+                if compte:
+                    continue
+            elif trier:
+                self._classer_libelle(type_libelle, libelle, id_cle, 1, trier=True)
+            for i, cle in enumerate(cles_libelle(libelle)):
+                entree = (cle, type_libelle, libelle, id_cle, i == 0)
+                if trier:
+                    bisect.insort(self.cles, entree)
+                else:
+                    self.cles.append(entree)
+
+    def ajouter(self, ligne):
+        self.cache.clear()
+        self._enregistrer(ligne, trier=True)
+
+    def retirer(self, id_festival):
+        self.cache.clear()
+        valeurs = self.festivals.pop(id_festival, None)
+        if valeurs is None:
+            return
+        for type_libelle, libelle, id_cle in self._libelles(id_festival, *valeurs):
+            if not libelle:
+                continue
+            if type_libelle != "festival":
+                compte = self.comptes.pop((type_libelle, libelle)) - 1
+                self._classer_libelle(type_libelle, libelle, id_cle, compte + 1, retirer=True)
+                if compte:
+                    self.comptes[(type_libelle, libelle)] = compte
+                    self._classer_libelle(type_libelle, libelle, id_cle, compte, trier=True)
+                    continue
+            else:
+                self._classer_libelle(type_libelle, libelle, id_cle, 1, retirer=True)
+            for i, cle in enumerate(cles_libelle(libelle)):
+                entree = (cle, type_libelle, libelle, id_cle, i == 0)
+                position = bisect.bisect_left(self.cles, entree)
+                if position < len(self.cles) and self.cles[position] == entree:
+                    del self.cles[position]
+
+    def suggerer(self, prefixe: str, limite: int = 10) -> List[Suggestion]:
+        """
+        Retourne au plus limite suggestions pour le préfixe : d'abord les libellés qui commencent
+        par le préfixe, puis les communes et départements qui comptent le plus de festivals,
+        puis les libellés les plus courts.
+        """
+        prefixe = plier(prefixe)
+        if not prefixe:
+            return []
+        suggestions = self.cache.get((prefixe, limite))
+        if suggestions is None:
+            if len(self.cache) >= TAILLE_CACHE:
+                self.cache.clear()
+            suggestions = self.cache[(prefixe, limite)] = self._classer(prefixe, limite)
+        return suggestions
+
+    def _classer(self, prefixe, limite):
+        if len(prefixe) <= LONGUEUR_CLASSEE:
+            return [Suggestion(libelle=libelle, type=TYPES[type_index], nombre=-nombre,
+                               id_festival=id_cle if type_index == 0 else None)
+                    for _, nombre, _, libelle, type_index, id_cle in self.classements.get(prefixe, [])[:limite]]
+
+        # Toutes les clés du préfixe sont classées : une commune qui compte beaucoup de festivals
+        # passe devant, même loin dans l'ordre alphabétique. Les clés pliées ne contiennent que
+        # [0-9a-z ], donc toutes celles qui commencent par le préfixe sont avant prefixe + "~".
+        candidats = {}
+        debut_plage = bisect.bisect_left(self.cles, (prefixe,))
+        fin_plage = bisect.bisect_left(self.cles, (prefixe + "~",), debut_plage)
+        for _, type_libelle, libelle, id_cle, debut in self.cles[debut_plage:fin_plage]:
+            cle_candidat = (type_libelle, libelle, id_cle)
+            candidats[cle_candidat] = candidats.get(cle_candidat, False) or debut
+
+        def rang(candidat):
+            (type_libelle, libelle, id_cle), debut = candidat
+            nombre = self.comptes.get((type_libelle, libelle), 1)
+            return (not debut, -nombre, len(libelle), libelle, TYPES.index(type_libelle), id_cle)
+
+        return [Suggestion(libelle=libelle, type=type_libelle, nombre=self.comptes.get((type_libelle, libelle), 1),
+                           id_festival=id_cle if type_libelle == "festival" else None)
+                for (type_libelle, libelle, id_cle), _ in heapq.nsmallest(limite, candidats.items(), key=rang)]
+
+
+def read_suggestions(session: Session, prefixe: str, limite: int = 10) -> List[Suggestion]:
+    """
+    Cette fonction retourne les suggestions de festivals, communes et départements pour un début de saisie.
+    C'est comme un programme qui devine le concert que vous cherchez dès la première lettre !
+    """
+    index = obtenir_index(IndexAutocompletion, session)
+    with verrou_index:
+        return index.suggerer(prefixe, limite)
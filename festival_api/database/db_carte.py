@@ -0,0 +1,164 @@
+import heapq
+import math
+from typing import List, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from .db_index import IndexFestivals, obtenir_index, verrou_index
+
+ZOOM_MAX = 16
+# Une tuile de 256 pixels est découpée en 4 x 4 cellules de regroupement de 64 pixels
+CELLULES_PAR_TUILE = 4
+LATITUDE_MAX = 85.05112878
+
+
+class Cluster(BaseModel):
+    latitude: float
+    longitude: float
+    nombre: int
+    id_festival: int
+
+
+def projeter(latitude: float, longitude: float) -> Tuple[float, float]:
+    """
+    Cette fonction projette une coordonnée en Web Mercator normalisé (x et y entre 0 et 1).
+    C'est comme poser le festival sur la carte papier à la bonne place !
+    """
+    latitude = max(-LATITUDE_MAX, min(LATITUDE_MAX, latitude))
+    x = (longitude + 180) / 360
+    sin_lat = math.sin(math.radians(latitude))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+
+def coordonnee(valeur) -> float:
+    """
+    Cette fonction convertit une latitude ou une longitude lue en base en flottant : les bases
+    chargées depuis le CSV contiennent des textes vides à la place des coordonnées manquantes.
+    C'est comme vérifier que l'adresse du festival est bien lisible avant de la punaiser !
+    """
+    try:
+        return float(valeur)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class _Cellule:
+    __slots__ = ("ids", "somme_latitude", "somme_longitude", "tas")
+
+    def __init__(self):
+        self.ids = set()
+        self.somme_latitude = 0.0
+        self.somme_longitude = 0.0
+        # Tas des identifiants : le plus petit identifiant encore présent est le représentant.
+        # Les identifiants retirés n'en sortent que lorsqu'ils arrivent au sommet.
+        self.tas = []
+
+    def ajouter(self, id_festival):
+        self.ids.add(id_festival)
+        heapq.heappush(self.tas, id_festival)
+
+    def retirer(self, id_festival):
+        self.ids.discard(id_festival)
+        if len(self.tas) > 2 * len(self.ids) + 8:
+            self.tas = list(self.ids)
+            heapq.heapify(self.tas)
+
+    @property
+    def representant(self):
+        while self.tas[0] not in self.ids:
+            heapq.heappop(self.tas)
+        return self.tas[0]
+
+
+class IndexCarte(IndexFestivals):
+    """
+    Regroupements des festivals précalculés pour chaque niveau de zoom de 0 à ZOOM_MAX.
+
+    Chaque niveau est une grille (quadtree) de cellules de 64 pixels : une cellule d'un
+    niveau contient exactement quatre cellules du niveau suivant. Ajouter ou retirer un
+    festival met à jour une cellule par niveau, et une vue de la carte ne parcourt que les
+    cellules de sa zone.
+    """
+
+    def construire(self, lignes):
+        self.points = {}
+        self.niveaux = [dict() for _ in range(ZOOM_MAX + 1)]
+        for ligne in lignes:
+            self.ajouter(ligne)
+
+    def _cellules(self, x, y):
+        for zoom, cellules in enumerate(self.niveaux):
+            n = CELLULES_PAR_TUILE << zoom
+            yield cellules, (min(int(x * n), n - 1), min(int(y * n), n - 1))
+
+    def ajouter(self, ligne):
+        latitude, longitude = coordonnee(ligne["latitude"]), coordonnee(ligne["longitude"])
+        if not (math.isfinite(latitude) and math.isfinite(longitude)):
+            return
+        id_festival = ligne["id_festival"]
+        x, y = projeter(latitude, longitude)
+        self.points[id_festival] = (latitude, longitude, x, y)
+        for cellules, cle in self._cellules(x, y):
+            cellule = cellules.get(cle)
+            if cellule is None:
+                cellule = cellules[cle] = _Cellule()
+            cellule.ajouter(id_festival)
+            cellule.somme_latitude += latitude
+            cellule.somme_longitude += longitude
+
+    def retirer(self, id_festival):
+        point = self.points.pop(id_festival, None)
+        if point is None:
+            return
+        latitude, longitude, x, y = point
+        for cellules, cle in self._cellules(x, y):
+            cellule = cellules[cle]
+            cellule.retirer(id_festival)
+            if not cellule.ids:
+                del cellules[cle]
+                continue
+            cellule.somme_latitude -= latitude
+            cellule.somme_longitude -= longitude
+
+    def clusters(self, bbox: Tuple[float, float, float, float], zoom: int) -> List[Cluster]:
+        """
+        Retourne les regroupements du niveau de zoom dont la cellule touche la zone
+        (longitude min, latitude min, longitude max, latitude max).
+        """
+        zoom = max(0, min(ZOOM_MAX, zoom))
+        cellules = self.niveaux[zoom]
+        n = CELLULES_PAR_TUILE << zoom
+        min_lon, min_lat, max_lon, max_lat = bbox
+        x0, y1 = projeter(min_lat, min_lon)
+        x1, y0 = projeter(max_lat, max_lon)
+        cy0, cy1 = int(y0 * n), min(int(y1 * n), n - 1)
+        # Une zone qui traverse l'antiméridien est découpée en deux
+        plages_x = [(int(x0 * n), min(int(x1 * n), n - 1))] if min_lon <= max_lon \
+            else [(int(x0 * n), n - 1), (0, min(int(x1 * n), n - 1))]
+
+        nb_cles = sum(cx1 - cx0 + 1 for cx0, cx1 in plages_x) * (cy1 - cy0 + 1)
+        if nb_cles <= len(cellules):
+            trouvees = (cellules.get((cx, cy)) for cx0, cx1 in plages_x
+                        for cx in range(cx0, cx1 + 1) for cy in range(cy0, cy1 + 1))
+        else:
+            trouvees = (cellule for (cx, cy), cellule in cellules.items()
+                        if cy0 <= cy <= cy1 and any(cx0 <= cx <= cx1 for cx0, cx1 in plages_x))
+
+        return [
+            Cluster(latitude=cellule.somme_latitude / len(cellule.ids),
+                    longitude=cellule.somme_longitude / len(cellule.ids),
+                    nombre=len(cellule.ids), id_festival=cellule.representant)
+            for cellule in trouvees if cellule is not None
+        ]
+
+
+def read_clusters(session: Session, bbox: Tuple[float, float, float, float], zoom: int) -> List[Cluster]:
+    """
+    Cette fonction retourne les regroupements de festivals visibles dans une zone de la carte.
+    C'est comme regarder le plan du festival de loin : on voit les zones, pas chaque stand !
+    """
+    index = obtenir_index(IndexCarte, session)
+    with verrou_index:
+        return index.clusters(bbox, zoom)
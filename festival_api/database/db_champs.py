@@ -0,0 +1,137 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter, create_model
+from sqlalchemy.orm import Session
+
+from .db_core import DBFestival, DBAdresse, DBCategorie, DBPeriode, NotFoundError
+from .db_festivals import FestivalBase, FestivalPatch, AdresseBase, CategorieBase, PeriodeBase
+
+# Relations d'un festival : table, jointure et modèle de l'API
+RELATIONS = {
+    "adresse": (DBAdresse, DBFestival.id_adresse == DBAdresse.id_adresse, AdresseBase),
+    "categorie": (DBCategorie, DBFestival.id_categorie == DBCategorie.id_categorie, CategorieBase),
+    "periode": (DBPeriode, DBFestival.id_periode == DBPeriode.id_periode, PeriodeBase),
+}
+CHAMPS_FESTIVAL = ["id_festival"] + list(FestivalBase.model_fields)
+
+
+class FestivalProjection(FestivalPatch):
+    """
+    Réponse documentée des lectures avec fields : seuls les champs demandés sont présents.
+    """
+    id_festival: Optional[int] = None
+
+
+def analyser_champs(fields: str) -> Tuple[str, ...]:
+    """
+    Cette fonction transforme le paramètre fields (« nom_festival,adresse.latitude,periode ») en
+    liste de champs pointés ; le nom d'une relation seule désigne tous ses champs.
+    Elle lève une ValueError pour un champ inconnu.
+    C'est comme cocher sur le programme uniquement les rubriques qui vous intéressent !
+    """
+    champs = []
+    for champ in (morceau.strip() for morceau in fields.split(",")):
+        if not champ:
+            continue
+        relation, _, nom = champ.partition(".")
+        if relation in RELATIONS and not nom:
+            champs.extend(f"{relation}.{nom}" for nom in RELATIONS[relation][2].model_fields)
+        elif relation in RELATIONS and nom in RELATIONS[relation][2].model_fields:
+            champs.append(champ)
+        elif not nom and relation in CHAMPS_FESTIVAL:
+            champs.append(champ)
+        else:
+            raise ValueError(f"Unknown field '{champ}'.")
+    if not champs:
+        raise ValueError("At least one field is required.")
+    return tuple(dict.fromkeys(champs))
+
+
+@lru_cache(maxsize=256)
+def modele_projection(champs: Tuple[str, ...]) -> type:
+    """
+    Cette fonction construit (une fois par combinaison de champs) le modèle de réponse allégé
+    qui ne contient que les champs demandés.
+    """
+    racine: Dict[str, tuple] = {}
+    sous_champs: Dict[str, Dict[str, tuple]] = {}
+    for champ in champs:
+        relation, _, nom = champ.partition(".")
+        if nom:
+            annotation = RELATIONS[relation][2].model_fields[nom].annotation
+            sous_champs.setdefault(relation, {})[nom] = (Optional[annotation], None)
+        elif champ == "id_festival":
+            racine[champ] = (int, ...)
+        else:
+            racine[champ] = (Optional[FestivalBase.model_fields[champ].annotation], None)
+    for relation, definition in sous_champs.items():
+        modele = create_model(f"Projection{relation.capitalize()}", **definition)
+        racine[relation] = (modele, ...)
+    return create_model("ProjectionFestival", **racine)
+
+
+def read_db_projection(champs: Tuple[str, ...], session: Session, ids: Optional[List[int]] = None,
+                       limit: Optional[int] = None) -> List[dict]:
+    """
+    Cette fonction lit uniquement les colonnes demandées des festivals, en ne joignant que les
+    tables nécessaires, et renvoie des dictionnaires imbriqués comme la réponse complète.
+    C'est comme ne photocopier que la page du programme dont on a besoin !
+    """
+    colonnes = []
+    relations = []
+    for champ in champs:
+        relation, _, nom = champ.partition(".")
+        if nom:
+            colonnes.append(getattr(RELATIONS[relation][0], nom).label(champ))
+            if relation not in relations:
+                relations.append(relation)
+        else:
+            colonnes.append(getattr(DBFestival, champ).label(champ))
+
+    requete = session.query(*colonnes).select_from(DBFestival)
+    for relation in relations:
+        table, jointure, _ = RELATIONS[relation]
+        requete = requete.outerjoin(table, jointure)
+    if ids is not None:
+        requete = requete.filter(DBFestival.id_festival.in_(ids))
+    requete = requete.order_by(DBFestival.id_festival)
+    if limit is not None:
+        requete = requete.limit(limit)
+
+    resultats = []
+    for ligne in requete.all():
+        festival = {}
+        for champ, valeur in ligne._mapping.items():
+            relation, _, nom = champ.partition(".")
+            if nom:
+                festival.setdefault(relation, {})[nom] = valeur
+            else:
+                festival[champ] = valeur
+        resultats.append(festival)
+    return resultats
+
+
+def read_db_one_projection(id_festival: int, champs: Tuple[str, ...], session: Session) -> dict:
+    """
+    Cette fonction lit les champs demandés d'un seul festival.
+    C'est comme demander au guichet une seule information sur un événement précis !
+    """
+    resultats = read_db_projection(champs, session, ids=[id_festival])
+    if not resultats:
+        raise NotFoundError(f"Item with id {id_festival} not found.")
+    return resultats[0]
+
+
+def serialiser_projection(champs: Tuple[str, ...], donnees) -> bytes:
+    """
+    Cette fonction valide et sérialise en JSON un festival ou une liste de festivals projetés.
+    """
+    modele = modele_projection(champs)
+    type_donnees = List[modele] if isinstance(donnees, list) else modele
+    return _adaptateur(type_donnees).dump_json(_adaptateur(type_donnees).validate_python(donnees))
+
+
+@lru_cache(maxsize=512)
+def _adaptateur(type_donnees) -> TypeAdapter:
+    return TypeAdapter(type_donnees)
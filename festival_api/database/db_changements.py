@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import delete, func, or_
+from sqlalchemy.orm import Session
+
+from .db_core import DBChangement
+from .db_ecriture import apres_validation
+from .db_festivals import Festival, read_db_festivals_par_ids
+
+# Nombre d'événements en attente au-delà duquel un abonné trop lent est déconnecté
+TAILLE_FILE_ABONNE = 1000
+# Intervalle d'envoi d'un commentaire de maintien de connexion, en secondes
+INTERVALLE_MAINTIEN = 15
+# Rétention du journal : les RETENTION_CHANGEMENTS derniers changements, et aucun de plus de DUREE_RETENTION
+RETENTION_CHANGEMENTS = 10000
+DUREE_RETENTION = timedelta(days=7)
+# Intervalle minimal entre deux purges du journal, en secondes
+INTERVALLE_PURGE = 60
+
+logger = logging.getLogger(__name__)
+
+
+class Changement(BaseModel):
+    id_changement: int
+    id_festival: int
+    operation: str
+    date_changement: str
+    festival: Optional[Festival] = None
+
+
+def dernier_changement(session: Session) -> int:
+    """
+    Cette fonction retourne l'identifiant du dernier changement enregistré (0 si le journal est vide).
+    """
+    return session.query(func.max(DBChangement.id_changement)).scalar() or 0
+
+
+def changements_purges(session: Session, depuis: int) -> bool:
+    """
+    Cette fonction indique si des changements postérieurs à l'identifiant donné ont été retirés du
+    journal par la rétention : le client doit alors tout recharger au lieu de rattraper le journal.
+    """
+    premier = session.query(func.min(DBChangement.id_changement)).scalar()
+    return premier is not None and depuis < premier - 1
+
+
+def purger_changements(session: Session, nombre: int = RETENTION_CHANGEMENTS,
+                       duree: timedelta = DUREE_RETENTION) -> int:
+    """
+    Cette fonction retire du journal les changements au-delà des nombre derniers ou plus anciens que
+    duree. Le dernier changement est toujours gardé, pour que changements_purges reste exact.
+    Retourne le nombre de changements retirés.
+    C'est comme archiver les vieilles pages du registre de la billetterie !
+    """
+    dernier = dernier_changement(session)
+    limite = (datetime.now(timezone.utc) - duree).isoformat()
+    resultat = session.execute(delete(DBChangement).where(
+        DBChangement.id_changement < dernier,
+        or_(DBChangement.id_changement <= dernier - nombre, DBChangement.date_changement < limite)))
+    session.commit()
+    return resultat.rowcount
+
+
+_derniere_purge = 0.0
+
+
+def _purger_periodiquement(session: Session) -> None:
+    global _derniere_purge
+    maintenant = time.monotonic()
+    if maintenant - _derniere_purge < INTERVALLE_PURGE:
+        return
+    _derniere_purge = maintenant
+    try:
+        purger_changements(session)
+    except Exception:
+        # L'écriture est déjà validée : la purge sera retentée à l'intervalle suivant
+        session.rollback()
+        logger.exception("Erreur lors de la purge du journal des changements")
+
+
+def read_changements(session: Session, depuis: int) -> List[Changement]:
+    """
+    Cette fonction lit les changements postérieurs à l'identifiant donné, avec l'état actuel des
+    festivals concernés (vide pour un festival supprimé depuis).
+    C'est comme relire le registre de la billetterie depuis sa dernière visite !
+    """
+    lignes = session.query(DBChangement).filter(DBChangement.id_changement > depuis) \
+        .order_by(DBChangement.id_changement).all()
+    if not lignes:
+        return []
+    festivals = {resultat.id_festival: resultat.festival
+                 for resultat in read_db_festivals_par_ids([ligne.id_festival for ligne in lignes], session)}
+    return [Changement(id_changement=ligne.id_changement, id_festival=ligne.id_festival,
+                       operation=ligne.operation, date_changement=ligne.date_changement,
+                       festival=None if ligne.operation == "delete" else festivals[ligne.id_festival])
+            for ligne in lignes]
+
+
+def format_sse(changement: Changement) -> str:
+    """
+    Cette fonction met un changement au format Server-Sent Events.
+    """
+    return f"id: {changement.id_changement}\nevent: {changement.operation}\ndata: {changement.model_dump_json()}\n\n"
+
+
+def format_resync(dernier: int) -> str:
+    """
+    Cette fonction produit l'événement resync : les changements demandés ne sont plus dans le journal,
+    le client recharge les festivals et reprend le flux à partir de l'identifiant dernier.
+    """
+    return f"id: {dernier}\nevent: resync\ndata: {{}}\n\n"
+
+
+class Abonnement:
+    """
+    File d'événements d'un client du flux, remplie depuis les threads d'écriture.
+    """
+
+    def __init__(self, boucle: asyncio.AbstractEventLoop):
+        self.boucle = boucle
+        self.file: "asyncio.Queue[Changement]" = asyncio.Queue(TAILLE_FILE_ABONNE)
+        self.deborde = False
+
+    def _deposer(self, changement: Changement) -> None:
+        try:
+            self.file.put_nowait(changement)
+        except asyncio.QueueFull:
+            self.deborde = True
+
+
+class Diffuseur:
+    """
+    Diffuseur unique des changements aux abonnés du flux.
+
+    Après chaque transaction d'écriture validée, il lit une seule fois les nouvelles lignes du
+    journal puis les dépose dans la file de chaque abonné, quel que soit leur nombre. Sans
+    abonné, il ne lit rien.
+    """
+
+    def __init__(self):
+        self.abonnes: List[Abonnement] = []
+        self.dernier_id: Optional[int] = None
+        self.verrou = threading.Lock()
+
+    def abonner(self, depuis: int) -> Abonnement:
+        """
+        Inscrit un abonné qui a déjà reçu les changements jusqu'à l'identifiant depuis.
+        Doit être appelé depuis la boucle asyncio de l'abonné.
+        """
+        abonnement = Abonnement(asyncio.get_running_loop())
+        with self.verrou:
+            self.dernier_id = depuis if self.dernier_id is None else min(self.dernier_id, depuis)
+            self.abonnes.append(abonnement)
+        return abonnement
+
+    def desabonner(self, abonnement: Abonnement) -> None:
+        with self.verrou:
+            if abonnement in self.abonnes:
+                self.abonnes.remove(abonnement)
+
+    def publier(self, session: Session) -> None:
+        """
+        Envoie aux abonnés les changements validés depuis la dernière publication.
+        """
+        with self.verrou:
+            if not self.abonnes:
+                self.dernier_id = None
+                return
+            changements = read_changements(session, self.dernier_id)
+            if not changements:
+                return
+            self.dernier_id = changements[-1].id_changement
+            for abonnement in list(self.abonnes):
+                try:
+                    for changement in changements:
+                        abonnement.boucle.call_soon_threadsafe(abonnement._deposer, changement)
+                except RuntimeError:
+                    # La boucle de l'abonné est fermée
+                    self.abonnes.remove(abonnement)
+
+
+diffuseur = Diffuseur()
+apres_validation(diffuseur.publier)
+apres_validation(_purger_periodiquement)
+
+
+async def flux_changements(abonnement: Abonnement, rattrapage: Optional[List[Changement]], depuis: int):
+    """
+    Cette fonction produit le flux SSE d'un abonné : les changements manqués, puis les changements
+    diffusés au fil de l'eau, sans doublon. Le flux se termine si l'abonné a pris trop de retard ;
+    il se reconnecte alors avec Last-Event-ID et rattrape le journal. Sans rattrapage possible
+    (None, changements déjà purgés), le flux commence par un événement resync.
+    C'est comme écouter les annonces du festival en direct après avoir lu le tableau d'affichage !
+    """
+    try:
+        if rattrapage is None:
+            yield format_resync(depuis)
+            rattrapage = []
+        for changement in rattrapage:
+            depuis = max(depuis, changement.id_changement)
+            yield format_sse(changement)
+        while not abonnement.deborde:
+            try:
+                changement = await asyncio.wait_for(abonnement.file.get(), timeout=INTERVALLE_MAINTIEN)
+            except asyncio.TimeoutError:
+                yield ": maintien\n\n"
+                continue
+            if changement.id_changement > depuis:
+                depuis = changement.id_changement
+                yield format_sse(changement)
+    finally:
+        diffuseur.desabonner(abonnement)
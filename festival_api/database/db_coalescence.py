@@ -0,0 +1,81 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, List, Union
+
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session
+
+from .db_ecriture import apres_validation
+from .db_festivals import Festival
+
+_adaptateur_festival = TypeAdapter(Festival)
+_adaptateur_festivals = TypeAdapter(List[Festival])
+
+
+class VolUnique:
+    """
+    Regroupement des lectures identiques simultanées (single flight).
+
+    Le premier appelant d'une clé exécute le calcul ; ceux qui demandent la même clé pendant
+    ce temps attendent son résultat (ou son erreur) au lieu de refaire la même lecture. La clé
+    est oubliée dès que le calcul se termine : rien n'est mis en cache. Chaque écriture validée
+    change de génération, pour qu'une lecture commencée avant l'écriture ne soit pas partagée
+    avec un appelant arrivé après.
+    """
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.en_vol: Dict[Hashable, Future] = {}
+        self.generation = 0
+        self.nb_calculs = 0
+        self.nb_partages = 0
+
+    def nouvelle_generation(self, session: Session = None) -> None:
+        with self.verrou:
+            self.generation += 1
+
+    def executer(self, cle: Hashable, calcul: Callable[[], bytes]) -> bytes:
+        with self.verrou:
+            cle = (self.generation, cle)
+            future = self.en_vol.get(cle)
+            meneur = future is None
+            if meneur:
+                future = self.en_vol[cle] = Future()
+                self.nb_calculs += 1
+            else:
+                self.nb_partages += 1
+        if not meneur:
+            return future.result()
+        try:
+            resultat = calcul()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(resultat)
+            return resultat
+        finally:
+            with self.verrou:
+                del self.en_vol[cle]
+
+
+vol_festivals = VolUnique()
+apres_validation(vol_festivals.nouvelle_generation)
+
+
+def serialiser_festivals(donnees: Union[object, list]) -> bytes:
+    """
+    Cette fonction valide et sérialise en JSON un festival ou une liste de festivals lus en base.
+    """
+    if isinstance(donnees, list):
+        return _adaptateur_festivals.dump_json(_adaptateur_festivals.validate_python(donnees, from_attributes=True))
+    return _adaptateur_festival.dump_json(_adaptateur_festival.validate_python(donnees, from_attributes=True))
+
+
+def lecture_partagee(cle: Hashable, lecture: Callable[[], bytes]) -> bytes:
+    """
+    Cette fonction exécute une lecture sérialisée une seule fois pour tous les appelants simultanés
+    qui demandent la même clé.
+    C'est comme un seul guide qui répond à tout le groupe venu poser la même question !
+    """
+    return vol_festivals.executer(cle, lecture)
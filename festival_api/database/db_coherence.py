@@ -0,0 +1,197 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import Callable, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .db_core import DBAdresse, DBCategorie, DBChangement, DBFestival, DBPeriode
+from .db_ecriture import _notifier_validation
+from .db_index import avant_lecture, invalider_index, retirer_avant_lecture, synchroniser_festival
+
+# Intervalle de veille des écritures des autres processus, en secondes
+INTERVALLE_VEILLE = 0.5
+# Nombre de changements au-delà duquel les index sont reconstruits plutôt que mis à jour
+SEUIL_RECONSTRUCTION = 500
+
+logger = logging.getLogger(__name__)
+
+# Empreinte des tables des festivals : change quand des lignes y sont ajoutées ou supprimées
+# sans passer par le journal des changements (chargement des données, outil SQLite...)
+EMPREINTE_FESTIVALS = select(
+    select(func.count()).select_from(DBFestival).scalar_subquery(),
+    select(func.max(DBFestival.id_festival)).scalar_subquery(),
+    select(func.max(DBAdresse.id_adresse)).scalar_subquery(),
+    select(func.max(DBCategorie.id_categorie)).scalar_subquery(),
+    select(func.max(DBPeriode.id_periode)).scalar_subquery(),
+)
+
+
+class Veilleur:
+    """
+    Garde les index en mémoire d'un processus cohérents avec les écritures des autres processus.
+
+    Le journal des changements sert de compteur partagé : tous les workers écrivent dans la
+    même base, et chaque écriture validée y ajoute une ligne. Avant chaque utilisation d'un
+    index, et toutes les INTERVALLE_VEILLE secondes pour le flux des changements, le veilleur
+    compare le dernier identifiant du journal à celui qu'il a déjà traité ; s'il a avancé, les
+    festivals concernés sont relus et répercutés sur les index, puis les abonnés du flux sont
+    notifiés. Les écritures du processus lui-même sont aussi relues, ce qui est sans effet.
+
+    Les écritures qui ne passent pas par le journal sont repérées par deux signaux SQLite :
+    PRAGMA data_version, lu sur une connexion dédiée, change à chaque transaction validée par
+    une autre connexion ; si le journal n'a pas avancé, l'empreinte des tables des festivals
+    dit si elles ont changé, et les index sont alors reconstruits. L'identité du fichier
+    (périphérique et inode) repère une base remplacée par une autre : les connexions ouvertes
+    sur l'ancien fichier sont fermées avant la reconstruction. Tant que data_version et le
+    fichier ne changent pas, la vérification ne lit rien dans la base.
+    """
+
+    def __init__(self, fabrique_session: Callable[[], Session], intervalle: float = INTERVALLE_VEILLE):
+        self.fabrique_session = fabrique_session
+        self.intervalle = intervalle
+        self.verrou = threading.Lock()
+        self.nb_synchronisations = 0
+        self._connexion = None
+        session = fabrique_session()
+        try:
+            moteur = session.get_bind()
+            chemin = moteur.url.database if moteur.dialect.name == "sqlite" else None
+            self.chemin = os.path.abspath(chemin) if chemin and chemin != ":memory:" else None
+            self._ouvrir()
+            self.dernier_id = self._dernier_id(session)
+            self.empreinte = tuple(session.execute(EMPREINTE_FESTIVALS).one())
+        finally:
+            session.close()
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._boucle, name="veilleur-festivals", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _dernier_id(session: Session) -> int:
+        return session.execute(select(func.max(DBChangement.id_changement))).scalar() or 0
+
+    def _identite(self):
+        try:
+            infos = os.stat(self.chemin)
+        except OSError:
+            return None
+        return infos.st_dev, infos.st_ino
+
+    def _ouvrir(self) -> None:
+        """
+        Ouvre la connexion dédiée à PRAGMA data_version, sur le fichier actuel de la base.
+        """
+        if self._connexion is not None:
+            self._connexion.close()
+            self._connexion = None
+        if self.chemin is None:
+            return
+        self._connexion = sqlite3.connect(self.chemin, check_same_thread=False)
+        self.identite = self._identite()
+        self.data_version = self._data_version()
+
+    def _data_version(self) -> int:
+        return self._connexion.execute("PRAGMA data_version").fetchone()[0]
+
+    def _base_modifiee(self, session: Session) -> bool:
+        """
+        Indique si une autre connexion a validé une transaction depuis le dernier appel. Si le
+        fichier de la base a été remplacé, les connexions vers l'ancien fichier sont fermées.
+        """
+        if self._connexion is None:
+            return True
+        if self._identite() not in (None, self.identite):
+            logger.info("Base de données remplacée, reconnexion et reconstruction des index")
+            session.get_bind().dispose()
+            # La session en cours relira la base depuis une nouvelle connexion
+            session.invalidate()
+            self._ouvrir()
+            self.empreinte = None
+            return True
+        data_version = self._data_version()
+        if data_version == self.data_version:
+            return False
+        self.data_version = data_version
+        return True
+
+    def verifier(self, session: Session) -> None:
+        """
+        Répercute sur les index les changements enregistrés depuis la dernière vérification.
+        """
+        with self.verrou:
+            if not self._base_modifiee(session):
+                return
+            dernier_id = self._dernier_id(session)
+            empreinte = tuple(session.execute(EMPREINTE_FESTIVALS).one())
+            if dernier_id > self.dernier_id:
+                ids = session.execute(
+                    select(DBChangement.id_festival).distinct()
+                    .where(DBChangement.id_changement > self.dernier_id,
+                           DBChangement.id_changement <= dernier_id)).scalars().all()
+                if len(ids) > SEUIL_RECONSTRUCTION:
+                    invalider_index()
+                else:
+                    for id_festival in ids:
+                        synchroniser_festival(session, id_festival)
+            elif empreinte != self.empreinte:
+                # Les festivals ont changé sans ligne dans le journal : écriture hors de l'API
+                # (chargement des données, outil SQLite...) ou base remplacée
+                invalider_index()
+            else:
+                # Transaction sans effet sur les festivals (utilisateurs, jetons...)
+                return
+            self.dernier_id = dernier_id
+            self.empreinte = empreinte
+            self.nb_synchronisations += 1
+        _notifier_validation(session)
+
+    def arreter(self) -> None:
+        self._arret.set()
+        self._thread.join()
+        if self._connexion is not None:
+            self._connexion.close()
+
+    def _boucle(self) -> None:
+        while not self._arret.wait(self.intervalle):
+            session = self.fabrique_session()
+            try:
+                self.verifier(session)
+            except Exception:
+                logger.exception("Erreur lors de la veille des changements")
+            finally:
+                session.close()
+
+
+_veilleur: Optional[Veilleur] = None
+
+
+def _verifier_avant_lecture(session: Session) -> None:
+    if _veilleur is not None:
+        _veilleur.verifier(session)
+
+
+def activer_coherence(fabrique_session: Callable[[], Session], intervalle: float = INTERVALLE_VEILLE) -> Veilleur:
+    """
+    Cette fonction démarre la veille des écritures des autres processus, pour servir avec plusieurs
+    workers des index en mémoire toujours à jour.
+    C'est comme relire le tableau commun des régisseurs avant d'annoncer le programme !
+    """
+    global _veilleur
+    desactiver_coherence()
+    _veilleur = Veilleur(fabrique_session, intervalle)
+    avant_lecture(_verifier_avant_lecture)
+    return _veilleur
+
+
+def desactiver_coherence() -> None:
+    """
+    Cette fonction arrête la veille des écritures des autres processus.
+    """
+    global _veilleur
+    retirer_avant_lecture(_verifier_avant_lecture)
+    if _veilleur is not None:
+        _veilleur.arreter()
+        _veilleur = None
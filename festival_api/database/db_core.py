@@ -1,25 +1,52 @@
 import os
+import threading
+from types import SimpleNamespace
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Float
 from sqlalchemy.orm import relationship
+from .migration import migrer
 
-# Charger les variables d'environnement
-load_dotenv()
+_moteur = None
+_verrou_moteur = threading.Lock()
 
-# Déterminer l'URL de la base de données
-if os.environ.get('TESTING') == 'True':
-    DATABASE_URL = "sqlite:///:memory:"
-else:
-    DATABASE_URL = os.getenv('DATABASE_URL')
-    if DATABASE_URL and not DATABASE_URL.startswith('sqlite:///'):
-        DATABASE_URL = f"sqlite:///{DATABASE_URL}"
+def url_base() -> str:
+    """
+    Cette fonction détermine l'URL de la base de données à partir de l'environnement (et du fichier .env).
+    """
+    load_dotenv()
+    if os.environ.get('TESTING') == 'True':
+        return "sqlite:///:memory:"
+    url = os.getenv('DATABASE_URL')
+    if url and not url.startswith('sqlite:///'):
+        url = f"sqlite:///{url}"
+    return url
 
-# Créer le moteur de base de données
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def obtenir_moteur():
+    """
+    Cette fonction crée le moteur de base de données à la première utilisation (démarrage de
+    l'application ou première session), et pas à l'import du module.
+    C'est comme n'allumer la sono qu'au moment où le premier musicien monte sur scène !
+    """
+    global _moteur
+    if _moteur is None:
+        with _verrou_moteur:
+            if _moteur is None:
+                moteur = create_engine(url_base(), connect_args={"check_same_thread": False})
+                SessionLocal.configure(bind=moteur)
+                _moteur = moteur
+    return _moteur
+
+class _FabriqueSessions(sessionmaker):
+    # Le moteur est créé par la première session demandée
+    def __call__(self, **local_kw):
+        if _moteur is None:
+            obtenir_moteur()
+        return super().__call__(**local_kw)
+
+SessionLocal = _FabriqueSessions(autocommit=False, autoflush=False)
 # Créer une base déclarative
 Base = declarative_base()
 
@@ -48,6 +75,9 @@ class DBPeriode(Base):
     id_periode = Column(Integer, primary_key=True)
     periode = Column(String)
     categorie_periode = Column(String)
+    # Jours de l'année (1 à 365) de début et de fin, fin < début si la période passe par le 31 décembre
+    jour_debut = Column(Integer)
+    jour_fin = Column(Integer)
     festival = relationship("DBFestival", back_populates="periode", uselist=False)
 
 class DBFestival(Base):
@@ -64,6 +94,51 @@ class DBFestival(Base):
     periode = relationship("DBPeriode", back_populates="festival")
 
 
+class DBFestivalFlat(Base):
+    """
+    Copie dénormalisée d'un festival et de ses relations, une ligne par festival, tenue à jour
+    par les triggers de database_building/script_festival_flat.sql. Elle se lit comme un
+    DBFestival : adresse, categorie et periode sont reconstruites à partir des colonnes.
+    """
+    __tablename__ = 'festival_flat'
+    # Même ordre de colonnes que la vue festival_complet
+    id_festival = Column(Integer, primary_key=True)
+    nom_festival = Column(String)
+    annee_creation = Column(Integer)
+    site_internet = Column(String)
+    id_adresse = Column(Integer)
+    adresse_postale = Column(String)
+    code_insee = Column(String)
+    region = Column(String)
+    departement = Column(String)
+    commune = Column(String)
+    longitude = Column(Float)
+    latitude = Column(Float)
+    id_categorie = Column(Integer)
+    discipline_dominante = Column(String)
+    sous_categorie = Column(String)
+    id_periode = Column(Integer)
+    periode_texte = Column("periode", String)
+    categorie_periode = Column(String)
+    jour_debut = Column(Integer)
+    jour_fin = Column(Integer)
+
+    @property
+    def adresse(self):
+        return SimpleNamespace(adresse_postale=self.adresse_postale, code_insee=self.code_insee, region=self.region,
+                               departement=self.departement, commune=self.commune,
+                               longitude=self.longitude, latitude=self.latitude)
+
+    @property
+    def categorie(self):
+        return SimpleNamespace(discipline_dominante=self.discipline_dominante, sous_categorie=self.sous_categorie)
+
+    @property
+    def periode(self):
+        return SimpleNamespace(periode=self.periode_texte, categorie_periode=self.categorie_periode,
+                               jour_debut=self.jour_debut, jour_fin=self.jour_fin)
+
+
 class DBUsers(Base):
     __tablename__ = "users"
 
@@ -81,15 +156,93 @@ class DBToken(Base):
     access_token = Column(String)
     token_type = Column(String)
     user_id = Column(Integer, ForeignKey("users.id"))
+    # Empreinte SHA-256 du jeton de rafraîchissement, ou de l'identifiant (jti) d'un jeton d'accès révoqué
+    token_hash = Column(String, index=True)
+    expires_at = Column(Integer)
+    revoked = Column(Boolean, default=False)
+    # Jetons de rafraîchissement issus d'une même connexion, révoqués ensemble si l'un d'eux est réutilisé
+    family = Column(String)
     user = relationship("DBUsers", back_populates="tokens")
 
+class DBChangement(Base):
+    __tablename__ = "changement"
+    # Identifiant croissant, utilisé comme Last-Event-ID du flux des changements
+    id_changement = Column(Integer, primary_key=True, autoincrement=True)
+    id_festival = Column(Integer)
+    operation = Column(String)
+    date_changement = Column(String)
+
+class DBSimilaire(Base):
+    # Festivals voisins précalculés par database_building/similarite.py après chaque chargement
+    __tablename__ = "similaire"
+    __table_args__ = {"sqlite_with_rowid": False}
+    id_festival = Column(Integer, primary_key=True)
+    rang = Column(Integer, primary_key=True)
+    id_similaire = Column(Integer)
+    score = Column(Float)
+
 class NotFoundError(Exception):
     pass
 
-# Créer les tables dans la base de données
-Base.metadata.create_all(bind=engine)
+def migrer_schema(moteur):
+    """
+    Cette fonction ajoute aux tables existantes les colonnes et les index qui leur manquent, avec la
+    migration partagée avec le script d'insertion (migration.py).
+    C'est comme ajouter une nouvelle colonne au registre du festival sans en recopier les pages !
+    """
+    conn = moteur.raw_connection()
+    try:
+        migrer(conn)
+    finally:
+        conn.close()
+
+DOSSIER_SCRIPTS_SQL = os.path.join(os.path.dirname(__file__), "..", "..", "database_building")
+
+def installer_festival_flat(moteur):
+    """
+    Cette fonction crée la vue, les index et les triggers qui tiennent festival_flat à jour, puis
+    reconstruit la table si elle ne contient pas autant de lignes que festival.
+    C'est comme installer un panneau d'affichage qui se met à jour à chaque changement du programme !
+    """
+    with open(os.path.join(DOSSIER_SCRIPTS_SQL, "script_festival_flat.sql"), encoding="utf-8") as f:
+        script = f.read()
+    with open(os.path.join(DOSSIER_SCRIPTS_SQL, "reconstruction_festival_flat.sql"), encoding="utf-8") as f:
+        reconstruction = f.read()
+    conn = moteur.raw_connection()
+    try:
+        conn.executescript(script)
+        nb_festivals = conn.execute("SELECT COUNT(*) FROM festival").fetchone()[0]
+        nb_lignes = conn.execute("SELECT COUNT(*) FROM festival_flat").fetchone()[0]
+        if nb_festivals != nb_lignes:
+            conn.executescript(reconstruction)
+        conn.commit()
+    finally:
+        conn.close()
+
+_schemas_initialises = set()
+
+_verrou_schema = threading.Lock()
+
+def initialiser_schema(moteur=None):
+    """
+    Cette fonction crée les tables manquantes, migre le schéma et installe festival_flat, une seule
+    fois par moteur et par processus. Elle est appelée au démarrage de l'application, pas à l'import,
+    et par get_db pour les clients qui ne passent pas par le démarrage (TestClient sans with, ASGITransport).
+    C'est comme monter la scène une fois avant l'ouverture des portes, et pas à chaque concert !
+    """
+    moteur = moteur or obtenir_moteur()
+    if moteur in _schemas_initialises:
+        return
+    with _verrou_schema:
+        if moteur in _schemas_initialises:
+            return
+        Base.metadata.create_all(bind=moteur)
+        migrer_schema(moteur)
+        installer_festival_flat(moteur)
+        _schemas_initialises.add(moteur)
 
 def get_db():
+    initialiser_schema()
     db = SessionLocal()
     try:
         yield db
@@ -0,0 +1,173 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .db_index import synchroniser_festival
+
+# Durée maximale d'attente d'autres écritures avant d'appliquer un lot, en secondes
+FENETRE_LOT = 0.002
+TAILLE_LOT_MAX = 128
+
+logger = logging.getLogger(__name__)
+
+
+class EcrivainGroupe:
+    """
+    Tâche d'écriture unique qui regroupe les écritures concurrentes (group commit).
+
+    Chaque écriture soumise est mise en file avec un Future. Le thread d'écriture prend les
+    écritures en attente pendant FENETRE_LOT secondes ou jusqu'à TAILLE_LOT_MAX, les applique
+    dans une seule transaction SQLite (un seul fsync), chacune dans son propre SAVEPOINT, puis
+    résout le Future de chaque appelant avec son résultat ou son erreur. Une écriture en échec
+    n'annule que son SAVEPOINT, pas celles des autres appelants.
+    """
+
+    def __init__(self, fabrique_session: Callable[[], Session], fenetre: float = FENETRE_LOT,
+                 taille_lot: int = TAILLE_LOT_MAX):
+        self.fabrique_session = fabrique_session
+        self.fenetre = fenetre
+        self.taille_lot = taille_lot
+        self.nb_lots = 0
+        self._file: "queue.Queue[Optional[Tuple[Callable, tuple, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._boucle, name="ecrivain-festivals", daemon=True)
+        self._thread.start()
+
+    def soumettre(self, operation: Callable, *args) -> Future:
+        """
+        Met une écriture en file. L'opération est appelée avec les arguments puis la session du
+        lot, ne doit pas valider la transaction et retourne l'identifiant du festival modifié.
+        """
+        future = Future()
+        self._file.put((operation, args, future))
+        return future
+
+    def arreter(self) -> None:
+        self._file.put(None)
+        self._thread.join()
+
+    def _prendre_lot(self, premiere) -> Tuple[List[tuple], bool]:
+        lot = [premiere]
+        limite = time.monotonic() + self.fenetre
+        while len(lot) < self.taille_lot:
+            try:
+                ecriture = self._file.get(timeout=max(0.0, limite - time.monotonic()))
+            except queue.Empty:
+                break
+            if ecriture is None:
+                return lot, True
+            lot.append(ecriture)
+        return lot, False
+
+    def _boucle(self) -> None:
+        arret = False
+        while not arret:
+            premiere = self._file.get()
+            if premiere is None:
+                break
+            lot, arret = self._prendre_lot(premiere)
+            self._appliquer(lot)
+
+    def _appliquer(self, lot: List[tuple]) -> None:
+        self.nb_lots += 1
+        resultats = []
+        session = self.fabrique_session()
+        try:
+            # BEGIN IMMEDIATE prend le verrou d'écriture tout de suite ; sans BEGIN explicite,
+            # pysqlite validerait séparément le premier SAVEPOINT
+            if session.get_bind().dialect.name == "sqlite":
+                session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            for operation, args, future in lot:
+                try:
+                    with session.begin_nested():
+                        resultats.append((future, operation(*args, session), None))
+                except Exception as e:
+                    resultats.append((future, None, e))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            session.close()
+            for _, _, future in lot:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # La transaction est validée : les index et les abonnés sont mis à jour avant de répondre
+        try:
+            for _, id_festival, erreur in resultats:
+                if erreur is None and id_festival is not None:
+                    synchroniser_festival(session, id_festival)
+            _notifier_validation(session)
+        except Exception:
+            logger.exception("Erreur après la validation d'un lot d'écritures")
+        finally:
+            session.close()
+
+        for future, resultat, erreur in resultats:
+            if erreur is None:
+                future.set_result(resultat)
+            else:
+                future.set_exception(erreur)
+
+
+_ecrivain: Optional[EcrivainGroupe] = None
+# Fonctions appelées avec la session après chaque transaction d'écriture validée
+_apres_validation: List[Callable[[Session], None]] = []
+
+
+def apres_validation(fonction: Callable[[Session], None]) -> None:
+    """
+    Cette fonction enregistre une fonction à appeler après chaque transaction d'écriture validée.
+    """
+    _apres_validation.append(fonction)
+
+
+def _notifier_validation(session: Session) -> None:
+    for fonction in _apres_validation:
+        fonction(session)
+
+
+def activer_ecriture_groupee(fabrique_session: Callable[[], Session], fenetre: float = FENETRE_LOT,
+                             taille_lot: int = TAILLE_LOT_MAX) -> EcrivainGroupe:
+    """
+    Cette fonction démarre la tâche d'écriture groupée utilisée par les fonctions d'écriture de db_festivals.
+    C'est comme ouvrir un seul guichet qui enregistre toutes les réservations arrivées en même temps !
+    """
+    global _ecrivain
+    desactiver_ecriture_groupee()
+    _ecrivain = EcrivainGroupe(fabrique_session, fenetre, taille_lot)
+    return _ecrivain
+
+
+def desactiver_ecriture_groupee() -> None:
+    """
+    Cette fonction arrête la tâche d'écriture groupée ; chaque écriture valide de nouveau sa propre transaction.
+    """
+    global _ecrivain
+    if _ecrivain is not None:
+        _ecrivain.arreter()
+        _ecrivain = None
+
+
+def ecrire(operation: Callable, *args, session: Session):
+    """
+    Cette fonction applique une écriture et retourne l'identifiant du festival concerné : via la tâche
+    d'écriture groupée si elle est active, sinon dans la session de l'appelant, validée aussitôt.
+    C'est comme déposer sa réservation au guichet commun ou la valider soi-même !
+    """
+    if _ecrivain is not None:
+        return _ecrivain.soumettre(operation, *args).result()
+    try:
+        id_festival = operation(*args, session)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    if id_festival is not None:
+        synchroniser_festival(session, id_festival)
+        _notifier_validation(session)
+    return id_festival
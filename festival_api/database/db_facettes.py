@@ -0,0 +1,149 @@
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from .db_index import IndexFestivals, obtenir_index, verrou_index
+
+FACETTES = ["region", "departement", "discipline_dominante", "sous_categorie", "categorie_periode"]
+CAPACITE_INITIALE = 1024
+
+# numpy n'est importé qu'à la construction du premier index, pour ne pas ralentir le démarrage
+np = None
+
+
+def _numpy():
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
+
+
+class Facettes(BaseModel):
+    total: int
+    facettes: Dict[str, Dict[str, int]]
+
+
+class _Facette:
+    """
+    Les bitmaps d'une facette : un tableau booléen par valeur, plus le code de la valeur
+    de chaque ligne pour compter toutes les valeurs d'un coup avec np.bincount.
+    """
+
+    def __init__(self, capacite):
+        self.valeurs: List[str] = []
+        self.code_par_valeur: Dict[str, int] = {}
+        self.codes = np.full(capacite, -1, dtype=np.int32)
+        self.bitmaps: List[np.ndarray] = []
+
+    def agrandir(self, capacite):
+        self.codes = np.concatenate([self.codes, np.full(capacite - len(self.codes), -1, dtype=np.int32)])
+        self.bitmaps = [np.concatenate([b, np.zeros(capacite - len(b), dtype=bool)]) for b in self.bitmaps]
+
+    def poser(self, position, valeur):
+        if valeur is None:
+            return
+        code = self.code_par_valeur.get(valeur)
+        if code is None:
+            code = self.code_par_valeur[valeur] = len(self.valeurs)
+            self.valeurs.append(valeur)
+            self.bitmaps.append(np.zeros(len(self.codes), dtype=bool))
+        self.codes[position] = code
+        self.bitmaps[code][position] = True
+
+    def effacer(self, position):
+        code = self.codes[position]
+        if code >= 0:
+            self.bitmaps[code][position] = False
+            self.codes[position] = -1
+
+    def masque(self, valeurs):
+        masque = np.zeros(len(self.codes), dtype=bool)
+        for valeur in valeurs:
+            code = self.code_par_valeur.get(valeur)
+            if code is not None:
+                masque |= self.bitmaps[code]
+        return masque
+
+    def compter(self, masque):
+        codes = self.codes[masque]
+        comptes = np.bincount(codes[codes >= 0], minlength=len(self.valeurs))
+        return {self.valeurs[code]: int(comptes[code]) for code in np.flatnonzero(comptes)}
+
+
+class IndexFacettes(IndexFestivals):
+    """
+    Index bitmap des facettes (région, département, discipline, sous-catégorie, catégorie
+    de période). Chaque festival occupe une position ; un filtre est l'intersection des
+    unions des bitmaps des valeurs choisies, et les comptes d'une facette sont calculés
+    sur ce masque sans passer par la base.
+    """
+
+    def construire(self, lignes):
+        _numpy()
+        capacite = max(CAPACITE_INITIALE, 2 * len(lignes))
+        self.positions: Dict[int, int] = {}
+        self.libres: List[int] = []
+        self.prochaine = 0
+        self.actifs = np.zeros(capacite, dtype=bool)
+        self.facettes = {nom: _Facette(capacite) for nom in FACETTES}
+        for ligne in lignes:
+            self.ajouter(ligne)
+
+    def ajouter(self, ligne):
+        # Les positions libérées par les retraits sont réutilisées avant d'agrandir les bitmaps
+        if self.libres:
+            position = self.libres.pop()
+        else:
+            position = self.prochaine
+            self.prochaine += 1
+            if position == len(self.actifs):
+                capacite = 2 * len(self.actifs)
+                self.actifs = np.concatenate([self.actifs, np.zeros(capacite - len(self.actifs), dtype=bool)])
+                for facette in self.facettes.values():
+                    facette.agrandir(capacite)
+        self.positions[ligne["id_festival"]] = position
+        self.actifs[position] = True
+        for nom, facette in self.facettes.items():
+            facette.poser(position, ligne[nom])
+
+    def retirer(self, id_festival):
+        position = self.positions.pop(id_festival, None)
+        if position is None:
+            return
+        self.actifs[position] = False
+        for facette in self.facettes.values():
+            facette.effacer(position)
+        self.libres.append(position)
+
+    def compter(self, filtres: Dict[str, List[str]]):
+        """
+        Retourne le nombre de festivals correspondant aux filtres et, pour chaque facette,
+        le nombre de festivals par valeur. Comme dans une recherche à facettes classique,
+        les comptes d'une facette ignorent le filtre posé sur cette même facette, pour que
+        les autres valeurs restent sélectionnables.
+        """
+        masques = {nom: self.facettes[nom].masque(valeurs) for nom, valeurs in filtres.items() if valeurs}
+        total = self.actifs.copy()
+        for masque in masques.values():
+            total &= masque
+
+        facettes = {}
+        for nom, facette in self.facettes.items():
+            masque = self.actifs.copy()
+            for autre, masque_autre in masques.items():
+                if autre != nom:
+                    masque &= masque_autre
+            facettes[nom] = facette.compter(masque)
+        return Facettes(total=int(np.count_nonzero(total)), facettes=facettes)
+
+
+def read_facettes(session: Session, filtres: Dict[str, Optional[List[str]]]) -> Facettes:
+    """
+    Cette fonction compte les festivals par facette pour la combinaison de filtres donnée.
+    C'est comme compter d'un coup d'œil les stands de chaque allée du festival !
+    """
+    index = obtenir_index(IndexFacettes, session)
+    with verrou_index:
+        return index.compter(filtres)
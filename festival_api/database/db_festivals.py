@@ -1,7 +1,22 @@
+import os
+from datetime import date, datetime, timezone
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from sqlalchemy import delete, exists, insert, lambda_stmt, literal, select, update
 from sqlalchemy.orm import Session, joinedload
-from .db_core import DBFestival, DBAdresse, DBPeriode, DBCategorie, NotFoundError
+from .db_core import DBFestival, DBFestivalFlat, DBAdresse, DBPeriode, DBCategorie, DBChangement, NotFoundError
+from .db_ecriture import ecrire
+from .db_periodes import festivals_en_cours
+from .periodes import jours_periode
+
+# Nombre maximal d'identifiants par requête de recherche groupée
+MAX_IDS_RECHERCHE = 5000
+# Taille des paquets de la clause IN, sous la limite de 999 variables des anciennes versions de SQLite
+TAILLE_PAQUET_IN = 900
+# Nombre de festivals renvoyés par la lecture de la liste, complète ou projetée
+NB_FESTIVALS_LISTE = 5
+# Lecture des festivals dans la table dénormalisée festival_flat au lieu des quatre tables jointes
+LECTURE_FESTIVAL_FLAT = os.getenv("LECTURE_FESTIVAL_FLAT") == "True"
 
 # Les classes de modèles pour l'API
 from pydantic import BaseModel
@@ -22,6 +37,8 @@ class CategorieBase(BaseModel):
 class PeriodeBase(BaseModel):
     periode: str
     categorie_periode: str
+    jour_debut: Optional[int] = None
+    jour_fin: Optional[int] = None
 
 class FestivalBase(BaseModel):
     nom_festival: str
@@ -43,17 +60,74 @@ class FestivalUpdate(FestivalBase):
     categorie: CategorieBase
     periode: PeriodeBase
 
+class AdressePatch(BaseModel):
+    adresse_postale: Optional[str] = None
+    code_insee: Optional[str] = None
+    region: Optional[str] = None
+    departement: Optional[str] = None
+    commune: Optional[str] = None
+    longitude: Optional[float] = None
+    latitude: Optional[float] = None
+
+class CategoriePatch(BaseModel):
+    discipline_dominante: Optional[str] = None
+    sous_categorie: Optional[str] = None
+
+class PeriodePatch(BaseModel):
+    periode: Optional[str] = None
+    categorie_periode: Optional[str] = None
+    jour_debut: Optional[int] = None
+    jour_fin: Optional[int] = None
+
+class FestivalPatch(BaseModel):
+    nom_festival: Optional[str] = None
+    annee_creation: Optional[int] = None
+    site_internet: Optional[str] = None
+    adresse: Optional[AdressePatch] = None
+    categorie: Optional[CategoriePatch] = None
+    periode: Optional[PeriodePatch] = None
+
+class RechercheIds(BaseModel):
+    ids: List[int] = Field(max_length=MAX_IDS_RECHERCHE)
+
+class ResultatRecherche(BaseModel):
+    id_festival: int
+    festival: Optional[Festival] = None
+
 # Fonctions pour interagir avec la base de données
+# Requêtes de lecture construites une fois à l'import : les options de chargement et les jointures
+# ne sont plus recréées à chaque appel
+SELECT_FESTIVALS = select(DBFestival).options(
+    joinedload(DBFestival.adresse),
+    joinedload(DBFestival.categorie),
+    joinedload(DBFestival.periode)
+)
+SELECT_FESTIVALS_FLAT = select(DBFestivalFlat)
+SELECT_LISTE_FESTIVALS = SELECT_FESTIVALS.order_by(DBFestival.id_festival).limit(NB_FESTIVALS_LISTE)
+SELECT_LISTE_FESTIVALS_FLAT = SELECT_FESTIVALS_FLAT.order_by(DBFestivalFlat.id_festival).limit(NB_FESTIVALS_LISTE)
+
+def requete_festivals(session: Session):
+    """
+    Cette fonction retourne la requête de lecture des festivals complets et le modèle interrogé :
+    festival_flat si LECTURE_FESTIVAL_FLAT est activé, sinon festival avec ses trois relations.
+    """
+    if LECTURE_FESTIVAL_FLAT:
+        return SELECT_FESTIVALS_FLAT, DBFestivalFlat
+    return SELECT_FESTIVALS, DBFestival
+
 def read_db_one_festival(id_festival: int, session: Session) -> DBFestival:
     """
     Cette fonction récupère un festival spécifique de la base de données.
+    La requête est une lambda_stmt : SQLAlchemy reconnaît la lambda à son code et réutilise la
+    requête déjà compilée sans la reconstruire ni recalculer sa clé de cache, seul l'identifiant
+    change d'un appel à l'autre.
     C'est comme trouver un événement spécifique dans le calendrier du festival !
     """
-    db_festival = session.query(DBFestival).options(
-        joinedload(DBFestival.adresse),
-        joinedload(DBFestival.categorie),
-        joinedload(DBFestival.periode)
-    ).filter(DBFestival.id_festival == id_festival).first()
+    if LECTURE_FESTIVAL_FLAT:
+        requete = lambda_stmt(lambda: SELECT_FESTIVALS_FLAT.where(DBFestivalFlat.id_festival == id_festival).limit(1))
+    else:
+        requete = lambda_stmt(lambda: SELECT_FESTIVALS.where(DBFestival.id_festival == id_festival).limit(1))
+    db_festival = session.scalars(requete).first()
 
     if db_festival is None:
         raise NotFoundError(f"Item with id {id_festival} not found.")
@@ -61,19 +135,49 @@ def read_db_one_festival(id_festival: int, session: Session) -> DBFestival:
 
 def read_db_festival(session: Session) -> List[DBFestival]:
     """
-    Cette fonction récupère les 5 premiers festivals de la base de données.
+    Cette fonction récupère les NB_FESTIVALS_LISTE premiers festivals de la base de données, par identifiant.
     C'est comme regarder les 5 premiers événements dans le calendrier du festival !
     """
-    db_festivals = session.query(DBFestival).options(
-        joinedload(DBFestival.adresse),
-        joinedload(DBFestival.categorie),
-        joinedload(DBFestival.periode)
-    ).limit(5).all()
+    if LECTURE_FESTIVAL_FLAT:
+        requete = lambda_stmt(lambda: SELECT_LISTE_FESTIVALS_FLAT)
+    else:
+        requete = lambda_stmt(lambda: SELECT_LISTE_FESTIVALS)
+    db_festivals = session.scalars(requete).all()
 
     if not db_festivals:
         raise NotFoundError("No festivals found in the database.")
     return db_festivals
 
+def read_db_festivals_en_cours(du: date, au: date, session: Session, limit: int = 100, offset: int = 0) -> List[DBFestival]:
+    """
+    Cette fonction récupère les festivals qui se déroulent entre deux dates, grâce à l'index des périodes.
+    C'est comme feuilleter le calendrier du festival à la bonne semaine sans relire toutes les pages !
+    """
+    ids = festivals_en_cours(session, du, au)[offset:offset + limit]
+    if not ids:
+        return []
+    requete, modele = requete_festivals(session)
+    return session.scalars(requete.where(modele.id_festival.in_(ids)).order_by(modele.id_festival)).all()
+
+def read_db_festivals_par_ids(ids: List[int], session: Session) -> List[ResultatRecherche]:
+    """
+    Cette fonction récupère plusieurs festivals à partir de leurs identifiants, avec une requête IN
+    par paquet de TAILLE_PAQUET_IN identifiants. Les résultats suivent l'ordre de la liste demandée
+    et un identifiant inconnu donne un résultat sans festival.
+    C'est comme retirer tous les billets réservés au guichet en une seule fois !
+    """
+    uniques = list(dict.fromkeys(ids))
+    trouves = {}
+    requete, modele = requete_festivals(session)
+    for debut in range(0, len(uniques), TAILLE_PAQUET_IN):
+        paquet = uniques[debut:debut + TAILLE_PAQUET_IN]
+        for db_festival in session.scalars(requete.where(modele.id_festival.in_(paquet))):
+            trouves[db_festival.id_festival] = db_festival
+    return [ResultatRecherche(id_festival=id_festival,
+                              festival=Festival.model_validate(trouves[id_festival], from_attributes=True)
+                              if id_festival in trouves else None)
+            for id_festival in ids]
+
 def generate_id(session: Session) -> int:
     """
     Cette fonction génère un nouvel identifiant pour un festival.
@@ -82,17 +186,31 @@ def generate_id(session: Session) -> int:
     last_id = session.query(DBFestival.id_festival).order_by(DBFestival.id_festival.desc()).first()
     return last_id[0] + 1 if last_id else 1  
 
-def create_db_festival(festival_data: FestivalCreate, session: Session) -> DBFestival:
+def _journaliser(session: Session, id_festival: int, operation: str) -> None:
     """
-    Cette fonction crée un nouvel enregistrement de festival dans la base de données.
-    C'est comme ajouter un nouvel événement dans le calendrier du festival !
+    Cette fonction ajoute une ligne au journal des changements, dans la transaction de l'écriture.
+    C'est comme noter chaque modification du programme dans le registre de la billetterie !
+    """
+    session.add(DBChangement(id_festival=id_festival, operation=operation,
+                             date_changement=datetime.now(timezone.utc).isoformat()))
+
+def completer_jours(valeurs: dict) -> dict:
     """
+    Cette fonction recalcule les jours de début et de fin à partir du texte de la période quand il
+    est modifié sans jours explicites, pour que l'index des périodes suive le nouveau texte.
+    C'est comme réécrire les dates sur l'affiche quand le programme annonce une nouvelle période !
+    """
+    if valeurs.get("periode") is not None and "jour_debut" not in valeurs and "jour_fin" not in valeurs:
+        valeurs["jour_debut"], valeurs["jour_fin"] = jours_periode(valeurs["periode"])
+    return valeurs
+
+def _inserer_festival(festival_data: FestivalCreate, session: Session) -> int:
     id_festival = generate_id(session)
     
     # Créer les instances des relations à partir des données fournies
     adresse = DBAdresse(**festival_data.adresse.model_dump())
     categorie = DBCategorie(**festival_data.categorie.model_dump())
-    periode = DBPeriode(**festival_data.periode.model_dump())
+    periode = DBPeriode(**completer_jours(festival_data.periode.model_dump(exclude_unset=True)))
     
     # Créer l'instance du festival avec ses relations
     db_festival = DBFestival(
@@ -106,17 +224,56 @@ def create_db_festival(festival_data: FestivalCreate, session: Session) -> DBFes
     )
     
     session.add(db_festival)
-    session.commit()
-    session.refresh(db_festival)
-    
-    return db_festival
+    _journaliser(session, id_festival, "create")
+    session.flush()
+    return id_festival
 
-def update_db_festival(festival_id: int, festival_data: FestivalUpdate, session: Session) -> DBFestival:
+def create_db_festival(festival_data: FestivalCreate, session: Session) -> DBFestival:
     """
-    Cette fonction met à jour les informations d'un festival existant dans la base de données.
-    C'est comme modifier les informations d'un événement déjà planifié !
+    Cette fonction crée un nouvel enregistrement de festival dans la base de données.
+    C'est comme ajouter un nouvel événement dans le calendrier du festival !
+    """
+    id_festival = ecrire(_inserer_festival, festival_data, session=session)
+    return read_db_one_festival(id_festival, session)
+
+# Relations modifiables par PATCH : table, clé étrangère du festival et clé primaire de la table
+RELATIONS_PATCH = {
+    "adresse": (DBAdresse, DBFestival.id_adresse, DBAdresse.id_adresse),
+    "categorie": (DBCategorie, DBFestival.id_categorie, DBCategorie.id_categorie),
+    "periode": (DBPeriode, DBFestival.id_periode, DBPeriode.id_periode),
+}
+
+def _copier_relation(session: Session, nom: str, id_relation: Optional[int], valeurs: dict) -> int:
+    """
+    Cette fonction insère une copie de la ligne id_relation avec les valeurs modifiées, en un seul
+    INSERT ... SELECT, et retourne l'identifiant de la nouvelle ligne.
+    """
+    table, _, cle_primaire = RELATIONS_PATCH[nom]
+    nouvelle = None
+    if id_relation is not None:
+        colonnes = [colonne for colonne in table.__table__.columns if not colonne.primary_key]
+        copie = select(*[literal(valeurs[colonne.key], colonne.type) if colonne.key in valeurs else colonne
+                         for colonne in colonnes]).where(cle_primaire == id_relation)
+        nouvelle = session.execute(insert(table).from_select(colonnes, copie).returning(cle_primaire)).scalar()
+    if nouvelle is None:
+        nouvelle = session.execute(insert(table).values(**valeurs).returning(cle_primaire)).scalar_one()
+    return nouvelle
+
+def _supprimer_relation_orpheline(session: Session, nom: str, id_relation: Optional[int]) -> None:
+    """
+    Cette fonction supprime la ligne id_relation si plus aucun festival n'y fait référence.
     """
-    db_festival = session.query(DBFestival).filter(DBFestival.id_festival == festival_id).first()
+    if id_relation is None:
+        return
+    table, cle, cle_primaire = RELATIONS_PATCH[nom]
+    session.execute(delete(table).where(cle_primaire == id_relation, ~exists().where(cle == id_relation)))
+
+def _modifier_festival(festival_id: int, festival_data: FestivalUpdate, session: Session) -> int:
+    db_festival = session.query(DBFestival).options(
+        joinedload(DBFestival.adresse),
+        joinedload(DBFestival.categorie),
+        joinedload(DBFestival.periode)
+    ).filter(DBFestival.id_festival == festival_id).first()
     if not db_festival:
         raise NotFoundError(f"Festival with id {festival_id} not found.")
 
@@ -128,39 +285,87 @@ def update_db_festival(festival_id: int, festival_data: FestivalUpdate, session:
     if festival_data.site_internet is not None:
         db_festival.site_internet = festival_data.site_internet
 
-    # Mise à jour de l'adresse
+    # Les lignes d'adresse, de catégorie et de période peuvent être partagées par plusieurs festivals :
+    # le festival reçoit de nouvelles lignes au lieu de modifier celles des autres
+    anciennes = {nom: getattr(db_festival, cle.key) for nom, (_, cle, _) in RELATIONS_PATCH.items()}
     if festival_data.adresse:
-        if db_festival.adresse:
-            for key, value in festival_data.adresse.dict(exclude_unset=True).items():
-                setattr(db_festival.adresse, key, value)
-        else:
-            db_festival.adresse = DBAdresse(**festival_data.adresse.dict())
-
-    # Mise à jour de la catégorie
+        db_festival.adresse = DBAdresse(**festival_data.adresse.model_dump())
     if festival_data.categorie:
-        if db_festival.categorie:
-            for key, value in festival_data.categorie.dict(exclude_unset=True).items():
-                setattr(db_festival.categorie, key, value)
-        else:
-            db_festival.categorie = DBCategorie(**festival_data.categorie.dict())
-
-    # Mise à jour de la période
+        db_festival.categorie = DBCategorie(**festival_data.categorie.model_dump())
     if festival_data.periode:
-        if db_festival.periode:
-            for key, value in festival_data.periode.dict(exclude_unset=True).items():
-                setattr(db_festival.periode, key, value)
-        else:
-            db_festival.periode = DBPeriode(**festival_data.periode.dict())
-
-    session.commit()
-    session.refresh(db_festival)
-    return db_festival
+        db_festival.periode = DBPeriode(**completer_jours(festival_data.periode.model_dump(exclude_unset=True)))
+    session.flush()
+    for nom, id_relation in anciennes.items():
+        _supprimer_relation_orpheline(session, nom, id_relation)
 
-def delete_db_festival(festival_id: int, db: Session) -> bool:
+    _journaliser(session, festival_id, "update")
+    session.flush()
+    return festival_id
+
+def update_db_festival(festival_id: int, festival_data: FestivalUpdate, session: Session) -> DBFestival:
+    """
+    Cette fonction met à jour les informations d'un festival existant dans la base de données.
+    C'est comme modifier les informations d'un événement déjà planifié !
+    """
+    ecrire(_modifier_festival, festival_id, festival_data, session=session)
+    return read_db_one_festival(festival_id, session)
+
+def _patcher_festival(festival_id: int, festival_data: FestivalPatch, session: Session) -> int:
+    modifications = festival_data.model_dump(exclude_unset=True, exclude_none=True)
+    # Toutes les clés de relation sont retirées, même vides ({"adresse": {"commune": null}} donne {})
+    relations = {nom: valeurs for nom in RELATIONS_PATCH
+                 if (valeurs := modifications.pop(nom, None))}
+    if "periode" in relations:
+        completer_jours(relations["periode"])
+
+    # Les lignes enfants peuvent être partagées par plusieurs festivals : le festival modifié reçoit
+    # une copie modifiée de la ligne et l'ancienne est supprimée si plus personne ne l'utilise
+    anciennes = {}
+    if relations:
+        ligne = session.execute(select(*[cle for _, cle, _ in RELATIONS_PATCH.values()])
+                                .where(DBFestival.id_festival == festival_id)).first()
+        if ligne is None:
+            raise NotFoundError(f"Festival with id {festival_id} not found.")
+        for nom, valeurs in relations.items():
+            cle = RELATIONS_PATCH[nom][1]
+            anciennes[nom] = ligne._mapping[cle.key]
+            modifications[cle.key] = _copier_relation(session, nom, anciennes[nom], valeurs)
+
+    if modifications:
+        resultat = session.execute(update(DBFestival).where(DBFestival.id_festival == festival_id)
+                                   .values(**modifications))
+        if resultat.rowcount == 0:
+            raise NotFoundError(f"Festival with id {festival_id} not found.")
+    elif session.get(DBFestival, festival_id) is None:
+        raise NotFoundError(f"Festival with id {festival_id} not found.")
+    else:
+        # Rien à modifier : pas d'écriture ni de ligne dans le journal des changements
+        return festival_id
+
+    for nom, id_relation in anciennes.items():
+        _supprimer_relation_orpheline(session, nom, id_relation)
+    _journaliser(session, festival_id, "update")
+    return festival_id
+
+def patch_db_festival(festival_id: int, festival_data: FestivalPatch, session: Session) -> DBFestival:
+    """
+    Cette fonction applique uniquement les champs envoyés (les valeurs nulles sont ignorées) avec
+    un UPDATE ciblé du festival et une copie des lignes d'adresse, de catégorie ou de période
+    modifiées, puis relit le festival en une seule requête.
+    C'est comme corriger une seule ligne du programme sans le réimprimer en entier !
+    """
+    ecrire(_patcher_festival, festival_id, festival_data, session=session)
+    return read_db_one_festival(festival_id, session)
+
+def _supprimer_festival(festival_id: int, db: Session) -> Optional[int]:
     db_festival = db.query(DBFestival).filter(DBFestival.id_festival == festival_id).first()
     if db_festival is None:
-        return False  # Le festival n'existe pas, donc la suppression n'a pas eu lieu
+        return None
     db.delete(db_festival)
-    db.commit()
-    return True  # Le festival a été supprimé avec succès
+    _journaliser(db, festival_id, "delete")
+    db.flush()
+    return festival_id
 
+def delete_db_festival(festival_id: int, db: Session) -> bool:
+    # Le festival n'existe pas si aucun identifiant n'est renvoyé, donc la suppression n'a pas eu lieu
+    return ecrire(_supprimer_festival, festival_id, session=db) is not None
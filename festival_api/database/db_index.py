@@ -0,0 +1,112 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .db_core import DBFestival, DBAdresse, DBCategorie, DBPeriode
+
+# Colonnes à plat d'un festival, utilisées pour construire les index en mémoire
+COLONNES_FESTIVAL = [
+    DBFestival.id_festival, DBFestival.nom_festival, DBFestival.annee_creation, DBFestival.site_internet,
+    DBAdresse.adresse_postale, DBAdresse.code_insee, DBAdresse.region, DBAdresse.departement,
+    DBAdresse.commune, DBAdresse.longitude, DBAdresse.latitude,
+    DBCategorie.discipline_dominante, DBCategorie.sous_categorie,
+    DBPeriode.periode, DBPeriode.categorie_periode, DBPeriode.jour_debut, DBPeriode.jour_fin,
+]
+
+
+class IndexFestivals(ABC):
+    """
+    Classe de base des index en mémoire sur les festivals.
+    Un index est construit une fois à partir de toutes les lignes de la base, puis tenu à
+    jour ligne par ligne par les fonctions d'écriture de db_festivals. Une sous-classe qui
+    n'implémente pas les trois méthodes ne peut pas être instanciée.
+    """
+
+    @abstractmethod
+    def construire(self, lignes: List[dict]) -> None:
+        ...
+
+    @abstractmethod
+    def ajouter(self, ligne: dict) -> None:
+        ...
+
+    @abstractmethod
+    def retirer(self, id_festival: int) -> None:
+        ...
+
+
+_index: Dict[type, IndexFestivals] = {}
+verrou_index = threading.RLock()
+# Fonctions appelées avec la session avant chaque utilisation d'un index
+_avant_lecture: List[Callable[[Session], None]] = []
+
+
+def avant_lecture(fonction: Callable[[Session], None]) -> None:
+    """
+    Cette fonction enregistre une fonction à appeler avant chaque utilisation d'un index,
+    par exemple pour le mettre à jour des écritures faites par un autre processus.
+    """
+    _avant_lecture.append(fonction)
+
+
+def retirer_avant_lecture(fonction: Callable[[Session], None]) -> None:
+    if fonction in _avant_lecture:
+        _avant_lecture.remove(fonction)
+
+
+def lignes_festivals(session: Session, ids: Optional[List[int]] = None) -> List[dict]:
+    """
+    Cette fonction lit les festivals sous forme de dictionnaires à plat (une ligne par festival).
+    C'est comme photocopier la fiche complète de chaque événement du festival !
+    """
+    requete = session.query(*COLONNES_FESTIVAL) \
+        .outerjoin(DBAdresse, DBFestival.id_adresse == DBAdresse.id_adresse) \
+        .outerjoin(DBCategorie, DBFestival.id_categorie == DBCategorie.id_categorie) \
+        .outerjoin(DBPeriode, DBFestival.id_periode == DBPeriode.id_periode)
+    if ids is not None:
+        requete = requete.filter(DBFestival.id_festival.in_(ids))
+    return [dict(ligne._mapping) for ligne in requete.all()]
+
+
+def obtenir_index(classe: type, session: Session) -> IndexFestivals:
+    """
+    Cette fonction retourne l'index demandé, en le construisant depuis la base au premier appel.
+    C'est comme préparer le plan du festival une fois pour toutes avant l'ouverture !
+    """
+    for fonction in _avant_lecture:
+        fonction(session)
+    index = _index.get(classe)
+    if index is not None:
+        return index
+    with verrou_index:
+        if classe not in _index:
+            index = classe()
+            index.construire(lignes_festivals(session))
+            _index[classe] = index
+        return _index[classe]
+
+
+def synchroniser_festival(session: Session, id_festival: int) -> None:
+    """
+    Cette fonction répercute la création, la modification ou la suppression d'un festival
+    sur tous les index déjà construits.
+    C'est comme mettre à jour tous les panneaux du site quand un concert change de scène !
+    """
+    with verrou_index:
+        if not _index:
+            return
+        lignes = lignes_festivals(session, [id_festival])
+        for index in _index.values():
+            index.retirer(id_festival)
+            for ligne in lignes:
+                index.ajouter(ligne)
+
+
+def invalider_index() -> None:
+    """
+    Cette fonction oublie tous les index, qui seront reconstruits à leur prochaine utilisation.
+    """
+    with verrou_index:
+        _index.clear()
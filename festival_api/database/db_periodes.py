@@ -0,0 +1,152 @@
+from datetime import date
+from typing import List, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from .db_index import IndexFestivals, obtenir_index, verrou_index
+
+JOURS_PAR_AN = 365
+# Nombre d'ajouts ou de retraits accumulés avant de reconstruire l'arbre
+SEUIL_RECONSTRUCTION = 256
+
+JOURS_AVANT_MOIS = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+
+
+def jour_de_l_annee(jour: date) -> int:
+    """
+    Cette fonction convertit une date en jour de l'année (1 à 365), en ignorant les années bissextiles
+    (le 29 février est confondu avec le 28).
+    """
+    return JOURS_AVANT_MOIS[jour.month - 1] + min(jour.day, 28 if jour.month == 2 else jour.day)
+
+
+def decouper_intervalle(debut: int, fin: int) -> List[Tuple[int, int]]:
+    """
+    Cette fonction découpe un intervalle qui passe par le 31 décembre en deux intervalles.
+    C'est comme noter un festival du Nouvel An sur deux pages du calendrier !
+    """
+    if debut <= fin:
+        return [(debut, fin)]
+    return [(debut, JOURS_PAR_AN), (1, fin)]
+
+
+class _Noeud:
+    """
+    Un nœud d'arbre d'intervalles centré : il contient les intervalles qui recouvrent son
+    centre, triés par début croissant et par fin décroissante.
+    """
+    __slots__ = ("centre", "par_debut", "par_fin", "gauche", "droite")
+
+    def __init__(self, intervalles):
+        points = sorted(point for debut, fin, _ in intervalles for point in (debut, fin))
+        self.centre = points[len(points) // 2]
+        a_gauche, a_droite, ici = [], [], []
+        for intervalle in intervalles:
+            if intervalle[1] < self.centre:
+                a_gauche.append(intervalle)
+            elif intervalle[0] > self.centre:
+                a_droite.append(intervalle)
+            else:
+                ici.append(intervalle)
+        self.par_debut = sorted(ici, key=lambda i: i[0])
+        self.par_fin = sorted(ici, key=lambda i: -i[1])
+        self.gauche = _Noeud(a_gauche) if a_gauche else None
+        self.droite = _Noeud(a_droite) if a_droite else None
+
+    def chevauchements(self, debut, fin, resultat):
+        noeud = self
+        while noeud is not None:
+            if fin < noeud.centre:
+                for d, _, id_festival in noeud.par_debut:
+                    if d > fin:
+                        break
+                    resultat.add(id_festival)
+                noeud = noeud.gauche
+            elif debut > noeud.centre:
+                for _, f, id_festival in noeud.par_fin:
+                    if f < debut:
+                        break
+                    resultat.add(id_festival)
+                noeud = noeud.droite
+            else:
+                resultat.update(id_festival for _, _, id_festival in noeud.par_debut)
+                if noeud.gauche is not None:
+                    noeud.gauche.chevauchements(debut, fin, resultat)
+                noeud = noeud.droite
+
+
+class IndexPeriodes(IndexFestivals):
+    """
+    Index des périodes des festivals sous forme d'arbre d'intervalles sur les jours de l'année.
+    Une recherche « festivals en cours entre deux dates » coûte O(log n + k).
+
+    Les écritures ne modifient pas l'arbre : les intervalles ajoutés sont gardés dans une
+    petite liste parcourue à chaque recherche et les festivals retirés sont filtrés, jusqu'à
+    ce que SEUIL_RECONSTRUCTION modifications déclenchent la reconstruction de l'arbre.
+    """
+
+    def construire(self, lignes):
+        self.intervalles = {}
+        for ligne in lignes:
+            self._enregistrer(ligne)
+        self._reconstruire()
+
+    def _enregistrer(self, ligne):
+        if ligne["jour_debut"] is None or ligne["jour_fin"] is None:
+            return
+        self.intervalles[ligne["id_festival"]] = decouper_intervalle(ligne["jour_debut"], ligne["jour_fin"])
+
+    def _reconstruire(self):
+        tous = [(debut, fin, id_festival) for id_festival, morceaux in self.intervalles.items()
+                for debut, fin in morceaux]
+        self.racine = _Noeud(tous) if tous else None
+        self.ajouts = []
+        self.retraits = set()
+
+    def ajouter(self, ligne):
+        self._enregistrer(ligne)
+        id_festival = ligne["id_festival"]
+        if id_festival in self.intervalles:
+            self.ajouts.extend((debut, fin, id_festival) for debut, fin in self.intervalles[id_festival])
+        self._reconstruire_si_besoin()
+
+    def retirer(self, id_festival):
+        if self.intervalles.pop(id_festival, None) is not None:
+            self.retraits.add(id_festival)
+            self.ajouts = [intervalle for intervalle in self.ajouts if intervalle[2] != id_festival]
+            self._reconstruire_si_besoin()
+
+    def _reconstruire_si_besoin(self):
+        if len(self.ajouts) + len(self.retraits) >= SEUIL_RECONSTRUCTION:
+            self._reconstruire()
+
+    def en_cours(self, debut: int, fin: int) -> Set[int]:
+        """
+        Retourne les identifiants des festivals dont la période chevauche [debut, fin]
+        (jours de l'année, fin < debut pour une fenêtre qui passe par le 31 décembre).
+        """
+        morceaux = decouper_intervalle(debut, fin)
+        resultat = set()
+        if self.racine is not None:
+            for morceau_debut, morceau_fin in morceaux:
+                self.racine.chevauchements(morceau_debut, morceau_fin, resultat)
+        resultat.difference_update(self.retraits)
+        for morceau_debut, morceau_fin in morceaux:
+            resultat.update(id_festival for d, f, id_festival in self.ajouts
+                            if d <= morceau_fin and f >= morceau_debut)
+        return resultat
+
+
+def festivals_en_cours(session: Session, du: date, au: date) -> List[int]:
+    """
+    Cette fonction retourne, triés, les identifiants des festivals qui se déroulent au moins
+    un jour entre les deux dates (l'année des dates est ignorée).
+    C'est comme demander au calendrier quels événements ont lieu pendant vos vacances !
+    """
+    if (au - du).days >= JOURS_PAR_AN - 1:
+        debut, fin = 1, JOURS_PAR_AN
+    else:
+        debut, fin = jour_de_l_annee(du), jour_de_l_annee(au)
+    index = obtenir_index(IndexPeriodes, session)
+    with verrou_index:
+        return sorted(index.en_cours(debut, fin))
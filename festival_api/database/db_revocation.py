@@ -0,0 +1,138 @@
+import hashlib
+import math
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from .db_core import DBToken
+
+# Nombre de révocations prévu pour le filtre de Bloom et taux de faux positifs visé
+CAPACITE_BLOOM = 100_000
+TAUX_FAUX_POSITIFS = 0.01
+# Nombre de révocations récentes gardées exactement en mémoire
+TAILLE_REVOCATIONS_RECENTES = 10_000
+# Intervalle de relecture des révocations faites par les autres processus, en secondes
+INTERVALLE_RAFRAICHISSEMENT = 1.0
+TYPE_REVOCATION = "revoked"
+
+
+def empreinte(jeton: str) -> str:
+    """
+    Cette fonction retourne l'empreinte SHA-256 d'un jeton, seule forme sous laquelle il est stocké en base.
+    """
+    return hashlib.sha256(jeton.encode()).hexdigest()
+
+
+class FiltreBloom:
+    """
+    Filtre de Bloom : un ensemble approché qui ne donne jamais de faux négatif.
+
+    Les nb_hachages positions d'un élément sont tirées d'un seul condensé BLAKE2b par double
+    hachage ; la taille est calculée pour la capacité et le taux de faux positifs demandés.
+    """
+
+    def __init__(self, capacite: int = CAPACITE_BLOOM, taux: float = TAUX_FAUX_POSITIFS):
+        self.nb_bits = max(64, int(-capacite * math.log(taux) / math.log(2) ** 2))
+        self.nb_hachages = max(1, round(self.nb_bits / capacite * math.log(2)))
+        self.capacite = capacite
+        self.bits = bytearray((self.nb_bits + 7) // 8)
+        self.nb_elements = 0
+
+    def _positions(self, element: str):
+        condense = hashlib.blake2b(element.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(condense[:8], "little")
+        h2 = int.from_bytes(condense[8:], "little") | 1
+        return [(h1 + i * h2) % self.nb_bits for i in range(self.nb_hachages)]
+
+    def ajouter(self, element: str) -> None:
+        for position in self._positions(element):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.nb_elements += 1
+
+    def __contains__(self, element: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(element))
+
+
+class ListeRevocation:
+    """
+    Liste des jetons d'accès révoqués, vérifiée sans requête dans le cas courant.
+
+    Un jeton absent du filtre de Bloom n'est pas révoqué : c'est la réponse pour presque toutes
+    les requêtes. Un jeton présent dans le filtre est cherché dans les révocations récentes,
+    puis seulement en base (faux positif, ou révocation trop ancienne pour être encore en
+    mémoire). Les révocations des autres processus sont relues au plus une fois par
+    INTERVALLE_RAFRAICHISSEMENT secondes.
+    """
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.filtre = FiltreBloom()
+        self.recentes = set()
+        self.ordre = deque()
+        self.dernier_id = 0
+        self.prochain_rafraichissement = 0.0
+
+    def _memoriser(self, hash_jti: str) -> None:
+        if hash_jti in self.recentes:
+            return
+        if self.filtre.nb_elements >= self.filtre.capacite:
+            # Le filtre saturé donnerait trop de faux positifs : il est reconstruit au rafraîchissement
+            self.prochain_rafraichissement = 0.0
+        self.filtre.ajouter(hash_jti)
+        self.recentes.add(hash_jti)
+        self.ordre.append(hash_jti)
+        if len(self.ordre) > TAILLE_REVOCATIONS_RECENTES:
+            self.recentes.discard(self.ordre.popleft())
+
+    def revoquer(self, jti: str, expiration: int, session: Session, user_id: Optional[int] = None) -> None:
+        """
+        Enregistre la révocation d'un jeton d'accès jusqu'à son expiration.
+        """
+        hash_jti = empreinte(jti)
+        session.add(DBToken(token_type=TYPE_REVOCATION, token_hash=hash_jti, expires_at=expiration,
+                            revoked=True, user_id=user_id))
+        session.commit()
+        with self.verrou:
+            self._memoriser(hash_jti)
+
+    def rafraichir(self, session: Session) -> None:
+        """
+        Relit les révocations enregistrées depuis la dernière lecture (par ce processus ou un autre).
+        Le filtre est reconstruit avec les seules révocations non expirées lorsqu'il est saturé.
+        """
+        maintenant = int(time.time())
+        with self.verrou:
+            reconstruire = self.filtre.nb_elements >= self.filtre.capacite
+            requete = session.query(DBToken.id, DBToken.token_hash) \
+                .filter(DBToken.token_type == TYPE_REVOCATION, DBToken.expires_at > maintenant)
+            if not reconstruire:
+                requete = requete.filter(DBToken.id > self.dernier_id)
+            lignes = requete.order_by(DBToken.id).all()
+            if reconstruire:
+                self.filtre = FiltreBloom(max(CAPACITE_BLOOM, 2 * len(lignes)))
+                self.recentes.clear()
+                self.ordre.clear()
+            for id_token, hash_jti in lignes:
+                self._memoriser(hash_jti)
+                self.dernier_id = max(self.dernier_id, id_token)
+            self.prochain_rafraichissement = time.monotonic() + INTERVALLE_RAFRAICHISSEMENT
+
+    def est_revoque(self, jti: str, session: Session) -> bool:
+        """
+        Indique si un jeton d'accès a été révoqué.
+        """
+        if time.monotonic() >= self.prochain_rafraichissement:
+            self.rafraichir(session)
+        hash_jti = empreinte(jti)
+        if hash_jti not in self.filtre:
+            return False
+        if hash_jti in self.recentes:
+            return True
+        return session.query(DBToken.id).filter(DBToken.token_type == TYPE_REVOCATION,
+                                                DBToken.token_hash == hash_jti).first() is not None
+
+
+liste_revocation = ListeRevocation()
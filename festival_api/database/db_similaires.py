@@ -0,0 +1,31 @@
+from typing import List
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from .db_core import DBFestival, DBSimilaire, NotFoundError
+from .db_festivals import Festival, read_db_festivals_par_ids
+
+
+class Similaire(BaseModel):
+    id_festival: int
+    score: float
+    festival: Festival
+
+
+def read_similaires(id_festival: int, session: Session, k: int = 10) -> List[Similaire]:
+    """
+    Cette fonction récupère les k festivals les plus proches d'un festival (mêmes catégories, lieu voisin),
+    lus dans la table similaire précalculée à chaque chargement des données : une recherche par clé
+    primaire, sans aucun calcul pendant la requête. Les festivals supprimés depuis le calcul sont ignorés.
+    C'est comme le panneau « vous aimerez aussi » préparé avant l'ouverture du festival !
+    """
+    if session.get(DBFestival, id_festival) is None:
+        raise NotFoundError(f"Festival with id {id_festival} not found.")
+    voisins = session.query(DBSimilaire.id_similaire, DBSimilaire.score) \
+        .filter(DBSimilaire.id_festival == id_festival) \
+        .order_by(DBSimilaire.rang).limit(k).all()
+    scores = dict(voisins)
+    return [Similaire(id_festival=resultat.id_festival, score=scores[resultat.id_festival], festival=resultat.festival)
+            for resultat in read_db_festivals_par_ids([id_similaire for id_similaire, _ in voisins], session)
+            if resultat.festival is not None]
@@ -0,0 +1,40 @@
+from .periodes import jours_periode
+
+# Colonnes ajoutées après la création initiale du schéma, à ajouter aux bases existantes
+COLONNES_AJOUTEES = {
+    "periode": {"jour_debut": "INTEGER", "jour_fin": "INTEGER"},
+    "tokens": {"token_hash": "VARCHAR", "expires_at": "INTEGER", "revoked": "BOOLEAN", "family": "VARCHAR"},
+}
+# Index sur des colonnes ajoutées, que CREATE TABLE IF NOT EXISTS ne crée pas sur une table existante
+INDEX_AJOUTES = {
+    "ix_tokens_token_hash": ("tokens", "token_hash"),
+}
+
+
+def migrer(conn):
+    """
+    Cette fonction ajoute aux tables existantes les colonnes et les index qui leur manquent, et
+    retourne les colonnes ajoutées ('table.colonne'). Elle travaille sur une connexion sqlite3 pour
+    servir aussi au script d'insertion : une base créée avant l'ajout d'une colonne peut être chargée
+    comme servie. Quand les jours des périodes viennent d'être ajoutés, ils sont calculés à partir
+    du texte de chaque période.
+    C'est comme ajouter une nouvelle colonne au registre du festival sans en recopier les pages !
+    """
+    ajoutees = []
+    for table, colonnes in COLONNES_AJOUTEES.items():
+        existantes = {ligne[1].lower() for ligne in conn.execute(f"PRAGMA table_info({table})")}
+        if not existantes:
+            continue
+        for nom, type_sql in colonnes.items():
+            if nom not in existantes:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {nom} {type_sql}")
+                ajoutees.append(f"{table}.{nom}")
+    for nom_index, (table, colonne) in INDEX_AJOUTES.items():
+        if conn.execute(f"PRAGMA table_info({table})").fetchone() is not None:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {nom_index} ON {table} ({colonne})")
+    if "periode.jour_debut" in ajoutees:
+        periodes = conn.execute("SELECT ID_Periode, Periode FROM PERIODE").fetchall()
+        conn.executemany("UPDATE PERIODE SET Jour_Debut = ?, Jour_Fin = ? WHERE ID_Periode = ?",
+                         [(*jours_periode(periode), id_periode) for id_periode, periode in periodes])
+    conn.commit()
+    return ajoutees
@@ -0,0 +1,45 @@
+import re
+
+MOIS = {
+    'janvier': 1, 'février': 2, 'fevrier': 2, 'mars': 3, 'avril': 4, 'mai': 5, 'juin': 6,
+    'juillet': 7, 'août': 8, 'aout': 8, 'septembre': 9, 'octobre': 10, 'ocotbre': 10,
+    'novembre': 11, 'décembre': 12, 'decembre': 12,
+}
+# Nombre de jours écoulés avant le premier jour de chaque mois (année non bissextile)
+JOURS_AVANT_MOIS = [0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334]
+JOURS_PAR_MOIS = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+# "21 juin - 5 septembre" ou "1er janvier - 20 juin"
+_PLAGE = re.compile(r'^(\d{1,2})(?:er)?\s+(\w+)\s*-\s*(\d{1,2})(?:er)?\s+(\w+)$')
+_MOTS = re.compile(r'[a-zéûô]+')
+
+
+def jours_periode(periode):
+    """
+    Cette fonction convertit une période textuelle en jours de l'année de début et de fin (de 1 à 365),
+    None quand ils ne sont pas reconnus. Les formats reconnus sont "21 Juin - 5 Septembre" (jours
+    précis), "Octobre" (un mois entier) et "Janvier, Février, Mars" (mois consécutifs) ; une période
+    qui passe par le 31 décembre a un jour de fin inférieur à son jour de début.
+    Sans dépendance, elle sert au nettoyage des données, au chargement de la base et à l'API, qui
+    recalcule les jours quand la période d'un festival est modifiée.
+    C'est comme entourer les dates du festival sur le calendrier à partir de l'affiche !
+    """
+    if not isinstance(periode, str):
+        return None, None
+    texte = periode.lower().strip()
+    debut = fin = None
+    plage = _PLAGE.match(texte)
+    if plage:
+        mois_debut, mois_fin = MOIS.get(plage[2]), MOIS.get(plage[4])
+        if mois_debut is not None:
+            debut = JOURS_AVANT_MOIS[mois_debut - 1] + int(plage[1])
+        if mois_fin is not None:
+            fin = JOURS_AVANT_MOIS[mois_fin - 1] + int(plage[3])
+        if mois_debut is not None:
+            return debut, fin
+
+    # "octobre" ou "janvier, février, mars" : du premier jour du premier mois au dernier jour du dernier
+    mois = [MOIS.get(mot) for mot in _MOTS.findall(texte)]
+    if mois and None not in mois and all(b - a == 1 for a, b in zip(mois, mois[1:])):
+        return JOURS_AVANT_MOIS[mois[0] - 1] + 1, JOURS_AVANT_MOIS[mois[-1] - 1] + JOURS_PAR_MOIS[mois[-1] - 1]
+    return debut, fin
@@ -1,18 +1,75 @@
-from fastapi import FastAPI, APIRouter
-from .database.db_core import get_db
+import logging
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from .database.db_core import get_db, initialiser_schema, obtenir_moteur, SessionLocal
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-test_router = APIRouter()
 
-# Importez les routers après avoir créé l'application
-from festival_api.routers import festivals
-from festival_api.routers import authentification
+def prechauffer_index(app: FastAPI) -> None:
+    """
+    Cette fonction construit les index en mémoire (périodes, carte, facettes, recherche instantanée)
+    avant la première requête, avec la session que les routes utiliseront.
+    C'est comme accorder les instruments avant l'arrivée du public !
+    """
+    from .database.db_autocompletion import IndexAutocompletion
+    from .database.db_carte import IndexCarte
+    from .database.db_facettes import IndexFacettes
+    from .database.db_index import obtenir_index
+    from .database.db_periodes import IndexPeriodes
+
+    sessions = app.dependency_overrides.get(get_db, get_db)()
+    session = next(sessions)
+    try:
+        for classe in (IndexPeriodes, IndexCarte, IndexFacettes, IndexAutocompletion):
+            obtenir_index(classe, session)
+    finally:
+        sessions.close()
+
+
+@asynccontextmanager
+async def cycle_de_vie(app: FastAPI):
+    """
+    Cette fonction prépare l'application au démarrage et la range à l'arrêt : le moteur de base de
+    données est créé et le schéma vérifié une seule fois, la tâche d'écriture groupée est démarrée si ECRITURE_GROUPEE=True, la veille des
+    écritures des autres workers si COHERENCE_INTER_PROCESSUS=True, et les index sont préchauffés
+    sauf si PRECHAUFFAGE=False. À l'arrêt, le profilage retire ses écouteurs du moteur.
+    """
+    initialiser_schema(obtenir_moteur())
+
+    # Regroupement des écritures concurrentes dans une seule transaction, activé avec ECRITURE_GROUPEE=True
+    ecriture_groupee = os.getenv("ECRITURE_GROUPEE") == "True"
+    if ecriture_groupee:
+        from .database.db_ecriture import activer_ecriture_groupee
+        activer_ecriture_groupee(SessionLocal)
+
+    # Index tenus à jour des écritures des autres workers, activé par festival_api.serve avec plusieurs workers
+    coherence = os.getenv("COHERENCE_INTER_PROCESSUS") == "True"
+    if coherence:
+        from .database.db_coherence import activer_coherence
+        activer_coherence(SessionLocal)
+
+    if os.getenv("PRECHAUFFAGE") != "False":
+        try:
+            prechauffer_index(app)
+        except Exception:
+            # Les index seront construits à la première requête qui en a besoin
+            logger.exception("Échec du préchauffage des index")
+
+    yield
+
+    if coherence:
+        from .database.db_coherence import desactiver_coherence
+        desactiver_coherence()
+    if ecriture_groupee:
+        from .database.db_ecriture import desactiver_ecriture_groupee
+        desactiver_ecriture_groupee()
+    if os.getenv("PROFILAGE") == "True":
+        from .profilage import desactiver_profilage
+        desactiver_profilage()
 
-app.include_router(festivals.router)
-app.include_router(authentification.router)
 
-@app.get("/")
 def read_root():
     """
     Cette fonction est la racine de l'application.
@@ -20,10 +77,40 @@ def read_root():
     """
     return "Server is running."
 
+
+def create_app() -> FastAPI:
+    """
+    Cette fonction construit l'application : routers, racine, contrôle d'admission si ADMISSION=True
+    et profilage si PROFILAGE=True.
+    Rien n'est lu ni écrit en base ici ; le travail de démarrage est fait dans cycle_de_vie.
+    C'est comme dresser le chapiteau avant d'ouvrir la billetterie !
+    """
+    from festival_api.routers import authentification, festivals
+
+    app = FastAPI(lifespan=cycle_de_vie)
+
+    # Limitation du débit par client et délestage en cas de surcharge, activés avec ADMISSION=True
+    if os.getenv("ADMISSION") == "True":
+        from .admission import activer_admission
+        activer_admission(app)
+
+    app.include_router(festivals.router)
+    app.include_router(authentification.router)
+    app.add_api_route("/", read_root, methods=["GET"])
+
+    # Profilage des requêtes et endpoint /metrics, activés avec PROFILAGE=True
+    if os.getenv("PROFILAGE") == "True":
+        from .profilage import activer_profilage
+        activer_profilage(app)
+    return app
+
+
+app = create_app()
+
 if __name__ == "__main__":
     """
     Cette bloc est le point d'entrée de l'application.
     Il démarre le serveur FastAPI avec uvicorn.
     """
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="127.0.0.1", port=8000)
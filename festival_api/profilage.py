@@ -0,0 +1,397 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Mesures de la requête en cours, partagées avec les threads qui exécutent les routes synchrones
+_mesures_requete = contextvars.ContextVar("mesures_requete", default=None)
+
+SEUIL_N_PLUS_UN = 5
+INTERVALLE_ECHANTILLONNAGE = 0.001
+
+BORNES_DUREE = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BORNES_NOMBRE = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class MesuresRequete:
+    """
+    Les mesures collectées pendant le traitement d'une requête.
+    """
+
+    def __init__(self):
+        self.nb_sql = 0
+        self.duree_sql = 0.0
+        self.duree_serialisation = 0.0
+        self.duree_auth = 0.0
+        self.requetes_sql = Counter()
+        # Threads qui exécutent la route, suivis seulement quand la requête est échantillonnée
+        self.threads = None
+        # Instant où la fonction de la route a rendu son résultat, début de la sérialisation
+        self.fin_route = None
+
+    def requetes_repetees(self, seuil=SEUIL_N_PLUS_UN):
+        """
+        Retourne les instructions SQL exécutées au moins `seuil` fois, signe d'un motif N+1.
+        """
+        return {sql: nb for sql, nb in self.requetes_sql.items() if nb >= seuil}
+
+
+@contextmanager
+def mesurer_phase(phase):
+    """
+    Ajoute la durée du bloc à la phase donnée ('auth' ou 'serialisation') de la requête
+    en cours. Ne fait rien si le profilage n'est pas activé.
+    """
+    mesures = _mesures_requete.get()
+    if mesures is None:
+        yield
+        return
+    debut = time.perf_counter()
+    try:
+        yield
+    finally:
+        duree = time.perf_counter() - debut
+        setattr(mesures, f"duree_{phase}", getattr(mesures, f"duree_{phase}") + duree)
+
+
+class Histogramme:
+    """
+    Un histogramme cumulatif au format Prometheus.
+    """
+
+    def __init__(self, bornes):
+        self.bornes = bornes
+        self.compteurs = [0] * len(bornes)
+        self.somme = 0.0
+        self.total = 0
+
+    def observer(self, valeur):
+        for i, borne in enumerate(self.bornes):
+            if valeur <= borne:
+                self.compteurs[i] += 1
+        self.somme += valeur
+        self.total += 1
+
+    def lignes(self, nom, etiquettes):
+        for borne, compteur in zip(self.bornes, self.compteurs):
+            yield f'{nom}_bucket{{{etiquettes},le="{borne}"}} {compteur}'
+        yield f'{nom}_bucket{{{etiquettes},le="+Inf"}} {self.total}'
+        yield f"{nom}_sum{{{etiquettes}}} {self.somme}"
+        yield f"{nom}_count{{{etiquettes}}} {self.total}"
+
+
+class Metriques:
+    """
+    Agrège les mesures des requêtes par route et les expose au format texte Prometheus.
+    """
+
+    HISTOGRAMMES = {
+        "festival_api_requete_duree_secondes": ("Durée totale de la requête", BORNES_DUREE),
+        "festival_api_sql_requetes": ("Nombre d'instructions SQL par requête", BORNES_NOMBRE),
+        "festival_api_sql_duree_secondes": ("Durée cumulée des instructions SQL", BORNES_DUREE),
+        "festival_api_serialisation_duree_secondes": ("Durée de sérialisation de la réponse", BORNES_DUREE),
+        "festival_api_auth_duree_secondes": ("Durée de l'authentification", BORNES_DUREE),
+    }
+
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._histogrammes = {}
+        self._n_plus_un = Counter()
+
+    def enregistrer(self, methode, route, duree, mesures, n_plus_un):
+        valeurs = {
+            "festival_api_requete_duree_secondes": duree,
+            "festival_api_sql_requetes": mesures.nb_sql,
+            "festival_api_sql_duree_secondes": mesures.duree_sql,
+            "festival_api_serialisation_duree_secondes": mesures.duree_serialisation,
+            "festival_api_auth_duree_secondes": mesures.duree_auth,
+        }
+        with self._verrou:
+            for nom, valeur in valeurs.items():
+                cle = (nom, methode, route)
+                if cle not in self._histogrammes:
+                    self._histogrammes[cle] = Histogramme(self.HISTOGRAMMES[nom][1])
+                self._histogrammes[cle].observer(valeur)
+            if n_plus_un:
+                self._n_plus_un[(methode, route)] += 1
+
+    def exposer(self):
+        lignes = []
+        with self._verrou:
+            for nom, (aide, _) in self.HISTOGRAMMES.items():
+                lignes.append(f"# HELP {nom} {aide}")
+                lignes.append(f"# TYPE {nom} histogram")
+                for (nom_h, methode, route), histogramme in sorted(self._histogrammes.items()):
+                    if nom_h == nom:
+                        lignes.extend(histogramme.lignes(nom, f'methode="{methode}",route="{route}"'))
+            lignes.append("# HELP festival_api_n_plus_un_total Requêtes présentant un motif N+1")
+            lignes.append("# TYPE festival_api_n_plus_un_total counter")
+            for (methode, route), nb in sorted(self._n_plus_un.items()):
+                lignes.append(f'festival_api_n_plus_un_total{{methode="{methode}",route="{route}"}} {nb}')
+        return "\n".join(lignes) + "\n"
+
+
+class EchantillonneurPile:
+    """
+    Profileur par échantillonnage : un thread relève périodiquement la pile des threads
+    suivis, ce qui couvre aussi les routes synchrones exécutées dans le pool de threads
+    (cProfile ne suit que le thread qui l'a démarré). Sans ensemble de threads, tous les
+    autres threads sont relevés.
+    """
+
+    def __init__(self, intervalle=INTERVALLE_ECHANTILLONNAGE, threads=None):
+        self.intervalle = intervalle
+        self.threads = threads
+        self.piles = Counter()
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._echantillonner, daemon=True)
+
+    def demarrer(self):
+        self._thread.start()
+
+    def arreter(self):
+        self._arret.set()
+        self._thread.join()
+
+    def _echantillonner(self):
+        moi = threading.get_ident()
+        while not self._arret.wait(self.intervalle):
+            for ident, frame in sys._current_frames().items():
+                if ident == moi or (self.threads is not None and ident not in self.threads):
+                    continue
+                pile = []
+                while frame is not None:
+                    code = frame.f_code
+                    pile.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+                    frame = frame.f_back
+                pile.reverse()
+                # Les threads inactifs (attente d'une tâche, boucle d'événements) ne sont pas comptés
+                if pile and not pile[-1].startswith(("wait ", "select ", "_worker ", "get ")):
+                    self.piles[tuple(pile)] += 1
+
+    def arbre(self, nb_min=1):
+        """
+        Retourne l'arbre d'appels agrégé sous forme de texte, avec le nombre d'échantillons par nœud.
+        """
+        racine = {}
+        for pile, nb in self.piles.items():
+            noeud = racine
+            for appel in pile:
+                compteur, enfants = noeud.get(appel, (0, {}))
+                noeud[appel] = (compteur + nb, enfants)
+                noeud = enfants
+        lignes = [f"{sum(self.piles.values())} échantillons toutes les {self.intervalle * 1000:g} ms"]
+
+        def parcourir(noeud, profondeur):
+            for appel, (compteur, enfants) in sorted(noeud.items(), key=lambda e: -e[1][0]):
+                if compteur >= nb_min:
+                    lignes.append(f"{'  ' * profondeur}{compteur:>5} {appel}")
+                    parcourir(enfants, profondeur + 1)
+
+        parcourir(racine, 0)
+        return "\n".join(lignes) + "\n"
+
+
+@contextmanager
+def _thread_suivi():
+    """
+    Ajoute le thread courant aux threads échantillonnés de la requête en cours, le temps du bloc,
+    et note l'instant où le bloc se termine.
+    """
+    mesures = _mesures_requete.get()
+    if mesures is None:
+        yield
+        return
+    ident = threading.get_ident()
+    if mesures.threads is not None:
+        mesures.threads.add(ident)
+    try:
+        yield
+    finally:
+        if mesures.threads is not None:
+            mesures.threads.discard(ident)
+        mesures.fin_route = time.perf_counter()
+
+
+def suivre_thread(fonction):
+    """
+    Enveloppe la fonction d'une route pour que ?profile=1 n'échantillonne que le thread qui
+    l'exécute, et pas les requêtes traitées en même temps par les autres threads du pool.
+    """
+    if asyncio.iscoroutinefunction(fonction):
+        @functools.wraps(fonction)
+        async def route(*args, **kwargs):
+            with _thread_suivi():
+                return await fonction(*args, **kwargs)
+    else:
+        @functools.wraps(fonction)
+        def route(*args, **kwargs):
+            with _thread_suivi():
+                return fonction(*args, **kwargs)
+    route.thread_suivi = True
+    return route
+
+
+class RouteProfilee(APIRoute):
+    """
+    Route qui mesure sa propre exécution quand la requête est profilée : le thread qui exécute la
+    fonction de la route est suivi par l'échantillonneur, et le temps écoulé entre le retour de la
+    fonction et la réponse prête est compté comme sérialisation. Hors d'une requête profilée, la
+    route se comporte comme une APIRoute.
+    """
+
+    def get_route_handler(self):
+        if not getattr(self.dependant.call, "thread_suivi", False):
+            self.dependant.call = suivre_thread(self.dependant.call)
+        gestionnaire = super().get_route_handler()
+
+        async def gestionnaire_profile(request):
+            mesures = _mesures_requete.get()
+            if mesures is None:
+                return await gestionnaire(request)
+            mesures.fin_route = None
+            response = await gestionnaire(request)
+            if mesures.fin_route is not None:
+                mesures.duree_serialisation += time.perf_counter() - mesures.fin_route
+            return response
+
+        return gestionnaire_profile
+
+
+def _avant_execution(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._debut_profilage = time.perf_counter()
+
+
+def _compter_execution(context, statement):
+    mesures = _mesures_requete.get()
+    debut = getattr(context, "_debut_profilage", None)
+    if mesures is not None and debut is not None:
+        mesures.nb_sql += 1
+        mesures.duree_sql += time.perf_counter() - debut
+        mesures.requetes_sql[statement] += 1
+
+
+def _apres_execution(conn, cursor, statement, parameters, context, executemany):
+    _compter_execution(context, statement)
+
+
+def _erreur_execution(contexte_exception):
+    # after_cursor_execute n'est pas appelé pour une instruction en erreur
+    if contexte_exception.execution_context is not None:
+        _compter_execution(contexte_exception.execution_context, contexte_exception.statement)
+
+
+ECOUTEURS = (
+    ("before_cursor_execute", _avant_execution),
+    ("after_cursor_execute", _apres_execution),
+    ("handle_error", _erreur_execution),
+)
+
+
+def activer_profilage(app, moteur=None, seuil_n_plus_un=SEUIL_N_PLUS_UN):
+    """
+    Active le profilage des requêtes sur l'application.
+
+    Pour chaque requête sont mesurés : la durée totale, le nombre et la durée cumulée des
+    instructions SQL (événements before/after_cursor_execute du moteur), la durée de
+    sérialisation de la réponse et la durée de l'authentification. Les histogrammes
+    agrégés sont exposés sur /metrics au format Prometheus. Une requête avec ?profile=1
+    renvoie l'arbre d'appels échantillonné au lieu de sa réponse, et une instruction SQL
+    répétée au moins `seuil_n_plus_un` fois est signalée comme motif N+1.
+
+    La sérialisation et le thread de la route ne sont mesurés que pour les routes déclarées avec
+    RouteProfilee. L'activer sur plusieurs applications n'écoute le moteur qu'une fois ;
+    desactiver_profilage retire les écouteurs du moteur.
+
+    Args:
+        app (FastAPI): L'application à instrumenter.
+        moteur (Engine): Le moteur SQLAlchemy à écouter, celui de db_core par défaut.
+        seuil_n_plus_un (int): Le nombre de répétitions d'une instruction à partir duquel alerter.
+
+    Returns:
+        Metriques: Les métriques agrégées.
+    """
+    if moteur is None:
+        from .database.db_core import obtenir_moteur
+        moteur = obtenir_moteur()
+
+    metriques = Metriques()
+    for nom, ecouteur in ECOUTEURS:
+        if not event.contains(moteur, nom, ecouteur):
+            event.listen(moteur, nom, ecouteur)
+
+    @app.middleware("http")
+    async def profiler_requete(request: Request, call_next):
+        if request.url.path == "/metrics":
+            return await call_next(request)
+
+        mesures = MesuresRequete()
+        jeton = _mesures_requete.set(mesures)
+        echantillonneur = None
+        if request.query_params.get("profile") == "1":
+            mesures.threads = set()
+            echantillonneur = EchantillonneurPile(threads=mesures.threads)
+            echantillonneur.demarrer()
+        debut = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            duree = time.perf_counter() - debut
+            _mesures_requete.reset(jeton)
+            if echantillonneur is not None:
+                echantillonneur.arreter()
+
+        route = request.scope.get("route")
+        chemin = route.path if route is not None else "inconnue"
+        repetees = mesures.requetes_repetees(seuil_n_plus_un)
+        if repetees:
+            logger.warning(f"Motif N+1 détecté sur {request.method} {chemin} : "
+                           f"{max(repetees.values())} exécutions de la même instruction SQL")
+        metriques.enregistrer(request.method, chemin, duree, mesures, bool(repetees))
+
+        if echantillonneur is not None:
+            response = PlainTextResponse(echantillonneur.arbre())
+        response.headers["X-Duree-Requete"] = f"{duree * 1000:.3f}ms"
+        response.headers["X-Requetes-SQL"] = str(mesures.nb_sql)
+        response.headers["X-Duree-SQL"] = f"{mesures.duree_sql * 1000:.3f}ms"
+        if repetees:
+            response.headers["X-N-Plus-Un"] = str(max(repetees.values()))
+        return response
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def exposer_metriques():
+        """
+        Cette fonction expose les métriques agrégées au format texte Prometheus.
+        """
+        return metriques.exposer()
+
+    return metriques
+
+
+def desactiver_profilage(moteur=None):
+    """
+    Retire du moteur les écouteurs posés par activer_profilage. Les instructions SQL ne sont
+    alors plus comptées, pour aucune des applications profilées sur ce moteur.
+
+    Args:
+        moteur (Engine): Le moteur SQLAlchemy écouté, celui de db_core par défaut.
+    """
+    if moteur is None:
+        from .database.db_core import obtenir_moteur
+        moteur = obtenir_moteur()
+    for nom, ecouteur in ECOUTEURS:
+        if event.contains(moteur, nom, ecouteur):
+            event.remove(moteur, nom, ecouteur)
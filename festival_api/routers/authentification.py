@@ -2,18 +2,18 @@ from datetime import timedelta
 from fastapi import APIRouter, HTTPException, Request, status
 from fastapi.params import Depends
 from sqlalchemy.orm import Session
-from typing import List, Annotated
+from typing import List, Annotated, Optional
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from ..database.db_core import get_db, DBUsers
-from ..database.db_authentification import Token, User, UserCreate, authenticate_user, create_db_user, ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, get_password_hash
+from ..database.db_authentification import Token, User, UserCreate, RefreshRequest, authenticate_user, create_db_user, ACCESS_TOKEN_EXPIRE_MINUTES, create_access_token, get_password_hash, \
+    create_refresh_token, rotate_refresh_token, revoke_access_token, revoke_refresh_token
 from festival_api.database.auth_utils import has_access
-from festival_api.main import app  
-
-
+from ..profilage import RouteProfilee
 
 
 router = APIRouter(
     prefix="/auth",
+    route_class=RouteProfilee,
 )
 
 @router.post("/create_user", response_model=User)
@@ -65,7 +65,41 @@ async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm,
     access_token = create_access_token(
         data={"sub": user.username}, expires_delta=access_token_expires
     )
-    return Token(access_token=access_token, token_type="bearer")
+    return Token(access_token=access_token, token_type="bearer", refresh_token=create_refresh_token(user.id, db))
+
+
+@router.post("/refresh")
+def refresh_access_token(body: RefreshRequest, db: Session = Depends(get_db)) -> Token:
+    """
+    Cette fonction échange un jeton de rafraîchissement contre un nouveau jeton d'accès, sans mot de passe
+    ni bcrypt. Le jeton de rafraîchissement utilisé est remplacé par celui de la réponse.
+    C'est comme faire tamponner son bracelet à l'entrée au lieu de racheter un billet !
+    """
+    rotation = rotate_refresh_token(body.refresh_token, db)
+    if rotation is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user, refresh_token = rotation
+    access_token = create_access_token(
+        data={"sub": user.username}, expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(current_user: Annotated[User, Depends(has_access)], token: Annotated[str, Depends(oauth2_scheme)],
+                 body: Optional[RefreshRequest] = None, db: Session = Depends(get_db)):
+    """
+    Cette fonction révoque le jeton d'accès utilisé et, s'il est fourni, le jeton de rafraîchissement
+    avec toute sa famille.
+    C'est comme rendre son badge et son bracelet en quittant le festival !
+    """
+    revoke_access_token(token, db)
+    if body is not None:
+        revoke_refresh_token(body.refresh_token, current_user.id, db)
 
 
 
@@ -1,47 +1,222 @@
-from fastapi import APIRouter, HTTPException, Request, status, Depends, Response
+import math
+from datetime import date
+from fastapi import APIRouter, HTTPException, Request, status, Depends, Response, Query, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from ..database import db_authentification
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional, Union
 from ..database.db_core import NotFoundError, get_db
 from ..database.db_authentification import User
 from ..database.db_festivals import Festival, FestivalCreate, FestivalUpdate, read_db_festival, read_db_one_festival, \
-    create_db_festival, update_db_festival, delete_db_festival
+    create_db_festival, update_db_festival, delete_db_festival, read_db_festivals_en_cours, \
+    read_db_festivals_par_ids, RechercheIds, ResultatRecherche, FestivalPatch, patch_db_festival, NB_FESTIVALS_LISTE
 from fastapi import APIRouter, Depends, HTTPException, status
 from ..database.db_core import DBFestival
+from ..database.db_carte import Cluster, read_clusters
+from ..database.db_facettes import Facettes, read_facettes
+from ..database.db_autocompletion import Suggestion, read_suggestions
+from ..database.db_champs import FestivalProjection, analyser_champs, read_db_projection, read_db_one_projection, \
+    serialiser_projection
+from ..database.db_periodes import festivals_en_cours
+from ..database.db_coalescence import lecture_partagee, serialiser_festivals
+from ..database.db_similaires import Similaire, read_similaires
+from ..database.db_changements import diffuseur, dernier_changement, read_changements, flux_changements, \
+    changements_purges
 from ..database.db_authentification import has_access
+from ..profilage import RouteProfilee
 
 router = APIRouter(
     prefix="/festivals",
+    route_class=RouteProfilee,
 )
 
 PROTECTED = Depends(db_authentification.has_access)
+FIELDS = Query(None, description="Champs à renvoyer, par exemple nom_festival,adresse.latitude,adresse.longitude")
+# Les routes qui acceptent fields renvoient le festival complet, ou seulement les champs demandés
+UN_FESTIVAL_OU_PROJECTION = {200: {"model": Union[Festival, FestivalProjection],
+                                   "description": "Le festival, réduit aux champs demandés si fields est donné"}}
+FESTIVALS_OU_PROJECTIONS = {200: {"model": Union[List[Festival], List[FestivalProjection]],
+                                  "description": "Les festivals, réduits aux champs demandés si fields est donné"}}
 
 
+def champs_demandes(fields: Optional[str]):
+    """
+    Cette fonction analyse le paramètre fields et renvoie une erreur 422 pour un champ inconnu.
+    """
+    if fields is None:
+        return None
+    try:
+        return analyser_champs(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def reponse_projection(champs, donnees) -> Response:
+    """
+    Cette fonction renvoie directement le JSON allégé, sans passer par le modèle de réponse complet.
+    """
+    return Response(content=serialiser_projection(champs, donnees), media_type="application/json")
+
+
+def reponse_json(contenu: bytes) -> Response:
+    """
+    Cette fonction renvoie un JSON déjà sérialisé, éventuellement partagé entre des requêtes identiques simultanées.
+    """
+    return Response(content=contenu, media_type="application/json")
+
+
+@router.get("/happening", response_model=None, responses=FESTIVALS_OU_PROJECTIONS)
+def get_festivals_en_cours(du: date = Query(alias="from"), au: date = Query(alias="to"),
+                           limit: int = Query(100, ge=1, le=1000), offset: int = Query(0, ge=0),
+                           fields: Optional[str] = FIELDS, db: Session = Depends(get_db)) -> List[Festival]:
+    """
+    Cette fonction récupère les festivals qui se déroulent au moins un jour entre deux dates.
+    C'est comme demander quels événements ont lieu pendant votre semaine de vacances !
+    """
+    if au < du:
+        raise HTTPException(status_code=422, detail="'to' must not be before 'from'.")
+    champs = champs_demandes(fields)
+    if champs is not None:
+        ids = festivals_en_cours(db, du, au)[offset:offset + limit]
+        return reponse_projection(champs, read_db_projection(champs, db, ids=ids) if ids else [])
+    return reponse_json(serialiser_festivals(read_db_festivals_en_cours(du, au, db, limit, offset)))
+
+
+@router.get("/clusters", response_model=List[Cluster])
+def get_clusters(bbox: str = Query(description="longitude min,latitude min,longitude max,latitude max"),
+                 zoom: int = Query(ge=0, le=22), db: Session = Depends(get_db)) -> List[Cluster]:
+    """
+    Cette fonction récupère les regroupements de festivals à afficher sur une zone de la carte.
+    C'est comme regarder le plan du festival de loin : on voit les zones, pas chaque stand !
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(valeur) for valeur in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=422, detail="bbox must be 'min_lon,min_lat,max_lon,max_lat'.")
+    # float() accepte aussi nan et inf, qu'aucune tuile ne peut contenir
+    if not all(math.isfinite(valeur) for valeur in (min_lon, min_lat, max_lon, max_lat)):
+        raise HTTPException(status_code=422, detail="bbox values must be finite numbers.")
+    return read_clusters(db, (min_lon, min_lat, max_lon, max_lat), zoom)
+
+
+@router.get("/facets", response_model=Facettes)
+def get_facettes(region: Optional[List[str]] = Query(None), departement: Optional[List[str]] = Query(None),
+                 discipline_dominante: Optional[List[str]] = Query(None),
+                 sous_categorie: Optional[List[str]] = Query(None),
+                 categorie_periode: Optional[List[str]] = Query(None),
+                 db: Session = Depends(get_db)) -> Facettes:
+    """
+    Cette fonction compte les festivals par région, département, discipline, sous-catégorie et
+    catégorie de période pour les filtres choisis (plusieurs valeurs d'un même filtre s'additionnent).
+    C'est comme compter d'un coup d'œil les stands de chaque allée du festival !
+    """
+    filtres = {"region": region, "departement": departement, "discipline_dominante": discipline_dominante,
+               "sous_categorie": sous_categorie, "categorie_periode": categorie_periode}
+    return read_facettes(db, filtres)
+
+
+@router.get("/autocomplete", response_model=List[Suggestion])
+def get_autocompletion(prefix: str = Query(min_length=1, max_length=100), limit: int = Query(10, ge=1, le=50),
+                       db: Session = Depends(get_db)) -> List[Suggestion]:
+    """
+    Cette fonction propose des noms de festivals, de communes et de départements qui commencent
+    par le texte saisi (sans tenir compte des accents ni des majuscules).
+    C'est comme un programme qui devine le concert que vous cherchez dès la première lettre !
+    """
+    return read_suggestions(db, prefix, limit)
+
 
-@router.get("/{festival_id}", response_model=Festival)
-def get_one_festival(festival_id: int, request: Request, db: Session = Depends(get_db)) -> Festival:
+@router.get("/changes")
+async def get_changements(last_event_id: Optional[int] = Header(None), db: Session = Depends(get_db)) -> StreamingResponse:
+    """
+    Cette fonction ouvre le flux Server-Sent Events des créations, modifications et suppressions
+    de festivals. Avec l'en-tête Last-Event-ID, les changements manqués sont renvoyés d'abord ;
+    s'ils ne sont plus dans le journal, un événement resync demande de tout recharger.
+    C'est comme écouter les annonces du festival au lieu de relire tout le programme !
+    """
+    # L'abonnement est pris avant la lecture du rattrapage pour ne manquer aucun changement
+    dernier = await run_in_threadpool(dernier_changement, db)
+    abonnement = diffuseur.abonner(dernier)
+    depuis = dernier if last_event_id is None else last_event_id
+    try:
+        if last_event_id is None:
+            rattrapage = []
+        elif await run_in_threadpool(changements_purges, db, last_event_id):
+            rattrapage, depuis = None, dernier
+        else:
+            rattrapage = await run_in_threadpool(read_changements, db, last_event_id)
+    except Exception:
+        diffuseur.desabonner(abonnement)
+        raise
+    return StreamingResponse(flux_changements(abonnement, rattrapage, depuis),
+                             media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.post("/lookup", response_model=List[ResultatRecherche])
+def lookup_festivals(recherche: RechercheIds, db: Session = Depends(get_db)) -> List[ResultatRecherche]:
+    """
+    Cette fonction récupère plusieurs festivals en un seul appel, dans l'ordre des identifiants
+    demandés ; un identifiant inconnu est renvoyé avec un festival vide.
+    C'est comme retirer tous les billets réservés au guichet en une seule fois !
+    """
+    return read_db_festivals_par_ids(recherche.ids, db)
+
+
+@router.get("/{festival_id}", response_model=None, responses=UN_FESTIVAL_OU_PROJECTION)
+def get_one_festival(festival_id: int, request: Request, fields: Optional[str] = FIELDS,
+                     db: Session = Depends(get_db)) -> Festival:
     """
     Cette fonction récupère un festival spécifique de la base de données.
     C'est comme trouver un événement spécifique dans le calendrier du festival !
     """
+    champs = champs_demandes(fields)
+
+    def lire():
+        if champs is not None:
+            return serialiser_projection(champs, read_db_one_projection(festival_id, champs, db))
+        return serialiser_festivals(read_db_one_festival(festival_id, db))
+
     try:
-        db_festival = read_db_one_festival(festival_id, db)
+        return reponse_json(lecture_partagee(("un", festival_id, champs), lire))
     except NotFoundError as e:  
         raise HTTPException(status_code=404, detail=str(e))
-    return db_festival
 
 
-@router.get("/", response_model=List[Festival])
-def get_festivals(request: Request, db: Session = Depends(get_db)) -> List[Festival]:
+@router.get("/{festival_id}/similar", response_model=List[Similaire])
+def get_festivals_similaires(festival_id: int, k: int = Query(10, ge=1, le=20),
+                             db: Session = Depends(get_db)) -> List[Similaire]:
+    """
+    Cette fonction récupère les k festivals qui ressemblent le plus à un festival : même discipline,
+    même sous-catégorie et lieu proche, classés du plus au moins similaire.
+    C'est comme demander au guide quels autres festivals visiter dans la région !
+    """
+    try:
+        return read_similaires(festival_id, db, k)
+    except NotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/", response_model=None, responses=FESTIVALS_OU_PROJECTIONS)
+def get_festivals(request: Request, fields: Optional[str] = FIELDS, db: Session = Depends(get_db)) -> List[Festival]:
     """
     Cette fonction récupère tous les festivals de la base de données.
     C'est comme regarder tous les événements dans le calendrier du festival !
     """
+    champs = champs_demandes(fields)
+
+    def lire():
+        if champs is None:
+            return serialiser_festivals(read_db_festival(db))
+        festivals = read_db_projection(champs, db, limit=NB_FESTIVALS_LISTE)
+        if not festivals:
+            raise NotFoundError("No festivals found in the database.")
+        return serialiser_projection(champs, festivals)
+
     try:
-        db_festivals = read_db_festival(db)
+        return reponse_json(lecture_partagee(("liste", champs), lire))
     except NotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
-    return db_festivals
 
 
 @router.post("/", response_model=Festival)
@@ -66,6 +241,18 @@ def update_festival(festival_id: int, festival: FestivalUpdate, db: Session = De
         raise HTTPException(status_code=404, detail=str(e))
     return db_festival
 
+@router.patch("/{festival_id}", response_model=Festival)
+def patch_festival(festival_id: int, festival: FestivalPatch, db: Session = Depends(get_db), has_access: User = PROTECTED) -> Festival:
+    """
+    Cette fonction modifie uniquement les champs envoyés d'un festival existant.
+    C'est comme corriger une seule ligne du programme sans le réimprimer en entier !
+    """
+    try:
+        db_festival = patch_db_festival(festival_id, festival, db)
+    except NotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return db_festival
+
 @router.delete("/{festival_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_festival_endpoint(festival_id: int, db: Session = Depends(get_db)):
     """
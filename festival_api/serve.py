@@ -0,0 +1,55 @@
+"""
+Lancement de l'API avec plusieurs workers.
+
+Chaque worker est un processus uvicorn qui sert l'application sur le même port. Le schéma
+est préparé une seule fois avant le démarrage des workers, la base passe en mode WAL pour
+que les lectures d'un worker ne soient pas bloquées par les écritures d'un autre, et les
+index en mémoire de chaque worker suivent les écritures des autres (db_coherence).
+
+Utilisation :
+    python -m festival_api.serve --workers 4
+    python -m festival_api.serve --workers 8 --loop uvloop --http httptools
+"""
+import argparse
+import os
+
+
+def preparer_base() -> None:
+    """
+    Cette fonction crée le schéma et passe la base SQLite en mode WAL, une fois pour tous les workers.
+    C'est comme ouvrir toutes les portes du site avant de laisser entrer les équipes !
+    """
+    from .database.db_core import initialiser_schema, obtenir_moteur
+
+    engine = obtenir_moteur()
+    initialiser_schema(engine)
+    if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lance l'API des festivals avec plusieurs workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="nombre de processus (un par cœur par défaut)")
+    parser.add_argument("--loop", default="auto", choices=["auto", "asyncio", "uvloop"],
+                        help="boucle d'événements ; auto choisit uvloop s'il est installé")
+    parser.add_argument("--http", default="auto", choices=["auto", "h11", "httptools"],
+                        help="analyseur HTTP ; auto choisit httptools s'il est installé")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    preparer_base()
+    if args.workers > 1:
+        # Lu par le cycle de vie de l'application dans chaque worker
+        os.environ["COHERENCE_INTER_PROCESSUS"] = "True"
+    uvicorn.run("festival_api.main:app", host=args.host, port=args.port, workers=args.workers,
+                loop=args.loop, http=args.http)
+
+
+if __name__ == "__main__":
+    main()
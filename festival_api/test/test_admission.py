@@ -0,0 +1,72 @@
+import os
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+os.environ['TESTING'] = 'True'
+# Les jetons de test sont signés même sans fichier .env
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('ALGORITHM', 'HS256')
+
+from festival_api.admission import activer_admission, LimiteurDebit, SurveillanceCharge
+from festival_api.database.db_authentification import create_access_token
+
+
+@pytest.fixture(scope="function")
+def application():
+    """
+    Cette fonction est un fixture qui crée une petite application protégée par le contrôle d'admission.
+    """
+    app = FastAPI()
+    limiteur = LimiteurDebit({"lecture": (3, 0.001), "ecriture": (1, 0.001), "connexion": (1, 0.001)})
+    surveillance = SurveillanceCharge(max_en_cours=10)
+    activer_admission(app, limiteur, surveillance)
+
+    @app.get("/festivals/{festival_id}")
+    def lire(festival_id: int):
+        return festival_id
+
+    @app.post("/festivals/")
+    def ecrire():
+        return True
+
+    with TestClient(app) as client:
+        yield client, surveillance
+
+
+def test_limitation_par_client(application):
+    """
+    Cette fonction est un test pour vérifier qu'un client qui dépasse son budget reçoit 429,
+    sans que les autres clients ni ses autres classes de requêtes soient pénalisés.
+    """
+    client, _ = application
+    bavard = {"Authorization": f"Bearer {create_access_token({'sub': 'bavard'})}"}
+    sage = {"Authorization": f"Bearer {create_access_token({'sub': 'sage'})}"}
+
+    assert [client.get("/festivals/1", headers=bavard).status_code for _ in range(3)] == [200, 200, 200]
+    response = client.get("/festivals/1", headers=bavard)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert client.post("/festivals/", headers=bavard).status_code == 200
+    assert client.get("/festivals/1", headers=sage).status_code == 200
+    # Sans jeton valide, le client est identifié par son adresse IP
+    assert client.get("/festivals/1").status_code == 200
+
+
+def test_delestage(application):
+    """
+    Cette fonction est un test pour vérifier que les requêtes sont refusées avec 503 quand une file
+    d'attente s'est installée, puis de nouveau admises quand elle s'est vidée.
+    """
+    client, surveillance = application
+    # Même la requête la plus rapide de l'intervalle a dépassé la cible
+    surveillance.min_duree = 1.0
+    surveillance.fin_intervalle = 0
+    response = client.get("/festivals/1")
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+
+    # Aucune requête ne s'est terminée dans l'intervalle suivant : la file s'est vidée
+    surveillance.fin_intervalle = 0
+    assert client.get("/festivals/2").status_code == 200
+    assert surveillance.en_cours == 0
@@ -1,6 +1,12 @@
+import os
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+
+os.environ['TESTING'] = 'True'
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('ALGORITHM', 'HS256')
+
 from festival_api.main import app
 from festival_api.database.db_core import Base, get_db
 from festival_api.database.db_authentification import UserCreate, User, Token
@@ -90,4 +96,71 @@ def test_unauthorized_access(client):
         "/auth/is_authorized",
         headers={"Authorization": "Bearer invalid_token"}
     )
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+
+def test_refresh_token(client):
+    """
+    Cette fonction est un test pour vérifier qu'un jeton de rafraîchissement s'échange une seule fois,
+    et que sa réutilisation révoque toute sa famille.
+    """
+    client.post(
+        "/auth/create_user",
+        json={"username": "testuser", "email": "test@example.com", "password": "testpassword"}
+    )
+    login = client.post("/auth/token", data={"username": "testuser", "password": "testpassword"}).json()
+
+    response = client.post("/auth/refresh", json={"refresh_token": login["refresh_token"]})
+    assert response.status_code == 200
+    rafraichi = response.json()
+    assert rafraichi["refresh_token"] != login["refresh_token"]
+    assert client.get("/auth/is_authorized",
+                      headers={"Authorization": f"Bearer {rafraichi['access_token']}"}).status_code == 200
+
+    # Le jeton déjà utilisé est refusé, et son remplaçant est révoqué avec lui
+    assert client.post("/auth/refresh", json={"refresh_token": login["refresh_token"]}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": rafraichi["refresh_token"]}).status_code == 401
+
+def test_refresh_token_concurrent(client):
+    """
+    Cette fonction est un test pour vérifier que deux rafraîchissements simultanés avec le même jeton
+    ne donnent pas deux nouveaux jetons : le second est traité comme une réutilisation.
+    """
+    from festival_api.database.db_core import DBToken
+    from festival_api.database.db_authentification import rotate_refresh_token
+    client.post(
+        "/auth/create_user",
+        json={"username": "testuser", "email": "test@example.com", "password": "testpassword"}
+    )
+    login = client.post("/auth/token", data={"username": "testuser", "password": "testpassword"}).json()
+
+    premiere, seconde = TestingSessionLocal(), TestingSessionLocal()
+    try:
+        # La seconde session a déjà lu (et garde) le jeton encore valide quand la première le consomme
+        jetons_lus = seconde.query(DBToken).all()
+        rotation = rotate_refresh_token(login["refresh_token"], premiere)
+        assert rotation is not None
+        assert rotate_refresh_token(login["refresh_token"], seconde) is None
+    finally:
+        premiere.close()
+        seconde.close()
+    assert client.post("/auth/refresh", json={"refresh_token": rotation[1]}).status_code == 401
+
+def test_logout(client):
+    """
+    Cette fonction est un test pour vérifier qu'un jeton d'accès révoqué est refusé, sans toucher aux autres.
+    """
+    client.post(
+        "/auth/create_user",
+        json={"username": "testuser", "email": "test@example.com", "password": "testpassword"}
+    )
+    premier = client.post("/auth/token", data={"username": "testuser", "password": "testpassword"}).json()
+    second = client.post("/auth/token", data={"username": "testuser", "password": "testpassword"}).json()
+
+    response = client.post("/auth/logout", headers={"Authorization": f"Bearer {premier['access_token']}"},
+                           json={"refresh_token": premier["refresh_token"]})
+    assert response.status_code == 204
+    assert client.get("/auth/is_authorized",
+                      headers={"Authorization": f"Bearer {premier['access_token']}"}).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": premier["refresh_token"]}).status_code == 401
+    assert client.get("/auth/is_authorized",
+                      headers={"Authorization": f"Bearer {second['access_token']}"}).status_code == 200
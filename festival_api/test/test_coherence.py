@@ -0,0 +1,100 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from festival_api.database.db_autocompletion import read_suggestions
+from festival_api.database.db_coherence import activer_coherence, desactiver_coherence
+from festival_api.database.db_core import Base
+from festival_api.database.db_index import invalider_index
+
+RACINE = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ECRITURE_AUTRE_PROCESSUS = """
+from festival_api.database.db_core import SessionLocal
+from festival_api.database.db_festivals import create_db_festival, FestivalCreate
+# La session est ouverte sur DATABASE_URL avant que le module de test ne définisse TESTING
+session = SessionLocal()
+from festival_api.test.test_festivals import nouveau_festival
+create_db_festival(FestivalCreate(**nouveau_festival("Zénith Festival")), session)
+session.close()
+"""
+
+
+@pytest.fixture(scope="function")
+def base(tmp_path):
+    """
+    Cette fonction est un fixture qui crée une base SQLite sur disque et active la veille des changements.
+    """
+    chemin = f"{tmp_path}/coherence.db"
+    engine = create_engine(f"sqlite:///{chemin}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    fabrique = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    invalider_index()
+    veilleur = activer_coherence(fabrique, intervalle=60)
+    try:
+        yield chemin, fabrique, veilleur
+    finally:
+        desactiver_coherence()
+        invalider_index()
+        engine.dispose()
+
+
+def test_index_suit_un_autre_processus(base):
+    """
+    Cette fonction est un test pour vérifier qu'un index en mémoire voit, dès la lecture suivante,
+    un festival créé par un autre processus.
+    """
+    chemin, fabrique, veilleur = base
+    session = fabrique()
+    try:
+        assert read_suggestions(session, "zen") == []
+
+        env = dict(os.environ, DATABASE_URL=chemin, SECRET_KEY="test", ALGORITHM="HS256")
+        env.pop("TESTING", None)
+        subprocess.run([sys.executable, "-c", ECRITURE_AUTRE_PROCESSUS], cwd=RACINE, env=env, check=True)
+
+        session.rollback()
+        suggestions = read_suggestions(session, "zen")
+        assert [s.libelle for s in suggestions] == ["Zénith Festival"]
+        assert veilleur.nb_synchronisations == 1
+    finally:
+        session.close()
+
+
+def test_index_suit_une_ecriture_hors_journal(base, tmp_path):
+    """
+    Cette fonction est un test pour vérifier que les index suivent une écriture qui ne passe pas par
+    le journal des changements, puis le remplacement du fichier de la base par un autre.
+    """
+    import shutil
+    import sqlite3
+    chemin, fabrique, veilleur = base
+    session = fabrique()
+    try:
+        assert read_suggestions(session, "zen") == []
+        # Une transaction sans effet sur les festivals ne reconstruit pas les index
+        with sqlite3.connect(chemin) as conn:
+            conn.execute("INSERT INTO users (username, email, hashed_password) VALUES ('a', 'a@a.fr', 'x')")
+        assert read_suggestions(session, "zen") == []
+        assert veilleur.nb_synchronisations == 0
+
+        # Chargement direct, sans ligne dans le journal des changements
+        with sqlite3.connect(chemin) as conn:
+            conn.execute("INSERT INTO adresse (id_adresse, commune) VALUES (1, 'Paris')")
+            conn.execute("INSERT INTO festival (id_festival, nom_festival, id_adresse) VALUES (1, 'Zénith Festival', 1)")
+        assert [s.libelle for s in read_suggestions(session, "zen")] == ["Zénith Festival"]
+        assert veilleur.nb_synchronisations == 1
+
+        # Une nouvelle base prend la place de l'ancienne
+        nouvelle = f"{tmp_path}/nouvelle.db"
+        shutil.copy(chemin, nouvelle)
+        with sqlite3.connect(nouvelle) as conn:
+            conn.execute("UPDATE festival SET nom_festival = 'Zanzibar Jazz'")
+        os.replace(nouvelle, chemin)
+        assert [s.libelle for s in read_suggestions(session, "z")] == ["Zanzibar Jazz"]
+    finally:
+        session.close()
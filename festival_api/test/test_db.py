@@ -6,6 +6,7 @@ os.environ['TESTING'] = 'True'
 
 from festival_api.database.db_authentification import create_db_user, get_user, UserCreate
 from festival_api.database.db_core import NotFoundError, DBUsers, DBFestival, DBAdresse, DBCategorie, DBPeriode, SessionLocal, Base
+from festival_api.database.db_index import IndexFestivals, invalider_index
 from festival_api.database.db_festivals import create_db_festival, update_db_festival, delete_db_festival, read_db_one_festival, FestivalCreate, FestivalUpdate, AdresseBase, CategorieBase, PeriodeBase
 
 @pytest.fixture(scope="function")
@@ -16,6 +17,7 @@ def db():
     """
     db = SessionLocal()
     Base.metadata.create_all(bind=db.bind)
+    invalider_index()
     try:
         yield db
     finally:
@@ -210,4 +212,18 @@ def test_delete_festival(db: Session):
     
     # Vérifiez que le festival n'existe plus
     with pytest.raises(NotFoundError):
-        read_db_one_festival(created_festival.id_festival, db)
\ No newline at end of file
+        read_db_one_festival(created_festival.id_festival, db)
+
+def test_index_incomplet():
+    """
+    Cette fonction est un test pour vérifier qu'un index qui n'implémente pas toutes les méthodes ne peut pas être créé.
+    """
+    class IndexSansRetrait(IndexFestivals):
+        def construire(self, lignes):
+            pass
+
+        def ajouter(self, ligne):
+            pass
+
+    with pytest.raises(TypeError):
+        IndexSansRetrait()
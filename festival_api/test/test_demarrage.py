@@ -0,0 +1,46 @@
+import json
+import os
+import subprocess
+import sys
+
+RACINE = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_import_sans_dependances_lourdes(tmp_path):
+    """
+    Cette fonction est un test pour vérifier que l'import de l'application ne charge ni numpy,
+    ni passlib, ni jose, et ne crée pas le schéma : ce travail est fait au démarrage.
+    """
+    base = tmp_path / "demarrage.db"
+    env = dict(os.environ, DATABASE_URL=str(base), SECRET_KEY="test", ALGORITHM="HS256")
+    env.pop("TESTING", None)
+    code = ("import json, sys\n"
+            "import festival_api.main\n"
+            "print(json.dumps([m for m in ('numpy', 'passlib', 'jose') if m in sys.modules]))")
+    sortie = subprocess.run([sys.executable, "-c", code], cwd=RACINE, env=env,
+                            capture_output=True, text=True, check=True)
+    assert json.loads(sortie.stdout) == []
+    assert not base.exists() or base.stat().st_size == 0
+
+
+def test_schema_sans_cycle_de_vie(tmp_path):
+    """
+    Cette fonction est un test pour vérifier qu'un client qui ne passe pas par le cycle de vie
+    (TestClient sans with, ASGITransport) trouve tout de même le schéma complet, festival_flat compris.
+    """
+    import sqlite3
+    base = tmp_path / "sans_cycle.db"
+    env = dict(os.environ, DATABASE_URL=str(base), SECRET_KEY="test", ALGORITHM="HS256", PRECHAUFFAGE="False")
+    env.pop("TESTING", None)
+    code = ("from fastapi.testclient import TestClient\n"
+            "from festival_api.database import db_core\n"
+            "from festival_api.main import app\n"
+            "assert db_core._moteur is None\n"
+            "print(TestClient(app).get('/festivals/facets').status_code)")
+    sortie = subprocess.run([sys.executable, "-c", code], cwd=RACINE, env=env,
+                            capture_output=True, text=True, check=True)
+    assert sortie.stdout.strip() == "200"
+    conn = sqlite3.connect(base)
+    tables = {nom for (nom,) in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")}
+    conn.close()
+    assert {"festival", "festival_flat", "FESTIVAL_FLAT_UPDATE"} <= tables
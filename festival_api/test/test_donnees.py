@@ -0,0 +1,266 @@
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data.data_festival import recuperer_donnees_api, GeocodeurLocal, construire_reference_communes, normaliser_code_insee
+from data.deduplication import detecter_doublons, fusionner_doublons
+from data.validation import SCHEMA_FESTIVAL, compiler_schema, ecrire_quarantaine, valider_enregistrements, validateur
+import pipeline
+from database_building import insertion_data
+
+EXPORT = [{"nom_du_festival": "Festival de Test", "geocodage_xy": {"lat": 48.85, "lon": 2.35}}]
+ETAG = '"v1"'
+LIGNE_FESTIVAL = {"Nom_Festival": "Jazz à Vienne", "Adresse_Postale": "Vienne", "Code_INSEE": "38544", "Region": "ARA",
+                  "Departement": "Isère", "Commune": "Vienne", "Longitude": 4.87, "Latitude": 45.52,
+                  "Periode": "Juillet", "Categorie_Periode": "Saison", "Discipline_Principale": "Musique",
+                  "Sous_Categorie": "Jazz", "Annee_Creation": 1981, "Site_Internet": None}
+
+
+class ServeurExportFactice(BaseHTTPRequestHandler):
+    """
+    Serveur HTTP local qui imite l'export JSON de data.culture.gouv.fr.
+    Il répond 304 quand le client envoie le bon ETag.
+    """
+    appels = []
+
+    def do_GET(self):
+        ServeurExportFactice.appels.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.end_headers()
+            return
+        corps = json.dumps(EXPORT).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corps)))
+        self.send_header("ETag", ETAG)
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def serveur():
+    """
+    Cette fonction est un fixture qui démarre le serveur factice dans un thread.
+    """
+    ServeurExportFactice.appels = []
+    httpd = HTTPServer(("127.0.0.1", 0), ServeurExportFactice)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_instantane_et_requete_conditionnelle(serveur, tmp_path):
+    """
+    Cette fonction est un test pour vérifier que le deuxième appel envoie l'ETag et réutilise l'instantané.
+    """
+    premier = recuperer_donnees_api("festivals", "cle", url_base=serveur, dossier_instantanes=str(tmp_path))
+    second = recuperer_donnees_api("festivals", "cle", url_base=serveur, dossier_instantanes=str(tmp_path))
+
+    assert premier == EXPORT
+    assert second == EXPORT
+    assert "If-None-Match" not in ServeurExportFactice.appels[0]
+    assert ServeurExportFactice.appels[1]["If-None-Match"] == ETAG
+    assert len(list(tmp_path.glob("*.json.gz"))) == 1
+
+
+def test_repli_sur_instantane_hors_ligne(serveur, tmp_path):
+    """
+    Cette fonction est un test pour vérifier que le dernier instantané est utilisé quand l'API est injoignable.
+    """
+    recuperer_donnees_api("festivals", "cle", url_base=serveur, dossier_instantanes=str(tmp_path))
+
+    donnees = recuperer_donnees_api("festivals", "cle", url_base="http://127.0.0.1:9", dossier_instantanes=str(tmp_path))
+    assert donnees == EXPORT
+
+
+def test_geocodeur_local(tmp_path):
+    """
+    Cette fonction est un test pour vérifier que chaque point est associé à sa commune, et jamais à une commune voisine.
+    """
+    reference = tmp_path / "reference.csv"
+    construire_reference_communes([
+        {"code": "75056", "nom": "Paris", "codesPostaux": ["75002", "75001"], "centre": {"coordinates": [2.3522, 48.8566]},
+         "departement": {"code": "75", "nom": "Paris"}, "region": {"code": "11", "nom": "Île-de-France"}},
+        {"code": "69123", "nom": "Lyon", "codesPostaux": ["69001"], "centre": {"coordinates": [4.8357, 45.7640]},
+         "departement": {"code": "69", "nom": "Rhône"}, "region": {"code": "84", "nom": "Auvergne-Rhône-Alpes"}},
+        {"code": "01004", "nom": "Ambérieu-en-Bugey", "codesPostaux": ["01500"], "centre": {"coordinates": [5.37, 45.96]},
+         "departement": {"code": "01", "nom": "Ain"}, "region": {"code": "84", "nom": "Auvergne-Rhône-Alpes"}},
+    ], str(reference))
+    geocodeur = GeocodeurLocal(str(reference))
+    latitudes, longitudes = np.array([45.75, 48.86, np.nan, -21.1]), np.array([4.85, 2.34, np.nan, 55.5])
+
+    adresses, non_resolues = geocodeur.geocoder(latitudes, longitudes)
+    assert list(adresses) == ["Lyon, Rhône, Auvergne-Rhône-Alpes, 69001",
+                              "Paris, Paris, Île-de-France, 75001", "", ""]
+    assert list(non_resolues) == [False, False, False, True]
+
+    # Un festival de Villeurbanne (69266), absente de la référence, n'est pas placé à Lyon
+    adresses, non_resolues = geocodeur.geocoder(latitudes, longitudes, np.array(["69266", "75056", None, "97411"]))
+    assert list(adresses) == ["", "Paris, Paris, Île-de-France, 75001", "", ""]
+    assert list(non_resolues) == [True, False, False, True]
+
+    assert [normaliser_code_insee(code) for code in ("1004", 1004, 1004.0, "2a004", "0", None)] == \
+        ["01004", "01004", "01004", "2A004", None, None]
+    assert open(reference, encoding="utf-8").read().splitlines()[1].startswith("01004,Ambérieu-en-Bugey")
+
+
+def test_reference_communes_telechargee(tmp_path):
+    """
+    Cette fonction est un test pour vérifier que la table de référence, non versionnée, est téléchargée
+    depuis l'API Découpage administratif quand elle est absente.
+    """
+    from data.data_festival import telecharger_reference_communes
+
+    class ReponseFactice:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return [{"code": "69123", "nom": "Lyon", "codesPostaux": ["69001"], "centre": {"coordinates": [4.8357, 45.7640]},
+                     "departement": {"code": "69", "nom": "Rhône"}, "region": {"code": "84", "nom": "Auvergne-Rhône-Alpes"}}]
+
+    class SessionFactice:
+        def get(self, url, timeout, params):
+            assert url.endswith("/communes") and "arrondissement-municipal" in params["type"]
+            return ReponseFactice()
+
+    reference = tmp_path / "reference.csv"
+    assert len(telecharger_reference_communes(str(reference), session=SessionFactice())) == 1
+    adresses, _ = GeocodeurLocal(str(reference)).geocoder(np.array([45.75]), np.array([4.85]), np.array(["69123"]))
+    assert list(adresses) == ["Lyon, Rhône, Auvergne-Rhône-Alpes, 69001"]
+
+
+def test_doublons():
+    """
+    Cette fonction est un test pour vérifier que les noms presque identiques d'une même commune sont fusionnés.
+    """
+    df = pd.DataFrame({
+        "Nom_Festival": ["Jazz à Vienne", "JAZZ A VIENNE !", "Jazz à Vienne", "Festival du livre de Vienne",
+                         "Le Festival du Livre de Vienne"],
+        "Code_INSEE": ["38544", "38544", "69123", "38544", "38544"],
+        "Discipline_Principale": ["Musique", "Musique", "Musique", "Livre, littérature", "Livre, littérature"],
+        "Site_Internet": [None, "jazzavienne.com", "jazz.fr", "livre.fr", None],
+    })
+    rapport = detecter_doublons(df)
+
+    assert sorted(rapport.groupby("Groupe")["Index"].apply(list).tolist()) == [[0, 1], [3, 4]]
+    fusionne = fusionner_doublons(df, rapport)
+    assert fusionne["Nom_Festival"].tolist() == ["JAZZ A VIENNE !", "Jazz à Vienne", "Festival du livre de Vienne"]
+    assert fusionne["Site_Internet"].tolist() == ["jazzavienne.com", "jazz.fr", "livre.fr"]
+
+
+def test_insertion_rejouable():
+    """
+    Cette fonction est un test pour vérifier que relancer l'insertion du même lot n'ajoute aucun festival.
+    """
+    conn = sqlite3.connect(":memory:")
+    with open(f"{insertion_data.DOSSIER_SCRIPTS}/script_sqlite.sql", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    ligne = dict(LIGNE_FESTIVAL)
+
+    assert insertion_data.inserer_lot(conn.cursor(), [ligne, dict(ligne)]) == 1
+    assert insertion_data.inserer_lot(conn.cursor(), [ligne]) == 0
+    assert conn.execute("SELECT COUNT(*) FROM FESTIVAL").fetchone()[0] == 1
+
+
+def test_chargement_en_place(tmp_path, monkeypatch):
+    """
+    Cette fonction est un test pour vérifier que l'insertion du pipeline complète la base existante sans la remplacer.
+    """
+    base = tmp_path / "festivals.db"
+    conn = sqlite3.connect(base)
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT)")
+    conn.execute("INSERT INTO users (username) VALUES ('organisateur')")
+    conn.commit()
+    conn.close()
+    pd.DataFrame([LIGNE_FESTIVAL]).to_csv(tmp_path / "festivals.csv", index=False)
+    monkeypatch.setenv("DATABASE_PATH", str(base))
+    monkeypatch.setenv("CHEMIN_PARQUET", str(tmp_path / "festivals.csv"))
+    monkeypatch.delenv("FUSION_DOUBLONS", raising=False)
+    monkeypatch.setattr(pipeline, "DOSSIER_ETAT", str(tmp_path))
+
+    assert pipeline.etape_insertion() == 1
+    assert pipeline.etape_insertion() == 0
+    conn = sqlite3.connect(base)
+    assert conn.execute("SELECT username FROM users").fetchall() == [("organisateur",)]
+    assert conn.execute("SELECT Nom_Festival FROM FESTIVAL_FLAT").fetchall() == [("Jazz à Vienne",)]
+    conn.close()
+
+    # Le point de contrôle de l'insertion suit la base : supprimée, elle est rechargée au prochain lancement
+    insertion = next(etape for etape in pipeline.construire_etapes() if etape.nom == "insertion")
+    with open(pipeline.chemin_chargement(), "w", encoding="utf-8") as f:
+        f.write("{}")
+    etat = {"insertion": {"entrees": pipeline.empreinte_entrees(insertion), "temoin": pipeline.identite_base(),
+                          "sorties": {pipeline.chemin_chargement(): pipeline.empreinte_fichier(pipeline.chemin_chargement())}}}
+    assert pipeline.est_a_jour(insertion, etat)
+    base.unlink()
+    assert not pipeline.est_a_jour(insertion, etat)
+
+
+def test_chargement_base_ancienne(tmp_path):
+    """
+    Cette fonction est un test pour vérifier que le chargement migre une base créée avant les jours des périodes.
+    """
+    conn = sqlite3.connect(tmp_path / "ancienne.db")
+    conn.execute("CREATE TABLE PERIODE (ID_Periode INTEGER PRIMARY KEY AUTOINCREMENT, Periode TEXT, Categorie_Periode TEXT)")
+    conn.execute("INSERT INTO PERIODE (Periode, Categorie_Periode) VALUES ('Octobre', 'Après-saison')")
+    conn.commit()
+    chemin = tmp_path / "festivals.csv"
+    pd.DataFrame([LIGNE_FESTIVAL]).to_csv(chemin, index=False)
+
+    assert insertion_data.charger(conn, str(chemin)) == 1
+    assert conn.execute("SELECT Periode, Jour_Debut, Jour_Fin FROM PERIODE ORDER BY ID_Periode").fetchall() == \
+        [("Octobre", 274, 304), ("Juillet", 182, 212)]
+    conn.close()
+
+
+def test_pipeline_dependance_inconnue():
+    """
+    Cette fonction est un test pour vérifier qu'une dépendance inconnue arrête le pipeline au lieu de le bloquer.
+    """
+    etapes = [pipeline.Etape("insertion", print, [], [], dependances=["schema"])]
+    with pytest.raises(ValueError, match="schema"):
+        pipeline.executer_pipeline(etapes)
+    cycle = [pipeline.Etape("a", print, [], [], dependances=["b"]), pipeline.Etape("b", print, [], [], dependances=["a"])]
+    with pytest.raises(ValueError, match="circulaires"):
+        pipeline.executer_pipeline(cycle)
+
+
+def test_validation(tmp_path):
+    """
+    Cette fonction est un test pour vérifier que les enregistrements malformés sont mis en quarantaine avec leurs raisons.
+    """
+    valide = {"nom_du_festival": "Jazz à Vienne", "geocodage_xy": {"lat": 45.52, "lon": 4.87},
+              "code_insee_commune": "38544", "discipline_dominante": "Musique",
+              "annee_de_creation_du_festival": "01/01/1981 00:00"}
+    sans_coordonnees = dict(valide, geocodage_xy=None)
+    annee_etrange = dict(valide, annee_de_creation_du_festival="1604")
+    enregistrements = [valide, sans_coordonnees, dict(valide, annee_de_creation_du_festival="26ème"), annee_etrange]
+
+    valides, quarantaine = valider_enregistrements(enregistrements, taille_lot=3)
+    assert valides == [valide, enregistrements[2]]
+    assert [(q["index"], q["raisons"]) for q in quarantaine] == [
+        (1, ["geocodage_xy : None is not of type 'object'"]),
+        (3, ["annee_de_creation_du_festival : '1604' is not valid under any of the given schemas"]),
+    ]
+    ecrire_quarantaine(quarantaine, str(tmp_path / "quarantaine.jsonl"))
+    assert [json.loads(ligne)["enregistrement"] for ligne in open(tmp_path / "quarantaine.jsonl", encoding="utf-8")] \
+        == [sans_coordonnees, annee_etrange]
+
+    # Le schéma compilé donne la même réponse que jsonschema, types JSON compris (un booléen n'est pas un nombre)
+    verifier, reference = compiler_schema(SCHEMA_FESTIVAL), validateur()
+    for coordonnees in ({"lat": 45.5, "lon": 4.8}, {"lat": True, "lon": 4.8}, {"lat": 91, "lon": 0}, {"lat": 1}, [1, 2]):
+        for code in ("38544", "2A004", "0", 38544, 1.5):
+            enregistrement = dict(valide, geocodage_xy=coordonnees, code_insee_commune=code)
+            assert verifier(enregistrement) == reference.is_valid(enregistrement)
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from festival_api.database.db_core import Base, DBFestival, NotFoundError
+from festival_api.database.db_ecriture import activer_ecriture_groupee, desactiver_ecriture_groupee
+from festival_api.database.db_festivals import create_db_festival, patch_db_festival, FestivalCreate, FestivalPatch
+from festival_api.database.db_index import invalider_index
+from festival_api.test.test_festivals import nouveau_festival
+
+
+@pytest.fixture(scope="function")
+def fabrique_session(tmp_path):
+    """
+    Cette fonction est un fixture qui crée une base SQLite sur disque et active l'écriture groupée.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path}/ecriture.db", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    fabrique = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    invalider_index()
+    ecrivain = activer_ecriture_groupee(fabrique, fenetre=0.05)
+    try:
+        yield fabrique, ecrivain
+    finally:
+        desactiver_ecriture_groupee()
+        invalider_index()
+        engine.dispose()
+
+
+def test_ecritures_groupees(fabrique_session):
+    """
+    Cette fonction est un test pour vérifier que des écritures concurrentes sont regroupées,
+    et qu'une écriture en échec ne fait pas échouer les autres.
+    """
+    fabrique, ecrivain = fabrique_session
+    resultats, erreurs = [], []
+
+    def creer(i):
+        session = fabrique()
+        try:
+            resultats.append(create_db_festival(FestivalCreate(**nouveau_festival(f"Festival {i}")), session).id_festival)
+        finally:
+            session.close()
+
+    def modifier_inconnu():
+        session = fabrique()
+        try:
+            patch_db_festival(999, FestivalPatch(nom_festival="Inconnu"), session)
+        except NotFoundError as e:
+            erreurs.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=creer, args=(i,)) for i in range(20)]
+    threads.append(threading.Thread(target=modifier_inconnu))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(resultats) == list(range(1, 21))
+    assert len(erreurs) == 1
+    assert ecrivain.nb_lots < 21
+    session = fabrique()
+    assert session.query(DBFestival).count() == 20
+    session.close()
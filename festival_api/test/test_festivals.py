@@ -0,0 +1,519 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Le cycle de vie de l'application crée son propre moteur : une base en mémoire pendant les tests
+os.environ['TESTING'] = 'True'
+
+from festival_api.main import app
+from festival_api.database.db_core import Base, get_db
+from festival_api.database.db_festivals import create_db_festival, FestivalCreate
+from festival_api.database.db_index import invalider_index
+
+# Base de données en mémoire partagée par toutes les connexions du test
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def nouveau_festival(nom, commune="Paris", latitude=48.8566, longitude=2.3522, discipline="Musique",
+                     periode="21 Juin - 5 Septembre", jour_debut=172, jour_fin=248):
+    """
+    Cette fonction construit les données d'un festival de test.
+    """
+    return {
+        "nom_festival": nom,
+        "annee_creation": 2000,
+        "site_internet": "http://festival.fr",
+        "adresse": {"adresse_postale": "1 rue du Test", "code_insee": "75056", "region": "Île-de-France",
+                    "departement": "Paris", "commune": commune, "longitude": longitude, "latitude": latitude},
+        "categorie": {"discipline_dominante": discipline, "sous_categorie": "Jazz"},
+        "periode": {"periode": periode, "categorie_periode": "Saison",
+                    "jour_debut": jour_debut, "jour_fin": jour_fin},
+    }
+
+
+@pytest.fixture(scope="function")
+def db():
+    """
+    Cette fonction est un fixture qui crée une base vide et remplace la dépendance get_db de l'application.
+    """
+    Base.metadata.create_all(bind=engine)
+    invalider_index()
+    precedent = app.dependency_overrides.get(get_db)
+    app.dependency_overrides[get_db] = override_get_db
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        if precedent is None:
+            app.dependency_overrides.pop(get_db, None)
+        else:
+            app.dependency_overrides[get_db] = precedent
+        invalider_index()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture(scope="function")
+def client(db):
+    with TestClient(app) as c:
+        yield c
+
+
+def test_festivals_en_cours(client, db):
+    """
+    Cette fonction est un test pour vérifier la recherche des festivals entre deux dates.
+    """
+    ete = create_db_festival(FestivalCreate(**nouveau_festival("Été")), db)
+    create_db_festival(FestivalCreate(**nouveau_festival(
+        "Nouvel An", periode="Décembre - Janvier", jour_debut=335, jour_fin=31)), db)
+
+    response = client.get("/festivals/happening", params={"from": "2024-07-14", "to": "2024-07-20"})
+    assert response.status_code == 200
+    assert [f["nom_festival"] for f in response.json()] == ["Été"]
+
+    response = client.get("/festivals/happening", params={"from": "2024-01-10", "to": "2024-01-12"})
+    assert [f["nom_festival"] for f in response.json()] == ["Nouvel An"]
+
+    # Les écritures suivantes sont répercutées sur l'index déjà construit
+    automne = create_db_festival(FestivalCreate(**nouveau_festival(
+        "Automne", periode="Octobre", jour_debut=274, jour_fin=304)), db)
+    client.delete(f"/festivals/{ete.id_festival}")
+    response = client.get("/festivals/happening", params={"from": "2024-07-01", "to": "2024-12-31"})
+    assert [f["nom_festival"] for f in response.json()] == ["Nouvel An", "Automne"]
+
+    # Une nouvelle période sans jours explicites : les jours sont recalculés à partir du texte
+    from festival_api.database.db_festivals import patch_db_festival, FestivalPatch
+    modifie = patch_db_festival(automne.id_festival, FestivalPatch(periode={"periode": "Juin"}), db)
+    assert (modifie.periode.jour_debut, modifie.periode.jour_fin) == (152, 181)
+    response = client.get("/festivals/happening", params={"from": "2024-06-10", "to": "2024-06-11"})
+    assert [f["nom_festival"] for f in response.json()] == ["Automne"]
+
+
+def test_clusters(client, db):
+    """
+    Cette fonction est un test pour vérifier le regroupement des festivals selon le zoom.
+    """
+    paris = create_db_festival(FestivalCreate(**nouveau_festival("Paris 1")), db)
+    paris_2 = create_db_festival(FestivalCreate(**nouveau_festival("Paris 2", latitude=48.86, longitude=2.35)), db)
+    create_db_festival(FestivalCreate(**nouveau_festival("Lyon", latitude=45.764, longitude=4.8357)), db)
+
+    response = client.get("/festivals/clusters", params={"bbox": "-5,41,10,52", "zoom": 2})
+    assert response.status_code == 200
+    assert [(c["nombre"], c["id_festival"]) for c in response.json()] == [(3, paris.id_festival)]
+
+    response = client.get("/festivals/clusters", params={"bbox": "-5,41,10,52", "zoom": 8})
+    assert sorted(c["nombre"] for c in response.json()) == [1, 2]
+
+    # Autour de Paris, il ne reste qu'un festival après la suppression
+    client.delete(f"/festivals/{paris.id_festival}")
+    response = client.get("/festivals/clusters", params={"bbox": "2,48,3,49", "zoom": 8})
+    assert [(c["nombre"], c["id_festival"]) for c in response.json()] == [(1, paris_2.id_festival)]
+
+    # Une zone avec des valeurs non finies est refusée
+    for bbox in ("nan,0,1,1", "-inf,41,10,52", "2,48,3"):
+        assert client.get("/festivals/clusters", params={"bbox": bbox, "zoom": 8}).status_code == 422
+
+    # Les bases chargées depuis le CSV ont des coordonnées vides : ces festivals sont ignorés
+    from festival_api.database.db_carte import IndexCarte
+    index = IndexCarte()
+    index.construire([{"id_festival": 1, "latitude": "", "longitude": ""},
+                      {"id_festival": 2, "latitude": "45.764", "longitude": 4.8357}])
+    assert [(c.nombre, c.id_festival) for c in index.clusters((-5, 41, 10, 52), 2)] == [(1, 2)]
+
+
+def test_facettes(client, db):
+    """
+    Cette fonction est un test pour vérifier les comptes par facette selon les filtres.
+    """
+    create_db_festival(FestivalCreate(**nouveau_festival("Jazz à Paris")), db)
+    cinema = create_db_festival(FestivalCreate(**nouveau_festival("Cinéma à Paris", discipline="Cinéma")), db)
+    lyon = nouveau_festival("Lyon")
+    lyon["adresse"].update(region="Auvergne-Rhône-Alpes", departement="Rhône")
+    create_db_festival(FestivalCreate(**lyon), db)
+
+    response = client.get("/festivals/facets")
+    assert response.status_code == 200
+    assert response.json()["total"] == 3
+    assert response.json()["facettes"]["region"] == {"Île-de-France": 2, "Auvergne-Rhône-Alpes": 1}
+
+    # Les comptes d'une facette ignorent son propre filtre, mais pas celui des autres
+    response = client.get("/festivals/facets", params={"discipline_dominante": "Musique",
+                                                       "region": ["Île-de-France", "Bretagne"]})
+    facettes = response.json()["facettes"]
+    assert response.json()["total"] == 1
+    assert facettes["discipline_dominante"] == {"Musique": 1, "Cinéma": 1}
+    assert facettes["region"] == {"Île-de-France": 1, "Auvergne-Rhône-Alpes": 1}
+
+    client.delete(f"/festivals/{cinema.id_festival}")
+    response = client.get("/festivals/facets", params={"region": "Île-de-France"})
+    assert response.json()["facettes"]["discipline_dominante"] == {"Musique": 1}
+
+
+def test_lookup(client, db):
+    """
+    Cette fonction est un test pour vérifier la récupération groupée des festivals par identifiants.
+    """
+    ids = [create_db_festival(FestivalCreate(**nouveau_festival(f"Festival {i}")), db).id_festival
+           for i in range(3)]
+
+    demandes = [ids[2], 999, ids[0], ids[2]]
+    response = client.post("/festivals/lookup", json={"ids": demandes})
+    assert response.status_code == 200
+    resultats = response.json()
+    assert [r["id_festival"] for r in resultats] == demandes
+    assert [r["festival"] and r["festival"]["nom_festival"] for r in resultats] == \
+        ["Festival 2", None, "Festival 0", "Festival 2"]
+
+
+def test_lookup_par_paquets(db, monkeypatch):
+    """
+    Cette fonction est un test pour vérifier que les identifiants sont découpés en plusieurs requêtes IN.
+    """
+    from festival_api.database import db_festivals
+    monkeypatch.setattr(db_festivals, "TAILLE_PAQUET_IN", 2)
+    ids = [create_db_festival(FestivalCreate(**nouveau_festival(f"Festival {i}")), db).id_festival
+           for i in range(5)]
+
+    resultats = db_festivals.read_db_festivals_par_ids(list(reversed(ids)) + [42], db)
+    assert [r.festival.nom_festival for r in resultats[:-1]] == [f"Festival {i}" for i in reversed(range(5))]
+    assert resultats[-1].festival is None
+
+
+def test_champs(client, db):
+    """
+    Cette fonction est un test pour vérifier que le paramètre fields ne renvoie que les champs demandés.
+    """
+    festival = create_db_festival(FestivalCreate(**nouveau_festival("Léger")), db)
+
+    response = client.get(f"/festivals/{festival.id_festival}",
+                          params={"fields": "nom_festival,adresse.latitude,adresse.longitude"})
+    assert response.status_code == 200
+    assert response.json() == {"nom_festival": "Léger", "adresse": {"latitude": 48.8566, "longitude": 2.3522}}
+
+    response = client.get("/festivals/", params={"fields": "id_festival,categorie"})
+    assert response.json() == [{"id_festival": festival.id_festival,
+                                "categorie": {"discipline_dominante": "Musique", "sous_categorie": "Jazz"}}]
+
+    response = client.get("/festivals/happening", params={"from": "2024-07-14", "to": "2024-07-20",
+                                                          "fields": "nom_festival"})
+    assert response.json() == [{"nom_festival": "Léger"}]
+
+    assert client.get("/festivals/1", params={"fields": "adresse.inconnu"}).status_code == 422
+    assert client.get("/festivals/999", params={"fields": "nom_festival"}).status_code == 404
+
+    # La projection porte sur les mêmes festivals que la lecture complète, et elle est documentée
+    for i in range(6):
+        create_db_festival(FestivalCreate(**nouveau_festival(f"Liste {i}")), db)
+    complets = client.get("/festivals/").json()
+    assert len(complets) == 5
+    assert client.get("/festivals/", params={"fields": "nom_festival"}).json() == \
+        [{"nom_festival": f["nom_festival"]} for f in complets]
+    schema = client.get("/openapi.json").json()["paths"]["/festivals/{festival_id}"]["get"]["responses"]["200"]
+    assert {"$ref": "#/components/schemas/FestivalProjection"} in schema["content"]["application/json"]["schema"]["anyOf"]
+
+
+def test_patch(client, db):
+    """
+    Cette fonction est un test pour vérifier qu'un PATCH ne modifie que les champs envoyés,
+    en quelques requêtes SQL.
+    """
+    from sqlalchemy import event
+    from festival_api.database.db_festivals import patch_db_festival, FestivalPatch
+    from festival_api.database.db_authentification import has_access
+    id_festival = create_db_festival(FestivalCreate(**nouveau_festival("Avant")), db).id_festival
+    db.expire_all()
+    # Sans index préchauffé, l'écriture n'a pas de lecture de synchronisation à faire
+    invalider_index()
+
+    requetes = []
+    ecouter = lambda conn, cursor, statement, *args: requetes.append(statement)
+    event.listen(engine, "before_cursor_execute", ecouter)
+    try:
+        modifie = patch_db_festival(id_festival, FestivalPatch(
+            nom_festival="Après", adresse={"commune": "Lyon"}), db)
+    finally:
+        event.remove(engine, "before_cursor_execute", ecouter)
+    assert (modifie.nom_festival, modifie.annee_creation) == ("Après", 2000)
+    assert (modifie.adresse.commune, modifie.adresse.region) == ("Lyon", "Île-de-France")
+    # Lecture des clés étrangères, copie de l'adresse, UPDATE du festival, suppression de l'ancienne
+    # adresse devenue orpheline, ligne du journal des changements et relecture
+    assert len(requetes) == 6
+
+    app.dependency_overrides[has_access] = lambda: None
+    try:
+        response = client.patch(f"/festivals/{id_festival}", json={"periode": {"categorie_periode": "Hiver"}})
+        assert response.status_code == 200
+        assert response.json()["periode"] == {"periode": "21 Juin - 5 Septembre", "categorie_periode": "Hiver",
+                                              "jour_debut": 172, "jour_fin": 248}
+        assert response.json()["nom_festival"] == "Après"
+        assert client.patch("/festivals/999", json={"nom_festival": "X"}).status_code == 404
+        assert client.patch("/festivals/999", json={}).status_code == 404
+
+        # Une relation vide ou ne contenant que des valeurs nulles est ignorée
+        for corps in ({"adresse": {}}, {"adresse": {"commune": None}}, {}):
+            response = client.patch(f"/festivals/{id_festival}", json=corps)
+            assert response.status_code == 200
+            assert response.json()["adresse"]["commune"] == "Lyon"
+        # Un PATCH sans modification n'ajoute rien au journal des changements
+        from festival_api.database.db_core import DBChangement
+        assert db.query(DBChangement).filter(DBChangement.id_festival == id_festival).count() == 3
+    finally:
+        app.dependency_overrides.pop(has_access, None)
+
+
+def test_relations_partagees(client, db):
+    """
+    Cette fonction est un test pour vérifier qu'une modification ne touche pas les festivals qui
+    partagent la même ligne d'adresse ou de période.
+    """
+    from festival_api.database.db_core import DBFestival, DBPeriode
+    from festival_api.database.db_festivals import patch_db_festival, update_db_festival, \
+        FestivalPatch, FestivalUpdate
+    premier = create_db_festival(FestivalCreate(**nouveau_festival("Premier")), db)
+    id_partage = premier.periode.id_periode
+    second = create_db_festival(FestivalCreate(**nouveau_festival("Second")), db)
+    # Comme dans la base chargée, les deux festivals partagent la même ligne de période
+    db.query(DBFestival).filter(DBFestival.id_festival == second.id_festival) \
+        .update({DBFestival.id_periode: id_partage})
+    db.commit()
+    invalider_index()
+    response = client.get("/festivals/happening", params={"from": "2024-07-14", "to": "2024-07-14"})
+    assert [f["nom_festival"] for f in response.json()] == ["Premier", "Second"]
+
+    patch_db_festival(premier.id_festival, FestivalPatch(periode={"periode": "Octobre"}), db)
+    response = client.get("/festivals/happening", params={"from": "2024-07-14", "to": "2024-07-14"})
+    assert [f["nom_festival"] for f in response.json()] == ["Second"]
+    response = client.get("/festivals/happening", params={"from": "2024-10-14", "to": "2024-10-14"})
+    assert [f["nom_festival"] for f in response.json()] == ["Premier"]
+    db.expire_all()
+    assert db.get(DBFestival, second.id_festival).periode.periode == "21 Juin - 5 Septembre"
+
+    # PUT remplace aussi les lignes sans toucher aux autres festivals, et supprime les orphelines
+    update_db_festival(second.id_festival, FestivalUpdate(**nouveau_festival("Second", periode="Mai")), db)
+    db.expire_all()
+    assert db.get(DBFestival, premier.id_festival).periode.periode == "Octobre"
+    assert db.get(DBFestival, second.id_festival).periode.periode == "Mai"
+    assert db.get(DBPeriode, id_partage) is None
+
+
+def test_changements(client, db):
+    """
+    Cette fonction est un test pour vérifier le journal des changements et sa diffusion aux abonnés du flux.
+    """
+    import asyncio
+    import json
+    from festival_api.database.db_changements import diffuseur, dernier_changement, read_changements, \
+        flux_changements
+
+    garde = create_db_festival(FestivalCreate(**nouveau_festival("Gardé")), db).id_festival
+    supprime = create_db_festival(FestivalCreate(**nouveau_festival("Supprimé")), db).id_festival
+    client.delete(f"/festivals/{supprime}")
+
+    changements = read_changements(db, 0)
+    assert [(c.id_festival, c.operation) for c in changements] == \
+        [(garde, "create"), (supprime, "create"), (supprime, "delete")]
+    assert changements[0].festival.nom_festival == "Gardé"
+    assert changements[1].festival is None and changements[2].festival is None
+    assert [c.id_changement for c in read_changements(db, changements[0].id_changement)] == \
+        [c.id_changement for c in changements[1:]]
+
+    async def ecouter():
+        dernier = dernier_changement(db)
+        abonnement = diffuseur.abonner(dernier)
+        flux = flux_changements(abonnement, changements[2:], changements[1].id_changement)
+        rattrapage = await flux.__anext__()
+
+        def creer():
+            session = TestingSessionLocal()
+            try:
+                return create_db_festival(FestivalCreate(**nouveau_festival("Nouveau")), session).id_festival
+            finally:
+                session.close()
+
+        nouveau = await asyncio.get_running_loop().run_in_executor(None, creer)
+        direct = await asyncio.wait_for(flux.__anext__(), timeout=5)
+        await flux.aclose()
+        return rattrapage, direct, nouveau
+
+    rattrapage, direct, nouveau = asyncio.run(ecouter())
+    assert rattrapage.startswith(f"id: {changements[2].id_changement}\nevent: delete\n")
+    lignes = direct.splitlines()
+    assert lignes[1] == "event: create"
+    assert json.loads(lignes[2][len("data: "):])["festival"]["nom_festival"] == "Nouveau"
+    assert json.loads(lignes[2][len("data: "):])["id_festival"] == nouveau
+    assert not diffuseur.abonnes
+
+    # Après la purge, un client resté avant les changements conservés reçoit un événement resync
+    from festival_api.database.db_changements import changements_purges, purger_changements, format_resync
+    dernier = dernier_changement(db)
+    assert purger_changements(db, nombre=2) == 2
+    assert [c.id_changement for c in read_changements(db, 0)] == [dernier - 1, dernier]
+    assert not changements_purges(db, dernier - 2)
+    assert changements_purges(db, dernier - 3)
+
+    async def reprendre():
+        flux = flux_changements(diffuseur.abonner(dernier), None, dernier)
+        premier = await flux.__anext__()
+        await flux.aclose()
+        return premier
+
+    assert asyncio.run(reprendre()) == format_resync(dernier)
+    assert format_resync(dernier).startswith(f"id: {dernier}\nevent: resync\n")
+
+
+def test_autocompletion(client, db, monkeypatch):
+    """
+    Cette fonction est un test pour vérifier les suggestions de la recherche par préfixe.
+    """
+    create_db_festival(FestivalCreate(**nouveau_festival("Nancy Jazz Pulsations", commune="Nancy")), db)
+    jazz = create_db_festival(FestivalCreate(**nouveau_festival("Jazz à Vienne", commune="Vienne")), db)
+    create_db_festival(FestivalCreate(**nouveau_festival("Fête de la musique", commune="Nanterre")), db)
+    create_db_festival(FestivalCreate(**nouveau_festival("Les Nuits", commune="Nanterre")), db)
+
+    response = client.get("/festivals/autocomplete", params={"prefix": "JAZ"})
+    assert response.status_code == 200
+    assert [s["libelle"] for s in response.json()] == ["Jazz à Vienne", "Nancy Jazz Pulsations"]
+    assert response.json()[0]["id_festival"] == jazz.id_festival
+
+    # Les accents sont ignorés et la commune qui compte le plus de festivals passe en premier
+    response = client.get("/festivals/autocomplete", params={"prefix": "nan"})
+    assert [(s["libelle"], s["type"], s["nombre"]) for s in response.json()] == \
+        [("Nanterre", "commune", 2), ("Nancy", "commune", 1), ("Nancy Jazz Pulsations", "festival", 1)]
+    assert [s["libelle"] for s in client.get("/festivals/autocomplete", params={"prefix": "fete"}).json()] == \
+        ["Fête de la musique"]
+
+    client.delete(f"/festivals/{jazz.id_festival}")
+    response = client.get("/festivals/autocomplete", params={"prefix": "vien"})
+    assert response.json() == []
+
+    # Le classement porte sur toutes les clés du préfixe, pas seulement sur les premières dans l'ordre alphabétique
+    from festival_api.database.db_autocompletion import IndexAutocompletion
+    index = IndexAutocompletion()
+    index.construire([{"id_festival": i, "nom_festival": f"Aa {i:04d}", "departement": None,
+                       "commune": "Azur" if i < 3 else f"Ab {i:04d}"} for i in range(1500)])
+    assert [(s.libelle, s.nombre) for s in index.suggerer("a", 2)] == [("Azur", 3), ("Aa 0000", 1)]
+
+    # Les classements gardés pour les préfixes courts suivent les écritures comme le parcours des clés
+    from festival_api.database import db_autocompletion
+    for i in range(3, 8):
+        index.ajouter({"id_festival": 2000 + i, "nom_festival": f"Bal {i}", "departement": "Ain", "commune": "Ab 0004"})
+    index.retirer(0)
+    index.retirer(2004)
+    classements = {prefixe: index._classer(prefixe, 50) for prefixe in ("a", "aa", "ab", "az", "b", "ai", "0")}
+    monkeypatch.setattr(db_autocompletion, "LONGUEUR_CLASSEE", 0)
+    assert {prefixe: index._classer(prefixe, 50) for prefixe in classements} == classements
+    assert classements["ab"][0] == db_autocompletion.Suggestion(libelle="Ab 0004", type="commune", nombre=5)
+
+
+def test_lecture_festival_flat(client, db, monkeypatch):
+    """
+    Cette fonction est un test pour vérifier que la table festival_flat suit les écritures
+    et peut servir les lectures.
+    """
+    from festival_api.database import db_festivals
+    from festival_api.database.db_core import DBFestivalFlat, installer_festival_flat
+    from festival_api.database.db_authentification import has_access
+    installer_festival_flat(engine)
+    monkeypatch.setattr(db_festivals, "LECTURE_FESTIVAL_FLAT", True)
+
+    festival = create_db_festival(FestivalCreate(**nouveau_festival("À plat")), db)
+    autre = create_db_festival(FestivalCreate(**nouveau_festival("Autre")), db)
+    assert isinstance(festival, DBFestivalFlat)
+
+    app.dependency_overrides[has_access] = lambda: None
+    try:
+        client.patch(f"/festivals/{festival.id_festival}", json={"adresse": {"commune": "Lyon"},
+                                                                 "periode": {"categorie_periode": "Hiver"}})
+    finally:
+        app.dependency_overrides.pop(has_access, None)
+    client.delete(f"/festivals/{autre.id_festival}")
+
+    response = client.get(f"/festivals/{festival.id_festival}")
+    assert response.status_code == 200
+    assert response.json()["adresse"]["commune"] == "Lyon"
+    assert response.json()["periode"]["categorie_periode"] == "Hiver"
+    assert [f["nom_festival"] for f in client.get("/festivals/").json()] == ["À plat"]
+    assert db.query(DBFestivalFlat).count() == 1
+
+
+def test_lectures_partagees():
+    """
+    Cette fonction est un test pour vérifier que des lectures identiques simultanées n'exécutent
+    qu'un seul calcul, et qu'une écriture validée entre-temps en démarre un nouveau.
+    """
+    import threading
+    from festival_api.database.db_coalescence import VolUnique
+
+    vol = VolUnique()
+    commence, libere = threading.Event(), threading.Event()
+    appels = []
+
+    def lecture():
+        appels.append(1)
+        commence.set()
+        libere.wait(5)
+        return b"[]"
+
+    resultats = []
+    meneur = threading.Thread(target=lambda: resultats.append(vol.executer("liste", lecture)))
+    meneur.start()
+    commence.wait(5)
+    suiveurs = [threading.Thread(target=lambda: resultats.append(vol.executer("liste", lecture)))
+                for _ in range(10)]
+    for suiveur in suiveurs:
+        suiveur.start()
+    while vol.nb_partages < 10:
+        threading.Event().wait(0.001)
+    libere.set()
+    for thread in [meneur, *suiveurs]:
+        thread.join()
+    assert resultats == [b"[]"] * 11
+    assert len(appels) == 1
+
+    # Après une écriture, la même clé correspond à un nouveau calcul
+    vol.nouvelle_generation()
+    assert vol.executer("liste", lambda: b"[1]") == b"[1]"
+    assert vol.en_vol == {}
+
+
+def test_festivals_similaires(client, db):
+    """
+    Cette fonction est un test pour vérifier les festivals similaires précalculés après le chargement.
+    """
+    from database_building.similarite import calculer_similaires
+
+    jazz = create_db_festival(FestivalCreate(**nouveau_festival("Jazz à Paris")), db)
+    voisin = create_db_festival(FestivalCreate(**nouveau_festival("Jazz à Vincennes", latitude=48.84,
+                                                                  longitude=2.43)), db)
+    create_db_festival(FestivalCreate(**nouveau_festival("Jazz à Marseille", commune="Marseille",
+                                                         latitude=43.2965, longitude=5.3698)), db)
+    create_db_festival(FestivalCreate(**nouveau_festival("Théâtre à Paris", discipline="Théâtre")), db)
+    conn = engine.raw_connection()
+    try:
+        assert calculer_similaires(conn) == 4 * 3
+    finally:
+        conn.close()
+
+    response = client.get(f"/festivals/{jazz.id_festival}/similar", params={"k": 2})
+    assert response.status_code == 200
+    similaires = response.json()
+    assert [s["festival"]["nom_festival"] for s in similaires] == ["Jazz à Vincennes", "Jazz à Marseille"]
+    assert similaires[0]["score"] > similaires[1]["score"]
+
+    # Un festival supprimé depuis le calcul n'est plus proposé
+    client.delete(f"/festivals/{voisin.id_festival}")
+    response = client.get(f"/festivals/{jazz.id_festival}/similar")
+    assert [s["festival"]["nom_festival"] for s in response.json()] == ["Jazz à Marseille", "Théâtre à Paris"]
+    assert client.get("/festivals/999/similar").status_code == 404
@@ -0,0 +1,155 @@
+import threading
+import time
+
+import fastapi.routing
+import pytest
+from fastapi import FastAPI
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from festival_api.database.db_core import Base, get_db
+from festival_api.database.db_festivals import create_db_festival, FestivalCreate
+from festival_api import profilage
+from festival_api.profilage import activer_profilage, desactiver_profilage, EchantillonneurPile, MesuresRequete
+from festival_api.routers import festivals
+
+engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+FESTIVAL = {
+    "nom_festival": "Festival Profilé",
+    "annee_creation": 2001,
+    "site_internet": "http://profil.fr",
+    "adresse": {"adresse_postale": "1 rue", "code_insee": "75001", "region": "Île-de-France",
+                "departement": "Paris", "commune": "Paris", "longitude": 2.35, "latitude": 48.85},
+    "categorie": {"discipline_dominante": "Musique", "sous_categorie": "Jazz"},
+    "periode": {"periode": "Juillet", "categorie_periode": "Saison"},
+}
+
+
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@pytest.fixture(scope="module")
+def client():
+    """
+    Cette fonction est un fixture qui crée une application instrumentée avec le router des festivals.
+    """
+    app = FastAPI()
+    app.include_router(festivals.router)
+    activer_profilage(app, moteur=engine)
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    create_db_festival(FestivalCreate(**FESTIVAL), db)
+    db.close()
+    with TestClient(app) as c:
+        yield c
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_entetes_et_metriques(client):
+    """
+    Cette fonction est un test pour vérifier que les requêtes SQL sont comptées et exposées sur /metrics.
+    """
+    response = client.get("/festivals/1")
+    assert response.status_code == 200
+    assert int(response.headers["X-Requetes-SQL"]) >= 1
+
+    metriques = client.get("/metrics").text
+    assert 'festival_api_sql_requetes_count{methode="GET",route="/festivals/{festival_id}"} 1' in metriques
+    assert "festival_api_serialisation_duree_secondes_bucket" in metriques
+    assert 'festival_api_serialisation_duree_secondes_sum{methode="GET",route="/festivals/{festival_id}"} 0.0\n' not in metriques
+
+
+def test_mode_profile(client):
+    """
+    Cette fonction est un test pour vérifier que ?profile=1 renvoie un arbre d'appels.
+    """
+    response = client.get("/festivals/?profile=1")
+    assert response.status_code == 200
+    assert "échantillons" in response.text
+
+
+def test_profilage_sans_instrumentation_globale():
+    """
+    Cette fonction est un test pour vérifier que le profilage ne modifie ni FastAPI ni les routes existantes,
+    et que ses écouteurs du moteur peuvent être retirés.
+    """
+    serialisation = fastapi.routing.serialize_response
+    moteur = create_engine("sqlite://")
+    autre = FastAPI()
+    autre.include_router(festivals.router)
+    appels = [route.dependant.call for route in autre.routes if isinstance(route, APIRoute)]
+    activer_profilage(autre, moteur=moteur)
+    activer_profilage(autre, moteur=moteur)
+    assert fastapi.routing.serialize_response is serialisation
+    assert [route.dependant.call for route in autre.routes if isinstance(route, APIRoute)][:len(appels)] == appels
+    assert event.contains(moteur, "before_cursor_execute", profilage._avant_execution)
+    desactiver_profilage(moteur)
+    assert not event.contains(moteur, "before_cursor_execute", profilage._avant_execution)
+    assert not event.contains(moteur, "handle_error", profilage._erreur_execution)
+
+
+def test_instruction_en_erreur():
+    """
+    Cette fonction est un test pour vérifier qu'une instruction SQL en erreur est comptée et ne fausse pas les suivantes.
+    """
+    moteur = create_engine("sqlite://")
+    activer_profilage(FastAPI(), moteur=moteur)
+    mesures = MesuresRequete()
+    jeton = profilage._mesures_requete.set(mesures)
+    try:
+        with moteur.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql("SELECT * FROM table_absente")
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        profilage._mesures_requete.reset(jeton)
+        desactiver_profilage(moteur)
+    assert mesures.nb_sql == 2
+    assert mesures.requetes_sql["SELECT 1"] == 1
+
+
+def test_echantillonnage_du_seul_thread_de_la_requete():
+    """
+    Cette fonction est un test pour vérifier que l'échantillonneur ne relève que les threads suivis.
+    """
+    arret = threading.Event()
+
+    def occupe_ailleurs():
+        while not arret.is_set():
+            sum(range(1000))
+
+    autre = threading.Thread(target=occupe_ailleurs)
+    autre.start()
+    echantillonneur = EchantillonneurPile(threads={threading.get_ident()})
+    echantillonneur.demarrer()
+    fin = time.perf_counter() + 0.05
+    while time.perf_counter() < fin:
+        sum(range(1000))
+    echantillonneur.arreter()
+    arret.set()
+    autre.join()
+    arbre = echantillonneur.arbre()
+    assert "test_echantillonnage_du_seul_thread_de_la_requete" in arbre
+    assert "occupe_ailleurs" not in arbre
+
+
+def test_detection_n_plus_un():
+    """
+    Cette fonction est un test pour vérifier qu'une instruction répétée est signalée.
+    """
+    mesures = MesuresRequete()
+    mesures.requetes_sql["SELECT * FROM adresse WHERE id_adresse = ?"] = 6
+    mesures.requetes_sql["SELECT * FROM festival"] = 1
+    assert mesures.requetes_repetees(seuil=5) == {"SELECT * FROM adresse WHERE id_adresse = ?": 6}
@@ -0,0 +1,435 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RACINE = os.path.dirname(os.path.abspath(__file__))
+DOSSIER_ETAT = ".pipeline"
+DATASET_ID = "festivals-global-festivals-_-pl"
+
+
+class Etape:
+    """
+    Une étape du pipeline avec ses fichiers d'entrée et de sortie déclarés.
+
+    Une étape n'est relancée que si l'empreinte de ses entrées a changé depuis la
+    dernière exécution réussie ou si l'une de ses sorties a disparu ou a été modifiée.
+    Une étape sans entrées (la récupération depuis l'API) est toujours exécutée. Une étape
+    qui écrit hors de ses sorties déclarées (l'insertion, dans la base servie par l'API)
+    fournit un témoin : une fonction qui décrit l'état de cette cible, enregistré avec le
+    point de contrôle et comparé à chaque exécution.
+    """
+
+    def __init__(self, nom, fonction, entrees, sorties, dependances=(), temoin=None):
+        self.nom = nom
+        self.fonction = fonction
+        self.entrees = list(entrees)
+        self.sorties = list(sorties)
+        self.dependances = list(dependances)
+        self.temoin = temoin
+
+
+def chemin_base():
+    return os.getenv("DATABASE_PATH") or os.getenv("CHEMIN_BDD") or "festival_api/festival_france.db"
+
+
+def chemin_parquet():
+    return os.getenv("CHEMIN_PARQUET") or "data/clean_festival_data.parquet"
+
+
+def chemin_donnees_insertion():
+    """
+    Le fichier lu par l'insertion : les festivals sans doublons si FUSION_DOUBLONS vaut True,
+    sinon les festivals nettoyés.
+    """
+    if os.getenv("FUSION_DOUBLONS") == "True":
+        return "data/festival_data_dedoublonne.parquet"
+    return chemin_parquet()
+
+
+def chemin_valides():
+    return os.path.join(DOSSIER_ETAT, "valides.json.gz")
+
+
+def chemin_schema():
+    return os.path.join(DOSSIER_ETAT, "schema.db")
+
+
+def chemin_chargement():
+    # La base finale change aussi par l'API : le point de contrôle de l'insertion porte sur ce compte rendu
+    return os.path.join(DOSSIER_ETAT, "chargement.json")
+
+
+def identite_base():
+    """
+    Décrit la base finale pour le point de contrôle de l'insertion : son chemin, son fichier
+    (périphérique et inode) et la présence de festivals. Une base supprimée, remplacée par un
+    autre fichier ou vidée change ce témoin, et l'insertion est relancée ; les écritures de
+    l'API, elles, ne le changent pas.
+
+    Returns:
+        list: Le témoin de la base, ou None si elle n'existe pas.
+    """
+    chemin = chemin_base()
+    if not os.path.exists(chemin):
+        return None
+    infos = os.stat(chemin)
+    conn = sqlite3.connect(f"file:{os.path.abspath(chemin)}?mode=ro", uri=True)
+    try:
+        peuplee = conn.execute("SELECT EXISTS (SELECT 1 FROM festival)").fetchone()[0] == 1
+    except sqlite3.Error:
+        peuplee = False
+    finally:
+        conn.close()
+    return [os.path.abspath(chemin), infos.st_dev, infos.st_ino, peuplee]
+
+
+def etape_recuperation():
+    """
+    Récupère l'export brut des festivals (requête conditionnelle, instantané local).
+
+    Returns:
+        int: Le nombre d'enregistrements bruts.
+    """
+    from data import data_festival
+
+    donnees = data_festival.recuperer_donnees_api(DATASET_ID, data_festival.charger_variables_env())
+    if donnees is None:
+        raise RuntimeError("Aucune donnée récupérée et aucun instantané disponible.")
+    return len(donnees)
+
+
+def etape_communes():
+    """
+    Télécharge la table de référence des communes du géocodeur local (Code officiel géographique).
+
+    Returns:
+        int: Le nombre de communes de référence.
+    """
+    from data import data_festival
+
+    return len(data_festival.telecharger_reference_communes())
+
+
+def etape_validation():
+    """
+    Valide les enregistrements du dernier instantané avec le schéma JSON des festivals.
+
+    Les enregistrements invalides sont écrits avec leurs raisons dans le fichier de quarantaine,
+    les autres sont transmis au nettoyage. VALIDATION_PROCESSUS fixe le nombre de processus.
+
+    Returns:
+        int: Le nombre d'enregistrements valides.
+    """
+    from data import data_festival, validation
+
+    enregistrements = data_festival.charger_instantane(data_festival.lire_instantane(DATASET_ID))
+    valides, quarantaine = validation.valider_enregistrements(
+        enregistrements, nb_processus=int(os.getenv("VALIDATION_PROCESSUS", "1")))
+    validation.ecrire_quarantaine(quarantaine)
+    os.makedirs(DOSSIER_ETAT, exist_ok=True)
+    # Sans date dans l'en-tête gzip, les mêmes enregistrements donnent le même fichier et le nettoyage reste à jour
+    with gzip.GzipFile(chemin_valides() + ".tmp", "wb", compresslevel=1, mtime=0) as f:
+        f.write(json.dumps(valides, ensure_ascii=False).encode("utf-8"))
+    os.replace(chemin_valides() + ".tmp", chemin_valides())
+    return len(valides)
+
+
+def etape_nettoyage():
+    """
+    Nettoie et enrichit les enregistrements validés puis écrit les fichiers CSV et Parquet.
+
+    Returns:
+        int: Le nombre de festivals nettoyés.
+    """
+    import pandas as pd
+    from data import data_festival
+
+    with gzip.open(chemin_valides(), "rt", encoding="utf-8") as f:
+        df = pd.DataFrame(json.load(f))
+    df_nettoye = data_festival.nettoyer_donnees(data_festival.renommer_et_creer_colonnes(df),
+                                                repli_nominatim=os.getenv("REPLI_NOMINATIM") == "True")
+    data_festival.sauvegarder_en_csv(df_nettoye, "data/clean_festival_data.csv")
+    data_festival.sauvegarder_en_csv(df_nettoye, chemin_parquet())
+    return len(df_nettoye)
+
+
+def etape_deduplication():
+    """
+    Détecte les festivals en double (MinHash/LSH par code INSEE) et écrit le rapport de fusion,
+    ainsi que le fichier sans doublons si FUSION_DOUBLONS vaut True.
+
+    Returns:
+        int: Le nombre de festivals après fusion (ou nettoyés, sans fusion).
+    """
+    from data import deduplication
+
+    sortie = chemin_donnees_insertion()
+    return deduplication.dedoublonner(chemin_parquet(), None if sortie == chemin_parquet() else sortie)
+
+
+def etape_schema():
+    """
+    Vérifie le script du schéma sur une base vide, pour qu'une erreur SQL arrête le pipeline
+    avant l'insertion dans la base finale.
+
+    Returns:
+        int: Le nombre de tables créées.
+    """
+    os.makedirs(DOSSIER_ETAT, exist_ok=True)
+    if os.path.exists(chemin_schema()):
+        os.remove(chemin_schema())
+    conn = sqlite3.connect(chemin_schema())
+    with open("database_building/script_sqlite.sql", "r", encoding="utf-8") as f:
+        conn.executescript(f.read())
+    nb_tables = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table'").fetchone()[0]
+    conn.close()
+    return nb_tables
+
+
+def etape_insertion():
+    """
+    Charge les données nettoyées dans la base finale, en place, puis précalcule les festivals similaires.
+
+    La base n'est pas remplacée : les utilisateurs, les jetons, le journal des changements et les
+    festivals créés par l'API sont conservés, et une API en cours d'exécution lit les nouvelles
+    données dans le même fichier. Les festivals déjà présents ne sont pas réinsérés, ce qui rend
+    l'étape rejouable, et les insertions sont validées en une seule transaction.
+
+    Returns:
+        int: Le nombre de festivals insérés.
+    """
+    from database_building import insertion_data
+
+    conn = sqlite3.connect(chemin_base())
+    try:
+        lignes = insertion_data.charger(conn, chemin_donnees_insertion())
+    finally:
+        conn.close()
+    with open(chemin_chargement() + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"base": chemin_base(), "donnees": chemin_donnees_insertion(), "festivals_inseres": lignes}, f)
+    os.replace(chemin_chargement() + ".tmp", chemin_chargement())
+    return lignes
+
+
+def construire_etapes():
+    """
+    Déclare les étapes du pipeline. La création du schéma ne dépend pas des données
+    et s'exécute donc en parallèle de la récupération et du nettoyage.
+    """
+    return [
+        Etape("recuperation", etape_recuperation, [], [f"data/instantanes/{DATASET_ID}.json"]),
+        Etape("validation", etape_validation, [f"data/instantanes/{DATASET_ID}.json", "data/validation.py"],
+              [chemin_valides(), "data/quarantaine.jsonl"],
+              dependances=["recuperation"]),
+        # La référence des communes n'est téléchargée qu'une fois : l'étape est relancée si le fichier
+        # disparaît ou change, ou si le code qui la construit change
+        Etape("communes", etape_communes, ["data/data_festival.py"], ["data/reference_communes.csv"]),
+        Etape("nettoyage", etape_nettoyage,
+              [chemin_valides(), "data/data_festival.py", "data/reference_communes.csv",
+               "festival_api/database/periodes.py"],
+              ["data/clean_festival_data.csv", chemin_parquet()],
+              dependances=["validation", "communes"]),
+        Etape("deduplication", etape_deduplication, [chemin_parquet(), "data/deduplication.py"],
+              ["data/rapport_doublons.csv"]
+              + ([chemin_donnees_insertion()] if chemin_donnees_insertion() != chemin_parquet() else []),
+              dependances=["nettoyage"]),
+        Etape("schema", etape_schema, ["database_building/script_sqlite.sql"], [chemin_schema()]),
+        Etape("insertion", etape_insertion,
+              [chemin_donnees_insertion(), chemin_schema(), "database_building/insertion_data.py",
+               "database_building/script_festival_flat.sql", "database_building/reconstruction_festival_flat.sql",
+               "database_building/similarite.py", "database_building/script_similaire.sql",
+               "festival_api/database/migration.py", "festival_api/database/periodes.py"],
+              [chemin_chargement()],
+              dependances=["deduplication", "schema"], temoin=identite_base),
+    ]
+
+
+def empreinte_fichier(chemin):
+    """
+    Calcule l'empreinte SHA-256 d'un fichier, ou None s'il n'existe pas.
+    """
+    if not os.path.exists(chemin):
+        return None
+    h = hashlib.sha256()
+    with open(chemin, "rb") as f:
+        for bloc in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloc)
+    return h.hexdigest()
+
+
+def empreinte_entrees(etape):
+    """
+    Combine le nom de l'étape et l'empreinte de chacune de ses entrées.
+    """
+    h = hashlib.sha256(etape.nom.encode("utf-8"))
+    for chemin in sorted(etape.entrees):
+        h.update(f"{chemin}={empreinte_fichier(chemin)};".encode("utf-8"))
+    return h.hexdigest()
+
+
+def charger_etat():
+    chemin = os.path.join(DOSSIER_ETAT, "etat.json")
+    if not os.path.exists(chemin):
+        return {}
+    with open(chemin, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def sauvegarder_etat(etat):
+    os.makedirs(DOSSIER_ETAT, exist_ok=True)
+    chemin = os.path.join(DOSSIER_ETAT, "etat.json")
+    with open(chemin + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(etat, f, indent=2)
+    os.replace(chemin + ".tmp", chemin)
+
+
+def est_a_jour(etape, etat):
+    """
+    Indique si le point de contrôle de l'étape est toujours valide.
+    """
+    point = etat.get(etape.nom)
+    if not etape.entrees or point is None:
+        return False
+    if point["entrees"] != empreinte_entrees(etape):
+        return False
+    if etape.temoin is not None and point.get("temoin") != etape.temoin():
+        return False
+    return all(empreinte_fichier(chemin) == empreinte for chemin, empreinte in point["sorties"].items())
+
+
+def _executer_etape(nom):
+    """
+    Exécute une étape dans le processus courant et mesure sa durée et son pic mémoire.
+    Appelée dans un processus dédié, ce qui rend le pic mémoire propre à l'étape.
+    """
+    load_dotenv()
+    etape = next(e for e in construire_etapes() if e.nom == nom)
+    debut = time.perf_counter()
+    lignes = etape.fonction()
+    duree = time.perf_counter() - debut
+    memoire_mo = None
+    if resource is not None:
+        # ru_maxrss est en kilo-octets sous Linux
+        memoire_mo = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return {"lignes": lignes, "duree_s": round(duree, 3), "memoire_max_mo": memoire_mo}
+
+
+def executer_pipeline(etapes, forcer=False, max_processus=2):
+    """
+    Exécute les étapes dans l'ordre de leurs dépendances, en parallèle quand c'est possible.
+
+    Les étapes à jour sont ignorées. Après chaque étape réussie, l'empreinte de ses
+    entrées et de ses sorties est enregistrée dans .pipeline/etat.json. Si une étape
+    échoue, les étapes qui en dépendent ne sont pas lancées.
+
+    Args:
+        etapes (list[Etape]): Les étapes du pipeline.
+        forcer (bool): Relance toutes les étapes sans tenir compte des points de contrôle.
+        max_processus (int): Le nombre maximal d'étapes exécutées simultanément.
+
+    Returns:
+        dict: Le rapport par étape (statut, durée, lignes, pic mémoire).
+
+    Raises:
+        ValueError: Si une étape dépend d'une étape inconnue, ou si les dépendances forment un cycle.
+    """
+    etat = charger_etat()
+    par_nom = {etape.nom: etape for etape in etapes}
+    for etape in etapes:
+        inconnues = [dep for dep in etape.dependances if dep not in par_nom]
+        if inconnues:
+            raise ValueError(f"L'étape {etape.nom} dépend d'étapes inconnues : {', '.join(inconnues)}.")
+    rapport = {}
+    en_cours = {}
+
+    with ProcessPoolExecutor(max_workers=max_processus, max_tasks_per_child=1) as executeur:
+        while len(rapport) < len(etapes):
+            nb_terminees = len(rapport)
+            for etape in etapes:
+                if etape.nom in rapport or etape.nom in en_cours.values():
+                    continue
+                statuts = [rapport.get(dep, {}).get("statut") for dep in etape.dependances]
+                if any(statut == "échec" or statut == "annulée" for statut in statuts):
+                    rapport[etape.nom] = {"statut": "annulée"}
+                    continue
+                if not all(statut in ("exécutée", "ignorée") for statut in statuts):
+                    continue
+                if not forcer and est_a_jour(etape, etat):
+                    logging.info(f"Étape {etape.nom} à jour, ignorée.")
+                    rapport[etape.nom] = {"statut": "ignorée"}
+                    continue
+                logging.info(f"Lancement de l'étape {etape.nom}.")
+                en_cours[executeur.submit(_executer_etape, etape.nom)] = etape.nom
+
+            if not en_cours:
+                # Aucune étape lancée ni terminée pendant ce tour : les restantes s'attendent mutuellement
+                if len(rapport) == nb_terminees:
+                    bloquees = [etape.nom for etape in etapes if etape.nom not in rapport]
+                    raise ValueError(f"Dépendances circulaires entre les étapes : {', '.join(bloquees)}.")
+                continue
+            terminees, _ = wait(en_cours, return_when=FIRST_COMPLETED)
+            for future in terminees:
+                nom = en_cours.pop(future)
+                try:
+                    mesures = future.result()
+                except Exception as e:
+                    logging.error(f"Erreur lors de l'étape {nom} : {e}")
+                    rapport[nom] = {"statut": "échec", "erreur": str(e)}
+                    continue
+                etape = par_nom[nom]
+                etat[nom] = {
+                    "entrees": empreinte_entrees(etape),
+                    "sorties": {chemin: empreinte_fichier(chemin) for chemin in etape.sorties},
+                }
+                if etape.temoin is not None:
+                    etat[nom]["temoin"] = etape.temoin()
+                sauvegarder_etat(etat)
+                rapport[nom] = {"statut": "exécutée", **mesures}
+                logging.info(f"Étape {nom} terminée : {mesures}")
+
+    return {etape.nom: rapport[etape.nom] for etape in etapes}
+
+
+def afficher_rapport(rapport):
+    print(f"{'Étape':<14}{'Statut':<12}{'Durée (s)':>10}{'Lignes':>10}{'Mémoire (Mo)':>14}")
+    for nom, ligne in rapport.items():
+        print(f"{nom:<14}{ligne['statut']:<12}{str(ligne.get('duree_s', '-')):>10}"
+              f"{str(ligne.get('lignes', '-')):>10}{str(ligne.get('memoire_max_mo', '-')):>14}")
+
+
+def main():
+    """
+    Exécute le pipeline complet : récupération, validation, nettoyage, dédoublonnage, création du schéma
+    et insertion.
+
+    Options :
+        --forcer : relance toutes les étapes.
+    """
+    os.chdir(RACINE)
+    load_dotenv()
+    rapport = executer_pipeline(construire_etapes(), forcer="--forcer" in sys.argv)
+    os.makedirs(DOSSIER_ETAT, exist_ok=True)
+    with open(os.path.join(DOSSIER_ETAT, "rapport.json"), "w", encoding="utf-8") as f:
+        json.dump(rapport, f, indent=2, ensure_ascii=False)
+    afficher_rapport(rapport)
+    if any(ligne["statut"] in ("échec", "annulée") for ligne in rapport.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -41,3 +41,17 @@ WHERE (c.Discipline_Dominante, f.Annee_Creation) IN (
 ORDER BY f.Annee_Creation;
 
 
+
+-- Les mêmes lectures sur la table dénormalisée FESTIVAL_FLAT, sans jointure
+
+-- Requête 3 bis : festivals de musique qui se déroulent en été
+SELECT Nom_Festival, Periode, Sous_Categorie, Commune, Region
+FROM FESTIVAL_FLAT
+WHERE Discipline_Dominante = 'Musique'
+  AND Categorie_Periode = 'Saison'
+  AND (Periode LIKE '%Juillet%' OR Periode LIKE '%Août%');
+
+-- Requête 4 bis : festivals avec leurs coordonnées géographiques
+SELECT Nom_Festival, Latitude, Longitude
+FROM FESTIVAL_FLAT
+WHERE Latitude IS NOT NULL AND Longitude IS NOT NULL;